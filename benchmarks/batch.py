@@ -0,0 +1,59 @@
+"""Batched NumPy rule evaluation versus the scalar is_valid/get_stack_value.
+
+One decision is finding the legal cards of a hand on a face card, picking the
+greedy stack and working out its market and skip values. The scalar path
+is get_a_move; computer.batch finds the legal cards and the values for a
+whole batch of games in a few array operations, and builds each stack from
+its hand with stack_cards. Reports the time per decision for a range of
+batch sizes.
+
+    python -m benchmarks.batch
+"""
+import random
+
+import numpy as np
+
+from benchmarks.common import report, time_per_op
+from computer.batch import greedy_stacks, hand_masks, stack_cards, stack_values
+from computer.bot import get_a_move
+from game import shuffled_deck
+
+
+def positions(n: int, seed: int = 1) -> tuple:
+    rng = random.Random(seed)
+    faces, hands, markets = [], [], []
+    for _ in range(n):
+        deck = shuffled_deck(rng)
+        faces.append(deck[0])
+        hands.append(deck[1:1 + rng.randint(1, 10)])
+        markets.append(rng.choice((0, 0, 0, 2, 4)))
+    return faces, hands, markets
+
+
+def scalar(faces: list, hands: list, markets: list):
+    for face, hand, market in zip(faces, hands, markets):
+        get_a_move(face, list(hand), market)
+
+
+def batched(faces: np.ndarray, hands: list, markets: np.ndarray):
+    nums, legal = greedy_stacks(faces, hand_masks(hands))
+    stacks = [stack_cards(num, mask, hand) for hand, num, mask in zip(hands, nums.tolist(), legal.tolist())]
+    openers = np.array([stack[0] if stack else 0 for stack in stacks])
+    stack_values(openers, np.array([len(stack) for stack in stacks]), markets)
+
+
+def main(sizes=(1, 16, 256, 4096)):
+    rows = []
+    for size in sizes:
+        faces, hands, markets = positions(size)
+        number = max(1, 20000 // size)
+        scalar_us = time_per_op(lambda: scalar(faces, hands, markets), number=number) / size
+        face_array, market_array = np.array(faces), np.array(markets)
+        batch_us = time_per_op(lambda: batched(face_array, hands, market_array), number=number) / size
+        rows.append((f'{size:>5} games, get_a_move', scalar_us, None, None))
+        rows.append((f'{size:>5} games, computer.batch', batch_us, None, None))
+    report(rows, header='us/op is per decision: legal cards, greedy stack and stack value')
+
+
+if __name__ == '__main__':
+    main()
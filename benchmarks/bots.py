@@ -0,0 +1,143 @@
+"""AI player benchmark: threaded websocket bots versus in-process bot seats.
+
+``Bot`` runs every AI player on its own thread and event loop and plays over a
+loopback websocket to the server; ``BotSeat`` sits in the session and gets each
+state dict handed to it. Plays the same games both ways against a server on
+this process (uvicorn on a background thread for ``Bot``) and reports the
+threads and resident memory each bot costs and how long a bot takes to answer
+a state, from the broadcast to its move reaching the session, on top of the
+``BOT_DELAY`` both kinds wait before playing.
+
+    python -m benchmarks.bots
+"""
+import os
+
+PORT = 8766
+os.environ['BACKEND'] = f'ws://127.0.0.1:{PORT}'  # read by computer.bot on import
+
+import asyncio
+from contextlib import redirect_stdout
+import io
+import json
+import threading
+import time
+
+import uvicorn
+
+from benchmarks.common import report
+from computer.bot import BOT_DELAY, Bot, BotSeat
+from main import app, session_manager
+import utils
+from utils import Session, percentiles
+
+
+def rss_kib() -> int:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+class Probe:
+    """Times each move from the state broadcast that asked for it to its submit.
+
+    A threaded session is created by a host ``Bot``, which plays without the
+    delay, so with ``skip_host`` the first seat's moves are left out.
+    """
+
+    def __init__(self, skip_host: bool = False):
+        self.sent = {}
+        self.latency = []
+        broadcast_state, submit = Session.broadcast_state, Session.submit
+
+        async def timed_broadcast(session, full, delta=None, public=None, light=None):
+            self.sent[session.id] = time.perf_counter()
+            return await broadcast_state(session, full, delta, public, light)
+
+        def timed_submit(session, payload, sender=None, kind='move'):
+            state = session.state
+            if kind == 'move' and session.id in self.sent and not (
+                    skip_host and state.ids[state.turn] == session.clients[0].id):
+                self.latency.append(time.perf_counter() - self.sent[session.id] - BOT_DELAY)
+            return submit(session, payload, sender, kind)
+        Session.broadcast_state, Session.submit = timed_broadcast, timed_submit
+        self.restore = lambda: setattr(Session, 'broadcast_state', broadcast_state) or \
+            setattr(Session, 'submit', submit)
+
+
+def new_session(id: int, players: int) -> Session:
+    return Session(id=id, hostName='bench', numStartingCards=5, numPlayers=players,
+                   numAI=0, timeLimit=30, isPrivate=True, clients=[])
+
+
+async def wait_finished(sessions: list):
+    # polled, since the threaded run's sessions live on the server thread's loop
+    while not all(session.finished.is_set() for session in sessions):
+        await asyncio.sleep(0.05)
+
+
+async def run_seats(games: int, players: int) -> tuple:
+    threads, rss = threading.active_count(), rss_kib()
+    sessions = [new_session(1000 + g, players) for g in range(games)]
+    for session in sessions:
+        await session_manager.add_session(session)
+        for _ in range(players):
+            await BotSeat.create_bot(session)
+    await asyncio.sleep(0.1)
+    held = threading.active_count() - threads, rss_kib() - rss
+    await wait_finished(sessions)
+    for session in sessions:
+        for client in session.clients:
+            client.stop()
+        session_manager.delete_session(session.id)
+    return held
+
+
+async def run_threads(games: int, players: int) -> tuple:
+    server = uvicorn.Server(uvicorn.Config(app, port=PORT, log_level='warning'))
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_until_complete, args=(server.serve(),), daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.05)
+    threads, rss = threading.active_count(), rss_kib()
+
+    settings = json.dumps({'hostName': 'bench', 'numStartingCards': 5, 'numPlayers': players,
+                           'numAI': 0, 'timeLimit': 30, 'isPrivate': True})
+    ids = [2000 + g for g in range(games)]
+    bots = [Bot.create_bot(id, True, settings) for id in ids]
+    while any(id not in session_manager.ids for id in ids):
+        await asyncio.sleep(0.05)
+    sessions = [session_manager.ids[id] for id in ids]
+    bots += [Bot.create_bot(id, False) for id in ids for _ in range(players - 1)]
+    while any(session.status == 'waiting' for session in sessions):
+        await asyncio.sleep(0.05)
+    held = threading.active_count() - threads, rss_kib() - rss
+    await wait_finished(sessions)
+    for bot in bots:
+        bot.stop()
+    server.should_exit = True
+    thread.join()
+    return held
+
+
+def main(games: int = 20, players: int = 4):
+    utils.MOVE_PACING = 0
+    rows = []
+    for kind, run in (('Bot, thread', run_threads), ('BotSeat', run_seats)):
+        probe = Probe(skip_host=run is run_threads)
+        with redirect_stdout(io.StringIO()):  # sessions log every join and move
+            threads, rss = asyncio.run(run(games, players))
+        probe.restore()
+        bots = games * players
+        lag = percentiles(probe.latency)
+        rows.append((f'{bots} bots [{kind}] {threads / bots:4.2f} threads/bot, '
+                     f'answer p50 {lag["p50"]:6.2f} p99 {lag["p99"]:6.2f} ms',
+                     sum(probe.latency) / len(probe.latency) * 1e6, rss / bots, None))
+    report(rows, header=f'{games} games of {players} bots; us/op is the mean answer time beyond '
+                        f'the {BOT_DELAY}s bot delay, kept KiB is resident memory per bot')
+
+
+if __name__ == '__main__':
+    main()
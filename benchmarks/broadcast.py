@@ -0,0 +1,116 @@
+"""Broadcast fan-out benchmark with fake websockets.
+
+Every fake socket takes an exponentially distributed time per send, and one
+in ``slow_every`` sockets is ten times slower, so the old loop that awaited
+``send_json`` client by client can be compared with the encode-once
+``Session.broadcast_message`` feeding per-connection writer queues, at 4-8
+players plus spectators. A last run stalls one socket completely to show the
+others are unaffected while its state frames are coalesced.
+
+    python -m benchmarks.broadcast
+"""
+import asyncio
+import json
+import random
+import time
+
+import utils
+from utils import Connection, Session
+
+
+class FakeSocket:
+    def __init__(self, mean_delay: float):
+        self.mean_delay = mean_delay
+        self.sent = 0
+
+    async def send_text(self, text: str):
+        self.sent += len(text)
+        await asyncio.sleep(random.expovariate(1 / self.mean_delay))
+
+    async def send_json(self, data):
+        await self.send_text(json.dumps(data, separators=(',', ':'), ensure_ascii=False))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def legacy_broadcast(session: Session, message):
+    for client in session.clients:
+        await client.websocket.send_json(message)
+
+
+async def delivered(session: Session, count: int):
+    while any(client.sent < count for client in session.clients if not client.closed):
+        await asyncio.sleep(0)
+
+
+def make_session(players: int, spectators: int, mean_delay: float, slow_every: int) -> Session:
+    session = Session(id=1, hostName='host', numStartingCards=5, numPlayers=players + spectators,
+                      numAI=0, timeLimit=30, isPrivate=False, clients=[])
+    for i in range(players + spectators):
+        delay = mean_delay * (10 if i % slow_every == slow_every - 1 else 1)
+        session.clients.append(Connection(FakeSocket(delay), str(i), f'player{i}',
+                                          session.broadcast_latency))
+    return session
+
+
+def percentiles(samples: list) -> str:
+    samples = sorted(samples)
+
+    def at(q: float) -> float:
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return f'p50 {at(0.5):7.2f} ms   p99 {at(0.99):7.2f} ms'
+
+
+async def run(players: int, spectators: int, rounds: int = 200,
+              mean_delay: float = 0.0005, slow_every: int = 6):
+    session = make_session(players, spectators, mean_delay, slow_every)
+    message = {
+        'player_cards': [{'id': c.id, 'name': c.name, 'hand': [{'shape': 'circle', 'num': 7}] * 6}
+                         for c in session.clients[:players]],
+        'face_card': {'shape': 'star', 'num': 4},
+        'turn': '0', 'market': 0, 'winner': '', 'turns_played': 12,
+    }
+    legacy = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await legacy_broadcast(session, message)
+        legacy.append(time.perf_counter() - start)
+    queued = []
+    for n in range(1, rounds + 1):
+        start = time.perf_counter()
+        await session.broadcast_message(message, state=True)
+        await delivered(session, n)
+        queued.append(time.perf_counter() - start)
+    label = f'{players} players + {spectators} spectators'
+    print(f'{label:<28} sequential  {percentiles(legacy)}')
+    print(f'{"":<28} queued      {percentiles(queued)}')
+    for client in session.clients:
+        client.stop()
+
+
+async def stalled(players: int = 8, rounds: int = 200, mean_delay: float = 0.0005):
+    utils.SEND_TIMEOUT = 1.0
+    session = make_session(players, 0, mean_delay, slow_every=players + 1)
+    session.clients[-1].websocket.mean_delay = 3600
+    for n in range(rounds):
+        await session.broadcast_message({'turn': str(n % players), 'turns_played': n}, state=True)
+        await asyncio.sleep(mean_delay * 4)
+    print(f'{players} players, one stalled: per-frame {percentiles(list(session.broadcast_latency))}')
+    print('  stalled connection:', session.clients[-1].stats())
+    await asyncio.sleep(utils.SEND_TIMEOUT)
+    print('  after SEND_TIMEOUT:', session.clients[-1].stats())
+    for client in session.clients:
+        client.stop()
+
+
+async def main():
+    random.seed(3)
+    for players in (4, 8):
+        for spectators in (0, 8):
+            await run(players, spectators)
+    await stalled()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
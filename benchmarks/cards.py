@@ -0,0 +1,127 @@
+"""Before/after benchmark for the int card model.
+
+The ``legacy_*`` functions are the pydantic/dict implementations the game ran on
+before cards became ints; they are kept here only as the baseline.
+"""
+import random
+
+from pydantic import BaseModel
+
+from benchmarks.common import allocations_per_op, report, time_per_op
+from computer.bot import get_a_move
+from game import (CARD_NUM, Whot, card_to_dict, deck_dict, get_stack_value,
+                  is_valid)
+
+
+class Card(BaseModel):
+    shape: str
+    num: int
+
+    def __getitem__(self, val):
+        return self.__dict__.get(val, None)
+
+
+def legacy_create_starting_deck():
+    cards = []
+    for shape, nums in deck_dict.items():
+        cards += [Card(shape=shape, num=num) for num in nums]
+    random.shuffle(cards)
+    return cards
+
+
+def legacy_rank_players(players):
+    data = []
+    for player in players:
+        total = 0
+        for card in player['hand']:
+            total += dict(card)['num']
+        data.append([total, player['name']])
+    return sorted(data, key=lambda x: x[0])
+
+
+def legacy_is_valid(face_card, to_play, has_played):
+    if to_play['shape'] == 20:
+        return True
+    if has_played:
+        return to_play['num'] == face_card['num']
+    if to_play['shape'] == face_card['shape'] or to_play['num'] == face_card['num']:
+        return True
+    if face_card['num'] in (1, 2, 5, 8, 14):
+        return to_play['num'] == face_card['num']
+    return False
+
+
+def legacy_get_stack_value(stack, market):
+    value = 0
+    turns_to_skip = 1
+    card = stack[0] if len(stack) > 0 else None
+    if card:
+        if card['num'] == 2:
+            value = 2 * len(stack)
+        elif card['num'] == 5:
+            value = 3 * len(stack)
+        elif card['num'] == 14:
+            value = 0 if len(stack) == 1 else len(stack)
+        elif card['num'] == 8:
+            turns_to_skip = len(stack)
+    return {
+        'market': market + value,
+        'turns_to_skip': 2 if turns_to_skip == 1 else turns_to_skip + 1,
+        'failed_defense': len(stack) == 0 and market > 0,
+    }
+
+
+def legacy_get_a_move(face_card, hand_cards, market):
+    stack = []
+    for card in sorted(hand_cards, key=lambda x: x['num']):
+        if legacy_is_valid(face_card if len(stack) == 0 else stack[-1], card, len(stack) > 0):
+            stack.append(card)
+            hand_cards.remove(card)
+    return legacy_get_stack_value(stack, market), hand_cards, stack
+
+
+def main(num_players: int = 4, hand_size: int = 7):
+    random.seed(7)
+    whot = Whot([])
+    hands = whot.distribute_cards(num_players, hand_size)
+    face = whot.get_starting_card()
+    players = [{'id': i, 'name': f'p{i}', 'hand': hand} for i, hand in enumerate(hands)]
+
+    legacy_players = [
+        {'id': p['id'], 'name': p['name'], 'hand': [Card(**card_to_dict(c)) for c in p['hand']]}
+        for p in players
+    ]
+    legacy_face = Card(**card_to_dict(face))
+
+    def legacy_move():
+        legacy_get_a_move(legacy_face, list(legacy_players[0]['hand']), 0)
+        return legacy_rank_players(legacy_players)
+
+    def int_move():
+        get_a_move(face, list(players[0]['hand']), 0)
+        return whot.rank_players(players)
+
+    cases = [
+        ('create_starting_deck', legacy_create_starting_deck, whot.create_starting_deck),
+        ('rank_players', lambda: legacy_rank_players(legacy_players), lambda: whot.rank_players(players)),
+        ('is_valid x hand',
+         lambda: [legacy_is_valid(legacy_face, c, False) for c in legacy_players[0]['hand']],
+         lambda: [is_valid(face, c, False) for c in players[0]['hand']]),
+        ('get_stack_value', lambda: legacy_get_stack_value(legacy_players[1]['hand'][:2], 0),
+         lambda: get_stack_value(players[1]['hand'][:2], 0)),
+        ('get_a_move', lambda: legacy_get_a_move(legacy_face, list(legacy_players[0]['hand']), 0),
+         lambda: get_a_move(face, list(players[0]['hand']), 0)),
+        ('move (get_a_move + rank_players)', legacy_move, int_move),
+    ]
+
+    rows = []
+    for name, before, after in cases:
+        number = 2000 if name == 'create_starting_deck' else 20000
+        for label, fn in (('pydantic', before), ('int', after)):
+            rows.append((f'{name} [{label}]', time_per_op(fn, number), *allocations_per_op(fn)))
+    report(rows, header=f'{num_players} players, {hand_size} cards each, '
+                        f'{len(CARD_NUM)}-card deck')
+
+
+if __name__ == '__main__':
+    main()
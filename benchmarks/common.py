@@ -0,0 +1,48 @@
+"""Small timing helpers shared by the benchmark scripts.
+
+Run any benchmark from the repository root, e.g. ``python -m benchmarks.cards``.
+"""
+import gc
+import timeit
+import tracemalloc
+
+
+def time_per_op(fn, number: int = 10000, repeat: int = 5) -> float:
+    """Best-of-``repeat`` wall time of ``fn()`` in microseconds."""
+    timer = timeit.Timer(fn)
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def allocations_per_op(fn, number: int = 1000) -> tuple[float, float]:
+    """Returns (retained KiB, transient peak KiB) per call of ``fn()``.
+
+    Results are kept alive while measuring so the retained figure covers the
+    objects a call hands back (decks, hands, rankings).
+    """
+    fn()
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    kept = [fn() for _ in range(number)]
+    retained, _ = tracemalloc.get_traced_memory()
+    peak = 0
+    for _ in range(min(number, 100)):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, top = tracemalloc.get_traced_memory()
+        peak = max(peak, top - base)
+    tracemalloc.stop()
+    del kept
+    return (retained - start) / number / 1024, peak / 1024
+
+
+def report(rows: list[tuple[str, float, float, float]], header: str = ''):
+    """Prints ``(name, us/op, retained KiB/op, peak KiB)`` rows as a table."""
+    if header:
+        print(header)
+    print(f"{'benchmark':<44}{'us/op':>10}{'kept KiB':>10}{'peak KiB':>10}")
+    for name, us, kept, peak in rows:
+        kept = '-' if kept is None else f'{kept:.2f}'
+        peak = '-' if peak is None else f'{peak:.2f}'
+        print(f"{name:<44}{us:>10.2f}{kept:>10}{peak:>10}")
@@ -0,0 +1,58 @@
+"""Draw pile and deck pool benchmark.
+
+Compares the old ``list.pop(0)`` draw loop against ``DrawPile.draw`` for the
+market sizes a General Market or stacked Pick Two/Three produces, then plays
+a burst of draws through the shared ``deck_pool`` and prints its hit rate.
+"""
+import time
+
+from benchmarks.common import report, time_per_op
+from game import ACTIONS, CARD_NUM, DeckPool, DrawPile, shuffled_deck
+
+
+class LegacyPile:
+    def __init__(self):
+        self.deck = shuffled_deck()
+
+    def draw(self, n: int, no_action: bool = False):
+        hand = []
+        while True:
+            if n >= len(self.deck):
+                self.deck = shuffled_deck()
+            if len(hand) == n:
+                break
+            card = self.deck.pop(0)
+            if no_action and CARD_NUM[card] in ACTIONS:
+                self.deck.append(card)
+                continue
+            hand.append(card)
+        return hand
+
+
+def main(draws: int = 20000):
+    rows = []
+    for n in (1, 2, 3, 6):
+        legacy = LegacyPile()
+        pile = DrawPile()
+        pooled = DrawPile(DeckPool(size=64))
+        pooled.pool.start()
+        time.sleep(0.2)
+        rows.append((f'draw {n} [list.pop(0)]', time_per_op(lambda: legacy.draw(n), draws), None, None))
+        rows.append((f'draw {n} [DrawPile]', time_per_op(lambda: pile.draw(n), draws), None, None))
+        rows.append((f'draw {n} [DrawPile + pool]', time_per_op(lambda: pooled.draw(n), draws), None, None))
+    report(rows)
+
+    for label, pause in (('back-to-back', 0), ('one per 1ms', 0.001)):
+        pool = DeckPool(size=64)
+        pool.start()
+        time.sleep(0.2)
+        pile = DrawPile(pool)
+        for _ in range(2000):
+            pile.draw(3)
+            if pause:
+                time.sleep(pause)
+        print(f'pool, 2000 draws of 3 {label}:', pool.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Cost of the session journal per Session.process_game_move, and how fast a journal replays.
+
+Plays the suite's seeded greedy games with fake sockets with journaling off,
+on, and off again, so the two unjournaled runs show the noise the comparison
+has to beat. The journaled run writes to a temporary directory with the
+writer thread fsyncing every JOURNAL_FSYNC seconds, as the server does.
+
+Replay plays many games to a fresh journal, once with no snapshot after the
+deal and once snapshotted near the end, and times SessionsManager.recover
+rebuilding every session from it.
+
+    python -m benchmarks.journal
+"""
+import asyncio
+from contextlib import redirect_stdout
+import io
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import report
+from benchmarks.suite import REPEAT, NullSocket
+from computer.bot import BotSeat, get_a_move
+from game import cards_to_dicts
+from journal import Journal
+import utils
+from utils import Session, SessionsManager, encode
+
+
+def reset(manager: SessionsManager):
+    for session in manager.ids.values():
+        session.stop_actor()
+    manager.ids.clear()
+    manager.lobby.clear()
+    manager.lobby_changes.clear()
+    SessionsManager.journal = None
+
+
+async def journaled_moves(players: int, moves: int, seed: int, directory: str = '') -> float:
+    """Microseconds per Session.process_game_move, journaled to ``directory`` unless it is empty."""
+    utils.MOVE_PACING = 0
+    manager = SessionsManager()
+    reset(manager)
+    journal = None
+    if directory:
+        journal = Journal(directory)
+        await manager.recover(journal, BotSeat)
+    random.seed(seed)
+    elapsed = 0.0
+    done = 0
+    game = 0
+    while done < moves:
+        session = Session(id=game, hostName='host', numStartingCards=5, numPlayers=players,
+                          numAI=0, timeLimit=0, isPrivate=True, clients=[])
+        await manager.add_session(session)
+        for i in range(players):
+            await session.add_client(NullSocket(), f'p{i}', f'player{i}')
+        await session.start_game()
+        while not session.finished.is_set() and done < moves:
+            state = session.state
+            _, _, stack = get_a_move(state.face_card, list(state.hands[state.turn]), state.market)
+            move = encode({'stack': cards_to_dicts(stack), 'turn': state.ids[state.turn],
+                           'seq': session.turns_played})
+            start = time.perf_counter()
+            await session.process_game_move(move)
+            elapsed += time.perf_counter() - start
+            done += 1
+            await asyncio.sleep(0)  # lets the writers drain
+        for client in session.clients:
+            client.stop()
+        manager.delete_session(session.id)
+        game += 1
+    if journal is not None:
+        journal.close()
+    reset(manager)
+    return elapsed / moves * 1e6
+
+
+async def record_games(directory: str, sessions: int, moves: int, snapshot_at: int = 0) -> int:
+    """
+    Plays ``sessions`` 4 player games of ``moves`` moves each, round robin,
+    into a journal that is then left as a crash would leave it.
+
+    Returns the number of moves journaled.
+    """
+    utils.MOVE_PACING = 0
+    manager = SessionsManager()
+    reset(manager)
+    journal = Journal(directory, snapshot_records=1 << 30)
+    await manager.recover(journal, BotSeat)
+    random.seed(1)
+    games = []
+    for id in range(sessions):
+        session = Session(id=id, hostName='host', numStartingCards=5, numPlayers=4,
+                          numAI=0, timeLimit=0, isPrivate=True, clients=[])
+        await manager.add_session(session)
+        for i in range(4):
+            await session.add_client(NullSocket(), f'p{i}', f'player{i}')
+        await session.start_game()
+        games.append(session)
+    played = 0
+    for step in range(moves):
+        if step == snapshot_at and snapshot_at:
+            journal.snapshot()
+        for session in games:
+            if session.finished.is_set():
+                continue
+            state = session.state
+            _, _, stack = get_a_move(state.face_card, list(state.hands[state.turn]), state.market)
+            await session.process_game_move(encode({'stack': cards_to_dicts(stack), 'turn': state.ids[state.turn],
+                                                    'seq': session.turns_played}))
+            played += 1
+        await asyncio.sleep(0)
+    journal.close()
+    for session in games:
+        for client in session.clients:
+            client.stop()
+    reset(manager)
+    return played
+
+
+async def replay(directory: str) -> tuple[float, int]:
+    """Seconds SessionsManager.recover takes to rebuild the journal's sessions, and how many it rebuilt."""
+    manager = SessionsManager()
+    reset(manager)
+    journal = Journal(directory)
+    start = time.perf_counter()
+    recovered = await manager.recover(journal, BotSeat)
+    elapsed = time.perf_counter() - start
+    journal.close()
+    for session in manager.ids.values():
+        session.held.clear()
+    reset(manager)
+    return elapsed, recovered
+
+
+def size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+async def best(players: int, moves: int, directory: str = '') -> float:
+    return min([await journaled_moves(players, moves, seed=1, directory=directory) for _ in range(REPEAT)])
+
+
+def main():
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(io.StringIO()):
+        for players in (2, 4, 8):
+            off = asyncio.run(best(players, 2000))
+            on = asyncio.run(best(players, 2000, os.path.join(tmp, f'moves-{players}')))
+            again = asyncio.run(best(players, 2000))
+            rows.append((f'{players} players, journal off', off, None, None))
+            rows.append((f'{players} players, journal on ({on / off - 1:+.0%})', on, None, None))
+            rows.append((f'{players} players, journal off again ({again / off - 1:+.1%})', again, None, None))
+        for label, snapshot_at in (('from the deal', 0), ('from a snapshot', 35)):
+            directory = os.path.join(tmp, f'replay-{snapshot_at}')
+            moves = asyncio.run(record_games(directory, 1000, 40, snapshot_at))
+            journaled = size(directory)
+            seconds, sessions = asyncio.run(replay(directory))
+            rows.append((f'replay {label}: {sessions} sessions, {moves} moves, {journaled >> 10} KiB',
+                         seconds / moves * 1e6, None, None))
+    report(rows, header='us/op is per Session.process_game_move (MOVE_PACING 0), or per journaled move replayed')
+
+
+if __name__ == '__main__':
+    main()
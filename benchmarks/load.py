@@ -0,0 +1,299 @@
+"""Websocket load test: many simulated players against a local server, from one event loop.
+
+Starts ``main.app`` under uvicorn in a child process, then plays whole games
+against it in stages of increasing concurrency. Every session is hosted over
+``/ws/create`` and filled over ``/ws/join`` like a real one, and every player
+picks its moves with ``Bot.process``, but all the players of all the sessions
+share this process's single event loop instead of a thread and loop each.
+
+Each stage reports:
+
+- turn round trip: from sending a move to receiving the state it produced,
+  the server's MOVE_PACING (``--pacing``) included;
+- broadcast spread: from the first to the last player of a session
+  receiving the same state;
+- games finished per second;
+- server memory per session, from its resident memory with every session
+  of the stage live;
+- event loop lag, the server's and this process's, from a task that
+  expects to wake every LAG_INTERVAL seconds.
+
+With ``--workers N`` the server runs as router.py does it: N workers on
+Unix sockets behind the router, which every player connects through. Memory
+and live sessions are then summed over the workers, and the server lag is
+the worst worker's.
+
+    python -m benchmarks.load
+    python -m benchmarks.load --stages 100,500,1000 --players 4 --pacing 0.25
+    python -m benchmarks.load --workers 4
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+import websockets
+
+from computer.bot import Bot
+from utils import percentiles
+
+HOST = '127.0.0.1'
+LAG_INTERVAL = 0.05  # seconds between the lag probe's wake-ups
+
+
+def rss_kib() -> int:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+class LagProbe:
+    """Samples how late the event loop runs a task that sleeps LAG_INTERVAL at a time."""
+
+    def __init__(self):
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.samples.append(max(0.0, loop.time() - start - LAG_INTERVAL))
+
+    def take(self) -> dict:
+        samples, self.samples = self.samples, []
+        return percentiles(samples)
+
+
+def bench_app(pacing: float, quiet: bool):
+    """main.app with MOVE_PACING set to ``pacing`` and a /bench/stats route for the harness."""
+    if quiet:  # sessions print every join, move and game over
+        sys.stdout = open(os.devnull, 'w')
+    import utils
+    from main import app, session_manager
+
+    utils.MOVE_PACING = pacing
+    lag = LagProbe()
+
+    @app.get('/bench/stats')
+    async def bench_stats(reset: bool = False):
+        if lag._task is None:  # the harness asks before its first stage
+            lag.start()
+        stats = {'rss_kib': rss_kib(), 'sessions': len(session_manager.ids), 'lag': percentiles(lag.samples)}
+        if reset:
+            lag.samples = []
+        return stats
+
+    return app
+
+
+def serve(port: int, pacing: float, quiet: bool = True):
+    """The child process: bench_app under uvicorn."""
+    import uvicorn
+    uvicorn.run(bench_app(pacing, quiet), host=HOST, port=port, log_level='warning')
+
+
+def serve_shard(shard: int, workers: int, socket_dir: str, pacing: float, quiet: bool):
+    """A worker of serve_cluster: bench_app as one shard, on the shard's Unix socket."""
+    import uvicorn
+    from sharding import shards
+    shards.configure(workers, shard, socket_dir)
+    uvicorn.run(bench_app(pacing, quiet), uds=shards.socket(shard), log_level='warning')
+
+
+def serve_cluster(port: int, pacing: float, quiet: bool, workers: int, socket_dir: str):
+    """The child process: ``workers`` serve_shard processes behind router.app."""
+    import uvicorn
+    import router
+    router.shards.configure(workers, 0, socket_dir)
+    context = multiprocessing.get_context('spawn')
+    shards = [context.Process(target=serve_shard, args=(shard, workers, socket_dir, pacing, quiet))
+              for shard in range(workers)]
+    for shard in shards:
+        shard.start()
+    router.exit_on_sigterm()
+    try:
+        uvicorn.run(router.app, host=HOST, port=port, log_level='warning')
+    finally:
+        router.stop_workers(shards)
+
+
+async def fetch_stats(connect, reset: bool) -> dict:
+    reader, writer = await connect()
+    query = '?reset=true' if reset else ''
+    writer.write(f'GET /bench/stats{query} HTTP/1.1\r\nHost: {HOST}\r\nConnection: close\r\n\r\n'.encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b'\r\n\r\n', 1)[1])
+
+
+async def server_stats(port: int, sockets: list, reset: bool = False) -> dict:
+    """The server's memory, live sessions and loop lag since the last reset, over every worker if sharded."""
+    if not sockets:
+        return await fetch_stats(lambda: asyncio.open_connection(HOST, port), reset)
+    stats = [await fetch_stats(lambda: asyncio.open_unix_connection(path), reset) for path in sockets]
+    return {'rss_kib': sum(s['rss_kib'] for s in stats), 'sessions': sum(s['sessions'] for s in stats),
+            'lag': max((s['lag'] for s in stats), key=lambda lag: lag.get('p99', 0))}
+
+
+async def wait_listening(port: int = 0, path: str = '', timeout: float = 30.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            if path:
+                _, writer = await asyncio.open_unix_connection(path)
+            else:
+                _, writer = await asyncio.open_connection(HOST, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+class Stage:
+    """What the players of one stage measured."""
+
+    def __init__(self):
+        self.round_trips = []
+        self.received = defaultdict(list)  # (session, turns_played) -> receive times
+        self.finished = 0
+        self.failed = 0
+
+
+async def player(url: str, id: str, session_id: int, stage: Stage, joined: asyncio.Event = None):
+    bot = Bot(False)
+    sent_at = None
+    try:
+        async with websockets.connect(url, max_queue=None) as websocket:
+            async for text in websocket:
+                now = time.perf_counter()
+                message = json.loads(text)
+                if joined is not None:
+                    joined.set()
+                if 'turn' not in message:
+                    continue
+                if sent_at is not None:
+                    stage.round_trips.append(now - sent_at)
+                    sent_at = None
+                stage.received[(session_id, message.get('turns_played', 0))].append(now)
+                if message.get('winner'):
+                    stage.finished += 1
+                    break
+                data = bot.process(message, id)
+                if data:
+                    sent_at = time.perf_counter()
+                    await websocket.send(json.dumps(data))
+    except (OSError, websockets.exceptions.WebSocketException):
+        stage.failed += 1
+
+
+async def game(port: int, session_id: int, players: int, stage: Stage):
+    settings = json.dumps({'hostName': f'host{session_id}', 'numStartingCards': 5,
+                           'numPlayers': players, 'numAI': 0, 'timeLimit': 30, 'isPrivate': True},
+                          separators=(',', ':'))
+    base = f'ws://{HOST}:{port}'
+    host_id = f'{session_id}h'
+    joined = asyncio.Event()
+    host = asyncio.ensure_future(player(f'{base}/ws/create/{host_id}?id={session_id}&settings={quote(settings)}',
+                                        host_id, session_id, stage, joined))
+    await asyncio.wait({host, asyncio.ensure_future(joined.wait())}, return_when=asyncio.FIRST_COMPLETED)
+    guests = [player(f'{base}/ws/join/{session_id}?client_id={session_id}g{seat}&display_name=guest{seat}',
+                     f'{session_id}g{seat}', session_id, stage) for seat in range(1, players)]
+    await asyncio.gather(host, *guests)
+
+
+async def run_stage(port: int, sessions: int, players: int, first_id: int, sockets: list) -> dict:
+    stage = Stage()
+    lag = LagProbe()
+    lag.start()
+    before = await server_stats(port, sockets, reset=True)
+    start = time.perf_counter()
+    games = [asyncio.ensure_future(game(port, first_id + n, players, stage)) for n in range(sessions)]
+    peak = before
+    while not all(g.done() for g in games):
+        await asyncio.sleep(0.5)
+        stats = await server_stats(port, sockets)
+        if stats['sessions'] >= peak['sessions']:
+            peak = stats
+    elapsed = time.perf_counter() - start
+    server = await server_stats(port, sockets)
+    lag._task.cancel()
+    spread = [max(times) - min(times) for times in stage.received.values() if len(times) > 1]
+    live = max(1, peak['sessions'] - before['sessions'])
+    return {
+        'sessions': sessions,
+        'players': sessions * players,
+        'finished': stage.finished // players,
+        'failed_connections': stage.failed,
+        'round_trip_ms': percentiles(stage.round_trips),
+        'broadcast_spread_ms': percentiles(spread),
+        'games_per_s': round(stage.finished / players / elapsed, 2),
+        'server_kib_per_session': round((peak['rss_kib'] - before['rss_kib']) / live, 1),
+        'server_lag_ms': server['lag'],
+        'client_lag_ms': lag.take(),
+    }
+
+
+async def load(port: int, stages: list, players: int, sockets: list) -> list:
+    await wait_listening(port)
+    for path in sockets:
+        await wait_listening(path=path)
+    results = []
+    first_id = 0
+    for sessions in stages:
+        result = await run_stage(port, sessions, players, first_id, sockets)
+        first_id += sessions
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stages', default='10,50,200', help='concurrent sessions per stage')
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--pacing', type=float, default=0.05, help="the server's MOVE_PACING, in seconds")
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--out', help='save the stage results to this JSON file')
+    parser.add_argument('--server-log', action='store_true', help="show the server's output")
+    parser.add_argument('--workers', type=int, default=0, help='run the server sharded over this many workers')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    sockets = []
+    if args.workers:
+        socket_dir = tempfile.mkdtemp(prefix='whot-load-')
+        from sharding import ShardMap
+        sockets = [ShardMap(args.workers, 0, socket_dir).socket(shard) for shard in range(args.workers)]
+        server = context.Process(target=serve_cluster, args=(args.port, args.pacing, not args.server_log,
+                                                              args.workers, socket_dir))
+    else:
+        server = context.Process(target=serve, args=(args.port, args.pacing, not args.server_log), daemon=True)
+    server.start()
+    try:
+        results = asyncio.run(load(args.port, [int(n) for n in args.stages.split(',')], args.players, sockets))
+    finally:
+        server.terminate()
+        server.join()
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'players': args.players, 'pacing': args.pacing, 'stages': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Lobby feed benchmark: per-watcher polling versus the pushed, shared pages.
+
+The old ``/ws/games/`` handler rebuilt and serialized the session list for
+every watcher once a second; ``SessionsManager.publish_lobby`` encodes each
+distinct page once per batch of changes and only queues it on watchers whose
+page changed. Fake websockets discard frames without sending them.
+
+    python -m benchmarks.lobby
+"""
+import asyncio
+from contextlib import redirect_stdout
+import io
+import json
+import time
+
+from benchmarks.common import report
+from utils import LobbyQuery, Session, SessionsManager
+
+
+class NullSocket:
+    async def send_text(self, text: str):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def legacy_tick(manager: SessionsManager, watchers: int):
+    for _ in range(watchers):
+        games = []
+        for id in manager.ids:
+            session = manager[id]
+            if session.isPrivate or session.status == "finished" or len(session.clients) == 0:
+                continue
+            games.append({
+                'id': id,
+                'private': session.isPrivate,
+                'host': session.hostName,
+                'status': session.status,
+                'max_players': session.numPlayers,
+                'num_players': len(session.clients),
+            })
+        json.dumps({'games': games})
+
+
+async def run(sessions: int, watchers: int, queries: int) -> list:
+    manager = SessionsManager()
+    manager.ids.clear()
+    manager.lobby.clear()
+    for i in range(sessions):
+        session = Session(id=i, hostName=f'host{i}', numStartingCards=5, numPlayers=2 + i % 7,
+                          numAI=0, timeLimit=30, isPrivate=i % 5 == 0, clients=[])
+        await manager.add_session(session)
+        await session.add_client(NullSocket(), f'c{i}', f'n{i}')
+    pages = [LobbyQuery(offset=20 * (q // 2), limit=20, min_free_seats=q % 2) for q in range(queries)]
+    lobby = [manager.watch_lobby(NullSocket(), pages[w % queries]) for w in range(watchers)]
+    await asyncio.sleep(0.1)
+
+    start = time.perf_counter()
+    legacy_tick(manager, watchers)
+    legacy = time.perf_counter() - start
+
+    changes = 50
+    start = time.perf_counter()
+    for n in range(changes):
+        session = manager[1 + n % (sessions - 1)]
+        await session.add_client(NullSocket(), f'x{n}', f'x{n}')
+        manager.publish_lobby()
+    pushed = (time.perf_counter() - start) / changes
+
+    for watcher in lobby:
+        manager.unwatch_lobby(watcher)
+    for session in list(manager.ids.values()):
+        for client in session.clients:
+            client.stop()
+    return [(f'{sessions} sessions x {watchers} watchers [poll]', legacy * 1e6, None, None),
+            (f'{sessions} sessions x {watchers} watchers [push]', pushed * 1e6, None, None)]
+
+
+def main():
+    rows = []
+    for sessions, watchers in ((100, 100), (1000, 1000), (1000, 5000)):
+        with redirect_stdout(io.StringIO()):  # Session.add_client logs every join
+            rows += asyncio.run(run(sessions, watchers, queries=8))
+    report(rows, header='poll: one tick of every watcher; push: one change, 8 distinct pages of 20')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Cost of the /metrics instrumentation per Session.process_game_move.
+
+Plays the suite's seeded greedy games with fake sockets, once with the
+metrics recording and once with ``metrics.Metric.enabled`` off, alternating
+the two so both see the same machine state. Disabled updates still read the
+clock around the engine and broadcasts, so the figure slightly understates
+the full cost of the instrumentation; those reads take tens of nanoseconds.
+
+    python -m benchmarks.metrics
+"""
+import asyncio
+from contextlib import redirect_stdout
+import io
+
+from benchmarks.common import report
+from benchmarks.suite import REPEAT, session_moves
+import metrics
+
+
+async def compare(players: int, moves: int) -> tuple:
+    on = off = float('inf')
+    for _ in range(REPEAT):
+        metrics.Metric.enabled = False
+        off = min(off, await session_moves(players, moves, seed=1))
+        metrics.Metric.enabled = True
+        on = min(on, await session_moves(players, moves, seed=1))
+    return off, on
+
+
+def main():
+    rows = []
+    with redirect_stdout(io.StringIO()):  # sessions log every join, move and game over
+        for players in (2, 4, 8):
+            off, on = asyncio.run(compare(players, 2000))
+            rows.append((f'{players} players, metrics off', off, None, None))
+            rows.append((f'{players} players, metrics on ({on / off - 1:+.1%})', on, None, None))
+    report(rows, header='us/op is per Session.process_game_move, MOVE_PACING 0')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Game state update format benchmark.
+
+Plays seeded bot games through a client-less ``Session`` and, for every move,
+builds and encodes the update in each protocol: the full state and the delta
+are built and encoded once for everyone, while per-viewer frames are either
+fully re-serialized for each seat or built from one shared public encoding
+plus each seat's own hand. Reports the average frame size and the time to
+produce every frame of a move, building the messages included, which is what
+a session pays per move for each protocol its clients use.
+
+    python -m benchmarks.protocol
+"""
+import random
+import time
+
+from benchmarks.common import report
+from computer.bot import Bot
+from game import Whot, cards_from_dicts
+from utils import Session, encode
+
+
+KINDS = ('full', 'delta', 'view, naive', 'view')
+
+
+def record(players: int, games: int, seed: int) -> dict:
+    totals = {kind: [0, 0.0] for kind in KINDS}
+    totals['moves'] = 0
+    bot = Bot(False)
+    for game in range(games):
+        random.seed(seed + game)
+        session = Session(id=game, hostName='host', numStartingCards=6, numPlayers=players,
+                          numAI=0, timeLimit=30, isPrivate=False, clients=[])
+        session.game = Whot([])
+        session.state = session.game.deal([str(i) for i in range(players)],
+                                          [f'player{i}' for i in range(players)], 6)
+        view = session.state_message()
+        for _ in range(500):
+            state = session.state
+            stack = bot.process(view, view['turn'])['stack']
+            face_card = state.face_card
+            state.log = []
+            session.game.play(cards_from_dicts(stack))
+            log, state.log = state.log, None
+            session.turns_played += 1
+
+            rankings = session.rankings_update()
+            view = session.state_message(rankings)  # the bot's input, built outside the timing
+            view['turns_played'] = session.turns_played
+            view['last_stack'] = stack
+            updates = {
+                'full': lambda: [encode({**session.state_message(rankings), 'turns_played': session.turns_played,
+                                         'last_stack': stack})],
+                'delta': lambda: [encode(session.delta_message(log, face_card, rankings, stack))],
+                'view, naive': lambda: [
+                    encode({'type': 'view', 'public': public, 'private': session.private_view(i)})
+                    for public in [session.public_view(rankings, stack)] for i in state.ids],
+                'view': lambda: [
+                    session.view_frame(public, i)
+                    for public in [encode(session.public_view(rankings, stack))] for i in state.ids],
+            }
+            for kind, update in updates.items():
+                start = time.perf_counter()
+                frames = update()
+                totals[kind][1] += time.perf_counter() - start
+                totals[kind][0] += sum(len(frame.encode()) for frame in frames) / len(frames)
+            totals['moves'] += 1
+            if view['winner']:
+                break
+    return totals
+
+
+def main(games: int = 200, seed: int = 0):
+    rows = []
+    for players in (4, 6, 8):
+        totals = record(players, games, seed)
+        moves = totals['moves']
+        for kind in KINDS:
+            size, seconds = totals[kind]
+            rows.append((f'{players} players [{kind}] {size / moves:5.0f} B/frame',
+                         seconds / moves * 1e6, None, None))
+    report(rows, header=f'{games} seeded bot games per player count; time is building and encoding every '
+                        f'frame one move sends')
+
+
+if __name__ == '__main__':
+    main()
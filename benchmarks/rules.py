@@ -0,0 +1,364 @@
+"""Replays a corpus of moves through the rule engine and the old branch chain.
+
+Both take the dict moves clients used to send, so the engine timing includes
+reloading every hand into a GameState and rescoring it. That costs about what
+the engine saves over the branch chain, and on this path the engine is no
+faster (a little slower on most runs). The speedup is the last figure's, the
+server path, where Session keeps that state and only the played cards move.
+
+The corpus is recorded from seeded games played by a random policy that
+exercises every branch (stacked picks, failed defences, General Market,
+suspensions, hold on). Each record holds the move plus the draw pile and turn
+index it was played against, so both implementations see identical inputs.
+
+    python -m benchmarks.rules                    # record, check and time
+    python -m benchmarks.rules --save moves.json  # also keep the corpus
+    python -m benchmarks.rules --corpus moves.json
+"""
+import argparse
+import copy
+import gc
+import json
+import random
+import time
+from collections import deque
+
+from game import (CARD_NUM, LEGAL_MASKS, WHOT, DrawPile, Whot, get_stack_value,
+                  is_valid)
+
+
+class LegacyWhot:
+    """Whot.process_game_move as it was before the rule engine."""
+
+    def __init__(self, clients, deck: DrawPile):
+        self.clients = clients
+        self.deck = deck
+        self.current_turn_index = 0
+
+    def generate_hand(self, n: int, no_action: bool = False):
+        return self.deck.draw(n, no_action)
+
+    def get_winner(self, players):
+        if len(players) == 1:
+            return players[0]['name']
+        player = list(filter(lambda x: len(x['hand']) == 0, players))
+        if len(player) == 0:
+            return ''
+        return player[0]['name']
+
+    def rank_players(self, players):
+        data = []
+        for player in players:
+            total = 0
+            for card in player['hand']:
+                total += CARD_NUM[card]
+            data.append([total, player['name']])
+        return sorted(data, key=lambda x: x[0])
+
+    def get_next_turn(self):
+        self.current_turn_index = (self.current_turn_index + 1) % len(self.clients)
+        return self.clients[self.current_turn_index][1]
+
+    def process_game_move(self, move):
+        if CARD_NUM[move['face_card']] in [2, 5] and move['market'] > 1:
+            if move['failed_defense']:
+                turn = move['turn']
+            else:
+                next_turn = self.get_next_turn()
+                turn = next_turn
+            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
+            rest = [p for p in move['player_cards'] if p['id'] != turn]
+            defence = list(filter(lambda x: CARD_NUM[x] in [CARD_NUM[move['face_card']], WHOT] ,player[1]['hand']))
+            cannot_defend = len(defence) == 0
+            if cannot_defend or move['failed_defense']:
+                # Add cards to player since cant defend
+                cards = self.generate_hand(move['market'])
+                player[1]['hand'] += cards
+                # Now skip turn
+                next_turn = self.get_next_turn()
+                turn = next_turn
+            rest.insert(player[0], player[1])
+            return {
+                'player_cards': rest,
+                'face_card': move['face_card'],
+                'turn': turn,
+                'market': 0 if (cannot_defend or move['failed_defense']) else move['market'],
+                'winner': self.get_winner(rest),
+                'rankings': self.rank_players(rest)
+            }
+                
+        if CARD_NUM[move['face_card']] == 14 and move['market'] != 1: # Gen market (if only 1, market is 0 otherwise the amount stacked)
+            turn = move['turn']
+            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
+            rest = [p for p in move['player_cards'] if p['id'] != turn]
+            for i in range(len(rest)):
+                cards = self.generate_hand(1 if move['market'] == 0 else move['market'])
+                rest[i]['hand'] += cards
+            rest.insert(player[0], player[1])
+            return {
+                'player_cards': rest,
+                'face_card': move['face_card'],
+                'turn': turn,
+                'market': 0,
+                'winner': self.get_winner(rest),
+                'rankings': self.rank_players(rest)
+            }
+            
+        if CARD_NUM[move['face_card']] == 14 and move['market'] == 1: # After gen market, cant play
+            turn = move['turn']
+            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
+            rest = [p for p in move['player_cards'] if p['id'] != turn]
+            cards = self.generate_hand(move['market'])
+            player[1]['hand'] += cards
+            rest.insert(player[0], player[1])
+            next_turn = self.get_next_turn()
+            turn = next_turn
+            return {
+                'player_cards': rest,
+                'face_card': move['face_card'],
+                'turn': turn,
+                'market': 0,
+                'winner': self.get_winner(rest),
+                'rankings': self.rank_players(rest)
+            }
+            
+        if CARD_NUM[move['face_card']] == 8 and move['market'] == 0: # Skip next player(s) simple
+            for _ in range(move['turns_to_skip']):
+                next_turn = self.get_next_turn()
+            turn = next_turn
+            return {
+                'player_cards': move['player_cards'],
+                'face_card': move['face_card'],
+                'turn': turn,
+                'market': 0,
+                'winner': self.get_winner(move['player_cards']),
+                'rankings': self.rank_players(move['player_cards'])
+            }
+            
+        if CARD_NUM[move['face_card']] == 8 and move['market'] == 1: # next player after the skipped, cant play
+            turn = move['turn']
+            cards = self.generate_hand(move['market'])
+            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
+            rest = [p for p in move['player_cards'] if p['id'] != turn]
+            player[1]['hand'] += cards
+            rest.insert(player[0], player[1])
+            next_turn = self.get_next_turn()
+            turn = next_turn
+            return {
+                'player_cards': rest,
+                'face_card': move['face_card'],
+                'turn': turn,
+                'market': 0,
+                'winner': self.get_winner(rest),
+                'rankings': self.rank_players(rest)
+            }
+            
+        if CARD_NUM[move['face_card']] == 1 and move['market'] == 0:
+            return {
+                'player_cards': move['player_cards'],
+                'face_card': move['face_card'],
+                'turn': move['turn'],
+                'market': 0,
+                'winner': self.get_winner(move['player_cards']),
+                'rankings': self.rank_players(move['player_cards'])
+            }
+        
+        if CARD_NUM[move['face_card']] == 1 and move['market'] == 1:
+            turn = move['turn']
+            cards = self.generate_hand(move['market'])
+            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
+            rest = [p for p in move['player_cards'] if p['id'] != turn]
+            player[1]['hand'] += cards
+            rest.insert(player[0], player[1])
+            next_turn = self.get_next_turn()
+            turn = next_turn
+            return {
+                'player_cards': rest,
+                'face_card': move['face_card'],
+                'turn': turn,
+                'market': 0,
+                'winner': self.get_winner(rest),
+                'rankings': self.rank_players(rest)
+            }
+        
+             
+        turn = move['turn']
+        cards = self.generate_hand(move['market'])
+        player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
+        rest = [p for p in move['player_cards'] if p['id'] != turn]
+        player[1]['hand'] += cards
+        rest.insert(player[0], player[1])
+        next_turn = self.get_next_turn()
+        turn = next_turn
+            
+        return {
+            'player_cards': rest,
+            'face_card': move['face_card'],
+            'turn': turn,
+            'market': 0,
+            'winner': self.get_winner(rest),
+            'rankings': self.rank_players(rest)
+        }
+
+
+def random_move(rng: random.Random, state: dict) -> dict:
+    """A legal move for the player on turn, chosen to hit every rule branch."""
+    players = state['player_cards']
+    seat = [p['id'] for p in players].index(state['turn'])
+    hand = list(players[seat]['hand'])
+    face, market = state['face_card'], state['market']
+
+    stack = []
+    if rng.random() < 0.85:
+        playable = [c for c in hand if is_valid(face, c, False)]
+        if playable:
+            stack.append(rng.choice(playable))
+            hand.remove(stack[-1])
+            while rng.random() < 0.7:
+                more = [c for c in hand if LEGAL_MASKS[True][stack[-1]] >> c & 1]
+                if not more:
+                    break
+                stack.append(rng.choice(more))
+                hand.remove(stack[-1])
+
+    d = get_stack_value(stack, market)
+    if not stack and not (d['failed_defense'] and rng.random() < 0.5):
+        d['market'] = 1
+        d['failed_defense'] = False
+    move_players = copy.deepcopy(players)
+    move_players[seat]['hand'] = hand
+    return {
+        'player_cards': move_players,
+        'stack': stack,
+        'face_card': stack[-1] if stack else face,
+        'turn': state['turn'],
+        **d,
+    }
+
+
+def record(games: int, seed: int, num_players: int = 4, max_moves: int = 300) -> list:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(games):
+        random.seed(rng.random())
+        clients = [(None, f'p{i}', f'name{i}') for i in range(num_players)]
+        game = LegacyWhot(clients, DrawPile())
+        hands = [game.generate_hand(5) for _ in clients]
+        state = {
+            'player_cards': [{'id': c[1], 'name': c[2], 'hand': h} for c, h in zip(clients, hands)],
+            'face_card': game.generate_hand(1, no_action=True)[0],
+            'turn': clients[0][1],
+            'market': 0,
+        }
+        for _ in range(max_moves):
+            move = random_move(rng, state)
+            corpus.append({
+                'deck': list(game.deck.cards),
+                'turn_index': game.current_turn_index,
+                'move': copy.deepcopy(move),
+            })
+            state = game.process_game_move(move)
+            if state['winner']:
+                break
+    return corpus
+
+
+def replay(corpus: list, legacy: bool):
+    """Runs every record once; returns (outputs, decks after, seconds in the rules)."""
+    game = LegacyWhot([], None) if legacy else Whot([], pool=None)
+    moves = [copy.deepcopy(rec['move']) for rec in corpus]
+    piles = []
+    for rec in corpus:
+        pile = DrawPile()
+        pile.cards = deque(rec['deck'])
+        piles.append(pile)
+    clients = [[(None, p['id'], p['name']) for p in move['player_cards']] for move in moves]
+
+    outputs = []
+    elapsed = 0.0
+    gc.disable()
+    try:
+        for i, rec in enumerate(corpus):
+            game.deck = piles[i]
+            if legacy:
+                game.clients = clients[i]
+                game.current_turn_index = rec['turn_index']
+            random.seed(i)  # reshuffles mid-draw must match too
+            start = time.perf_counter()
+            outputs.append(game.process_game_move(moves[i]))
+            elapsed += time.perf_counter() - start
+    finally:
+        gc.enable()
+    return outputs, [list(pile.cards) for pile in piles], elapsed
+
+
+def server_path(games: int, seed: int, num_players: int = 4, max_moves: int = 300) -> float:
+    """Seconds per move for Whot.play on a persistent GameState, as Session runs it."""
+    rng = random.Random(seed)
+    elapsed, moves = 0.0, 0
+    for _ in range(games):
+        random.seed(rng.random())
+        game = Whot([], pool=None)
+        state = game.deal([f'p{i}' for i in range(num_players)],
+                          [f'name{i}' for i in range(num_players)], 5)
+        for _ in range(max_moves):
+            move = random_move(rng, {
+                'player_cards': [{'id': i, 'hand': h} for i, h in zip(state.ids, state.hands)],
+                'face_card': state.face_card,
+                'turn': state.ids[state.turn],
+                'market': state.market,
+            })
+            start = time.perf_counter()
+            game.play(move['stack'])
+            winner = state.winner()
+            state.rankings()
+            elapsed += time.perf_counter() - start
+            moves += 1
+            if winner:
+                break
+    return elapsed / moves
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--corpus', help='replay a corpus saved with --save')
+    parser.add_argument('--save', help='write the recorded corpus to this file')
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus) as f:
+            corpus = json.load(f)
+    else:
+        corpus = record(args.games, args.seed)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(corpus, f)
+
+    branches = {}
+    for rec in corpus:
+        move = rec['move']
+        key = (CARD_NUM[move['face_card']], min(move['market'], 2), move['failed_defense'])
+        branches[key] = branches.get(key, 0) + 1
+
+    old, old_decks, old_time = replay(corpus, legacy=True)
+    new, new_decks, new_time = replay(corpus, legacy=False)
+    for _ in range(4):
+        old_time = min(old_time, replay(corpus, legacy=True)[2])
+        new_time = min(new_time, replay(corpus, legacy=False)[2])
+    mismatches = sum(1 for a, b, da, db in zip(old, new, old_decks, new_decks)
+                     if json.dumps(a) != json.dumps(b) or da != db)
+
+    print(f'{len(corpus)} moves, {len(branches)} (face num, market state, failed defence) cases')
+    print(f'mismatches: {mismatches}')
+    print(f'branch chain: {old_time / len(corpus) * 1e6:.2f} us/move')
+    print(f'rule engine via process_game_move: {new_time / len(corpus) * 1e6:.2f} us/move')
+    print(f'rule engine on server GameState (Whot.play): '
+          f'{server_path(args.games, args.seed) * 1e6:.2f} us/move')
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Search bot benchmark: determinized MCTS against the greedy ``get_a_move``.
+
+Plays headless games, one search bot against greedy bots, with each search
+moving through the process pool as a bot seat's does, and reports the search
+bot's win rate next to what an equal share would be, playouts per second
+per search and the time each search move took.
+
+    python -m benchmarks.search
+    python -m benchmarks.search --games 100 --budget 0.5
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from computer.bot import get_a_move
+from computer.search import search_move, search_pool
+from game import Whot
+from utils import percentiles
+
+
+async def play(game_id: int, players: int, budget: float, stats: dict) -> bool:
+    """Plays one game; True if the search bot, seated at game_id % players, won."""
+    seat = game_id % players
+    ids = [str(i) for i in range(players)]
+    game = Whot([], pool=None)
+    state = game.deal(ids, ids, 5)
+    while not state.winner():
+        hand = state.hands[state.turn]
+        if state.turn == seat:
+            start = time.perf_counter()
+            result = await search_move(state.face_card, hand, state.market, seat,
+                                       [len(h) for h in state.hands], game.engine.rules, budget)
+            stats['latency'].append(time.perf_counter() - start)
+            stats['playouts'] += result['playouts']
+            stats['seconds'] += result['seconds']
+            stack = result['stack']
+        else:
+            _, _, stack = get_a_move(state.face_card, list(hand), state.market)
+        game.play(stack)
+    return state.winner() == ids[seat]
+
+
+async def run(games: int, players: int, budget: float, concurrency: int) -> tuple:
+    stats = {'latency': [], 'playouts': 0, 'seconds': 0.0}
+    limit = asyncio.Semaphore(concurrency)
+
+    async def limited(game_id: int) -> bool:
+        async with limit:
+            return await play(game_id, players, budget, stats)
+    wins = await asyncio.gather(*(limited(g) for g in range(games)))
+    return sum(wins), stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=40)
+    parser.add_argument('--players', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=0.2, help='seconds per search move')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    pool = search_pool()
+    wins, stats = asyncio.run(run(args.games, args.players, args.budget, pool._max_workers))
+    pool.shutdown()
+    lag = percentiles(stats['latency'])
+    print(f'{args.games} games, 1 search bot ({args.budget}s per move) against '
+          f'{args.players - 1} greedy bots on {pool._max_workers} search processes')
+    print(f'search bot wins: {wins / args.games:.0%} (an equal share is {1 / args.players:.0%})')
+    print(f'playouts/s per search: {stats["playouts"] / max(stats["seconds"], 1e-9):.0f}')
+    print(f'search move: p50 {lag.get("p50", 0)} p99 {lag.get("p99", 0)} ms over {lag["count"]} moves')
+
+
+if __name__ == '__main__':
+    main()
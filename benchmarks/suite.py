@@ -0,0 +1,245 @@
+"""The benchmark suite: micro benchmarks of the game engine and macro ones of the session layer.
+
+Micro benchmarks time the engine's building blocks one call at a time, with
+``Whot.process_game_move`` once per rule engine branch. Macro benchmarks
+drive ``Session.process_game_move`` through seeded bot games and
+``Session.broadcast_message`` with fake websockets for 2 to 8 players, and
+publish the lobby of 10k sessions to its watchers. Everything is seeded, and
+each figure is the best of several repeats.
+
+Results are saved as JSON with the commit and interpreter they came from;
+``--compare`` flags every benchmark that got slower than a saved run by more
+than ``--threshold`` and exits with status 1 if any did.
+
+    python -m benchmarks.suite --out before.json
+    python -m benchmarks.suite --out after.json --compare before.json
+    python -m benchmarks.suite --only micro
+"""
+import argparse
+import asyncio
+from contextlib import redirect_stdout
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.common import report, time_per_op
+from computer.bot import get_a_move
+from game import CARD_IDS, Whot, cards_to_dicts, get_stack_value, is_valid
+import utils
+from utils import LobbyQuery, Session, SessionsManager, encode
+
+REPEAT = 5  # timing repeats; the best one counts
+
+
+class NullSocket:
+    """A websocket that accepts every frame without sending it anywhere."""
+
+    def __init__(self):
+        self.frames = 0
+
+    async def send_text(self, text: str):
+        self.frames += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def card(shape: str, num: int) -> int:
+    return CARD_IDS[(shape, num)]
+
+
+def branch_moves() -> dict:
+    """A move dict per rule engine branch, as Whot.process_game_move takes them."""
+    hands = [[card('circle', 3), card('square', 7), card('star', 4), card('cross', 10)],
+             [card('triangle', 2), card('circle', 11), card('star', 7), card('square', 13)],
+             [card('cross', 1), card('triangle', 12), card('circle', 4), card('star', 8)]]
+    no_defence = [hands[0], [card('circle', 11), card('star', 7)], hands[2]]
+
+    def move(face: int, market: int = 0, turns_to_skip: int = 2, failed_defense: bool = False,
+             hands: list = hands) -> dict:
+        return {'hands': hands, 'face_card': face, 'turn': 'p0', 'market': market,
+                'turns_to_skip': turns_to_skip, 'failed_defense': failed_defense}
+    return {
+        'go to market': move(card('circle', 3), market=1),
+        'pick, defended': move(card('circle', 2), market=2),
+        'pick, drawn': move(card('circle', 2), market=2, hands=no_defence),
+        'pick, failed defence': move(card('circle', 2), market=2, failed_defense=True),
+        'general market': move(card('circle', 14)),
+        'suspension': move(card('circle', 8)),
+        'hold on': move(card('circle', 1)),
+    }
+
+
+def micro() -> dict:
+    random.seed(7)
+    whot = Whot([], pool=None, rng=random.Random(7))
+    hands = whot.distribute_cards(4, 7)
+    face = whot.get_starting_card()
+    players = [{'id': f'p{i}', 'name': f'player{i}', 'hand': hand} for i, hand in enumerate(hands)]
+    results = {
+        'create_starting_deck': time_per_op(whot.create_starting_deck, 2000, REPEAT),
+        'generate_hand': time_per_op(lambda: whot.generate_hand(5), 20000, REPEAT),
+        'rank_players': time_per_op(lambda: whot.rank_players(players), 20000, REPEAT),
+        'is_valid': time_per_op(lambda: is_valid(face, hands[0][0], False), 50000, REPEAT),
+        'get_stack_value': time_per_op(lambda: get_stack_value(hands[1][:2], 0), 50000, REPEAT),
+        'get_a_move': time_per_op(lambda: get_a_move(face, list(hands[0]), 0), 20000, REPEAT),
+    }
+    game = Whot([], pool=None, rng=random.Random(7))
+    for name, move in branch_moves().items():
+        def process(move=move):
+            # fresh hands each call, since the engine deals market cards into them
+            player_cards = [{'id': f'p{i}', 'name': f'player{i}', 'hand': list(hand)}
+                            for i, hand in enumerate(move['hands'])]
+            game.process_game_move({**move, 'player_cards': player_cards})
+        results[f'process_game_move [{name}]'] = time_per_op(process, 20000, REPEAT)
+    return results
+
+
+async def session_moves(players: int, moves: int, seed: int) -> float:
+    """Microseconds per Session.process_game_move over seeded greedy games with fake sockets."""
+    utils.MOVE_PACING = 0
+    random.seed(seed)
+    elapsed = 0.0
+    done = 0
+    game = 0
+    while done < moves:
+        session = Session(id=game, hostName='host', numStartingCards=5, numPlayers=players,
+                          numAI=0, timeLimit=0, isPrivate=True, clients=[])
+        for i in range(players):
+            await session.add_client(NullSocket(), f'p{i}', f'player{i}')
+        await session.start_game()
+        while not session.finished.is_set() and done < moves:
+            state = session.state
+            _, _, stack = get_a_move(state.face_card, list(state.hands[state.turn]), state.market)
+            move = encode({'stack': cards_to_dicts(stack), 'turn': state.ids[state.turn],
+                           'seq': session.turns_played})
+            start = time.perf_counter()
+            await session.process_game_move(move)
+            elapsed += time.perf_counter() - start
+            done += 1
+            await asyncio.sleep(0)  # lets the writers drain
+        session.stop_actor()
+        for client in session.clients:
+            client.stop()
+        game += 1
+    return elapsed / moves * 1e6
+
+
+async def broadcasts(players: int, rounds: int) -> float:
+    """Microseconds per Session.broadcast_message of a full state, queued on fake sockets."""
+    # a seat to spare, so the session never fills and starts its countdown
+    session = Session(id=0, hostName='host', numStartingCards=5, numPlayers=players + 1,
+                      numAI=0, timeLimit=0, isPrivate=True, clients=[])
+    for i in range(players):
+        await session.add_client(NullSocket(), f'p{i}', f'player{i}')
+    message = {
+        'player_cards': [{'id': c.id, 'name': c.name, 'hand': [{'shape': 'circle', 'num': 7}] * 6}
+                         for c in session.clients],
+        'face_card': {'shape': 'star', 'num': 4},
+        'turn': 'p0', 'market': 0, 'winner': '', 'turns_played': 12,
+    }
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await session.broadcast_message(message, state=True)
+        best = min(best, time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+    for client in session.clients:
+        client.stop()
+    return best / rounds * 1e6
+
+
+async def lobby(sessions: int, watchers: int, changes: int = 50) -> float:
+    """Microseconds per lobby publish after a seat change, with sessions listed and watchers pushed to."""
+    manager = SessionsManager()
+    manager.ids.clear()
+    manager.lobby.clear()
+    for i in range(sessions):
+        session = Session(id=i, hostName=f'host{i}', numStartingCards=5, numPlayers=2 + i % 7,
+                          numAI=0, timeLimit=0, isPrivate=i % 5 == 0, clients=[])
+        await manager.add_session(session)
+        await session.add_client(NullSocket(), f'c{i}', f'n{i}')
+    pages = [LobbyQuery(offset=20 * (q // 2), limit=20, min_free_seats=q % 2) for q in range(8)]
+    lobby = [manager.watch_lobby(NullSocket(), pages[w % len(pages)]) for w in range(watchers)]
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    for n in range(changes):
+        session = manager[1 + n % (sessions - 1)]
+        await session.add_client(NullSocket(), f'x{n}', f'x{n}')
+        manager.publish_lobby()
+    elapsed = time.perf_counter() - start
+    for watcher in lobby:
+        manager.unwatch_lobby(watcher)
+    for session in list(manager.ids.values()):
+        for client in session.clients:
+            client.stop()
+    manager.ids.clear()
+    manager.lobby.clear()
+    return elapsed / changes * 1e6
+
+
+async def macro() -> dict:
+    results = {}
+    for players in (2, 4, 6, 8):
+        results[f'Session.process_game_move [{players} players]'] = await session_moves(players, 2000, seed=1)
+    for players in (2, 4, 6, 8):
+        results[f'Session.broadcast_message [{players} players]'] = await broadcasts(players, 2000)
+    results['lobby publish [10k sessions, 1k watchers]'] = await lobby(10000, 1000)
+    return results
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ''
+    return {'commit': commit, 'python': platform.python_version(), 'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list:
+    """(name, before us, after us) for each benchmark more than threshold slower than the baseline."""
+    return [(name, baseline[name], us) for name, us in results.items()
+            if name in baseline and us > baseline[name] * (1 + threshold)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only', choices=('micro', 'macro'))
+    parser.add_argument('--out', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='a saved JSON run to flag regressions against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='how much slower than the saved run counts as a regression')
+    args = parser.parse_args()
+
+    results = {}
+    with redirect_stdout(io.StringIO()):  # sessions log every join, move and game over
+        if args.only != 'macro':
+            results.update(micro())
+        if args.only != 'micro':
+            results.update(asyncio.run(macro()))
+    results = {name: round(us, 3) for name, us in results.items()}
+    report([(name, us, None, None) for name, us in results.items()])
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = regressions(results, baseline['results'], args.threshold)
+        print(f"\ncompared with {args.compare} ({baseline['meta'].get('commit') or 'no commit'}):",
+              f'{len(slower)} regressions over {args.threshold:.0%}')
+        for name, before, after in slower:
+            print(f'  {name}: {before:.2f} -> {after:.2f} us/op ({after / before - 1:+.0%})')
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
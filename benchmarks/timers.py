@@ -0,0 +1,71 @@
+"""Turn deadline benchmark: the shared TimerWheel versus a sleeping task per turn.
+
+Arms ``sessions`` turn deadlines spread over a few seconds, then re-arms a
+fifth of them (as if a move came in) halfway through, and reports the cost of
+arming, the memory each pending deadline holds, the CPU the event loop spent
+over the run, and how late the deadlines fired.
+
+    python -m benchmarks.timers
+"""
+import asyncio
+import random
+import time
+import tracemalloc
+
+from benchmarks.common import report
+from utils import TimerWheel, percentiles
+
+
+class TaskTimers:
+    """The per-session alternative: one task sleeping until each deadline."""
+
+    def __init__(self):
+        self.lag = []
+
+    def schedule(self, delay: float, callback, *args) -> asyncio.Task:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + delay
+
+        async def wait():
+            await asyncio.sleep(delay)
+            self.lag.append(loop.time() - deadline)
+            callback(*args)
+        return asyncio.ensure_future(wait())
+
+
+async def run(kind: str, sessions: int, spread: float = 2.0) -> tuple:
+    random.seed(sessions)
+    timers = TimerWheel() if kind == 'wheel' else TaskTimers()
+    fired = []
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    handles = [timers.schedule(random.uniform(0.5, spread), fired.append, i) for i in range(sessions)]
+    arm = (time.perf_counter() - start) / sessions
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cpu = time.process_time()
+    await asyncio.sleep(spread / 4)
+    for i in random.sample(range(sessions), sessions // 5):
+        handles[i].cancel()
+        handles[i] = timers.schedule(random.uniform(0.5, spread), fired.append, i)
+    while len(fired) < sessions:
+        await asyncio.sleep(0.05)
+    cpu = time.process_time() - cpu
+    lag = percentiles(timers.lag)
+    return arm * 1e6, (held - base) / sessions, cpu, lag
+
+
+def main():
+    rows = []
+    for sessions in (1000, 10000, 50000):
+        for kind in ('tasks', 'wheel'):
+            arm, held, cpu, lag = asyncio.run(run(kind, sessions))
+            rows.append((f'{sessions} deadlines [{kind}] cpu {cpu:5.2f}s '
+                         f'lag p50 {lag["p50"]:5.1f} p99 {lag["p99"]:5.1f} ms', arm, held / 1024, None))
+    report(rows, header='us/op is arming one deadline; kept KiB is memory per pending deadline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Cost of session tracing per Session.process_game_move, off and on.
+
+Plays the suite's seeded greedy games with fake sockets three ways: with
+tracing off, with every session sampled, and with tracing off again, so the
+two untraced runs show the noise the comparison has to beat. The traced run
+writes to a temporary file, which is checked to load as a JSON trace.
+
+    python -m benchmarks.tracing
+"""
+import asyncio
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import tempfile
+
+from benchmarks.common import report
+from benchmarks.suite import REPEAT, session_moves
+from tracing import tracer
+
+
+async def best(players: int, moves: int) -> float:
+    return min([await session_moves(players, moves, seed=1) for _ in range(REPEAT)])
+
+
+def main():
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(io.StringIO()):
+        path = os.path.join(tmp, 'trace.json')
+        for players in (2, 4, 8):
+            off = asyncio.run(best(players, 2000))
+            tracer.configure(sample=1.0, path=path)
+            on = asyncio.run(best(players, 2000))
+            tracer.configure()
+            again = asyncio.run(best(players, 2000))
+            with open(path) as f:
+                events = len(json.load(f))
+            rows.append((f'{players} players, tracing off', off, None, None))
+            rows.append((f'{players} players, tracing on ({on / off - 1:+.0%}, {events} events)', on, None, None))
+            rows.append((f'{players} players, tracing off again ({again / off - 1:+.1%})', again, None, None))
+    report(rows, header='us/op is per Session.process_game_move, MOVE_PACING 0')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from game import Whot
+from game import Whot, cards_to_dicts
 import pprint
 import json
 
@@ -7,7 +7,7 @@ import json
 whot = Whot([])
 
 
-cards = json.loads(json.dumps(whot.deck))
+cards = json.loads(json.dumps(cards_to_dicts(whot.deck)))
 
 new_cards = [{
     'id': i,
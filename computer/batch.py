@@ -0,0 +1,175 @@
+"""
+Rule evaluation for many games at once with NumPy.
+
+A hand is a uint64 bitmask of card ids (the deck has fewer than 64 cards),
+so the legal cards of every game in a batch come from one table lookup and
+one AND, and a stack's market and skip values from a few table lookups over
+the stack's opening card. Bot seats that decide in the same event loop
+iteration share one greedy_stacks call through GreedyBatcher, and the
+simulator steps batches of games in lockstep to do the same; both play
+exactly get_a_move's stacks. Neither needs stack_values, as Whot.play works
+out the value of the stack it is given.
+"""
+import asyncio
+from typing import Callable
+
+import numpy as np
+
+from game import CARD_NUM, DECK, LEGAL_MASKS, STANDARD_RULES, WHOT, HouseRules, hand_mask, legal_mask
+
+LEGAL = np.array(LEGAL_MASKS, dtype=np.uint64)  # LEGAL[has_played, face_card], as LEGAL_MASKS
+NUMS = sorted(set(CARD_NUM))  # the card numbers, lowest first
+NUM_MASKS = np.array([sum(1 << card for card in DECK if CARD_NUM[card] == num)
+                      for num in NUMS], dtype=np.uint64)  # the cards of each number in NUMS
+MIN_BATCH = 64  # fewer decisions than this are cheaper one by one, see benchmarks/batch.py
+
+
+def rule_tables(rules: HouseRules) -> tuple:
+    """Per-card pick, general market and suspension strengths, each 0 where another effect wins."""
+    pick = np.zeros(len(DECK), dtype=np.int64)
+    general_market = np.zeros(len(DECK), dtype=np.int64)
+    suspension = np.zeros(len(DECK), dtype=np.int64)
+    for card in DECK:
+        num = CARD_NUM[card]
+        # get_stack_value checks pick, then general market, then suspension
+        if num in rules.pick:
+            pick[card] = rules.pick[num]
+        elif num in rules.general_market:
+            general_market[card] = rules.general_market[num]
+        elif num in rules.suspension:
+            suspension[card] = rules.suspension[num]
+    return pick, general_market, suspension
+
+
+STANDARD_TABLES = rule_tables(STANDARD_RULES)
+
+
+def hand_masks(hands) -> np.ndarray:
+    """The bitmask of each hand, as uint64."""
+    return np.fromiter((hand_mask(hand) for hand in hands), dtype=np.uint64, count=len(hands))
+
+
+def legal_masks(face_cards: np.ndarray, hands: np.ndarray, has_played: bool = False) -> np.ndarray:
+    """The cards of each hand that may be played on its face card, as legal_mask does for one."""
+    return LEGAL[int(has_played)][face_cards] & hands
+
+
+def stack_values(openers: np.ndarray, lengths: np.ndarray, markets: np.ndarray,
+                 rules: HouseRules = STANDARD_RULES) -> tuple:
+    """
+    get_stack_value for many stacks, given each stack's first card and size.
+
+    Parameters
+    ----------
+    openers : np.ndarray
+        Each stack's first card, anything for an empty stack.
+    lengths : np.ndarray
+        Cards in each stack.
+    markets : np.ndarray
+        Each game's market before the stack.
+    rules : HouseRules
+        The house rules all the games play by.
+
+    Returns
+    -------
+    tuple
+        The 'market', 'turns_to_skip' and 'failed_defense' arrays.
+    """
+    pick, general_market, suspension = STANDARD_TABLES if rules is STANDARD_RULES else rule_tables(rules)
+    played = lengths > 0
+    cards = np.where(played, openers, 0)
+    pick, general_market, suspension = pick[cards], general_market[cards], suspension[cards]
+    value = np.where(played & (pick > 0), pick * lengths,
+                     np.where(played & (general_market > 0) & (lengths > 1), general_market * lengths, 0))
+    turns = np.where(played & (suspension > 0), suspension * lengths, 1)
+    return markets + value, np.where(turns == 1, 2, turns + 1), ~played & (markets > 0)
+
+
+def greedy_stacks(face_cards: np.ndarray, hands: np.ndarray) -> tuple:
+    """
+    What every game's greedy move opens with: the lowest number among the
+    legal cards of the hand.
+
+    Which card of that number opens and what is stacked on it depend on the
+    order of the hand, which a mask does not keep, so stack_cards finishes
+    each move from the hand itself.
+
+    Returns
+    -------
+    tuple
+        The opening numbers, -1 where the player must go to market, and the
+        masks of the legal cards.
+    """
+    legal = legal_masks(face_cards, hands)
+    nums = np.full(len(hands), -1, dtype=np.int64)
+    for num, num_mask in zip(NUMS, NUM_MASKS):
+        nums[(nums < 0) & ((legal & num_mask) != 0)] = num
+    return nums, legal
+
+
+def greedy_stack(face_card: int, hand: list[int]) -> list[int]:
+    """greedy_stacks and stack_cards for a single game, in plain Python."""
+    legal = legal_mask(face_card, hand)
+    if not legal:
+        return []
+    return stack_cards(min(CARD_NUM[card] for card in hand if legal >> card & 1), legal, hand)
+
+
+def stack_cards(num: int, legal: int, hand: list[int]) -> list[int]:
+    """
+    get_a_move's stack, given the number it opens with and the hand's legal cards.
+
+    get_a_move walks the hand in number order, ties in hand order, and plays
+    every card it may: the first legal card of the lowest number, the cards
+    of that number after it in the hand, and then every Whot.
+    """
+    if num < 0:
+        return []
+    stack = []
+    for card in hand:
+        if CARD_NUM[card] == num and (stack or legal >> card & 1):
+            stack.append(card)
+    if num != WHOT:
+        stack += [card for card in hand if CARD_NUM[card] == WHOT]
+    return stack
+
+
+class GreedyBatcher:
+    """
+    Answers the greedy decisions requested in one event loop iteration with a
+    single greedy_stacks call, made once the iteration's callbacks have run.
+    Batches smaller than MIN_BATCH are answered one by one with greedy_stack.
+    """
+
+    def __init__(self):
+        self.pending: list = []
+        self.batches = 0
+        self.decisions = 0
+
+    def request(self, face_card: int, hand: list[int], callback: Callable[[list[int]], None]):
+        """Queues a decision; callback gets the stack to play."""
+        if not self.pending:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.pending.append((face_card, hand, callback))
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        self.batches += 1
+        self.decisions += len(pending)
+        if len(pending) < MIN_BATCH:
+            for face, hand, callback in pending:
+                callback(greedy_stack(face, hand))
+            return
+        faces = np.fromiter((face for face, _, _ in pending), dtype=np.int64, count=len(pending))
+        nums, legal = greedy_stacks(faces, hand_masks([hand for _, hand, _ in pending]))
+        for (_, hand, callback), num, mask in zip(pending, nums.tolist(), legal.tolist()):
+            callback(stack_cards(num, mask, hand))
+
+    def stats(self) -> dict:
+        return {'batches': self.batches, 'decisions': self.decisions,
+                'per_batch': round(self.decisions / self.batches, 2) if self.batches else 0.0}
+
+
+greedy_batcher = GreedyBatcher()
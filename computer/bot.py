@@ -1,16 +1,168 @@
 import asyncio 
+from collections import deque
 import json
 import os
 import random
 import threading
+import time
+from typing import Optional
 import websockets
 from dotenv import load_dotenv
 
-from game import get_stack_value, is_valid
+from computer.batch import greedy_batcher
+from computer.search import SEARCH_BUDGET, search_move
+from game import CARD_NUM, LEGAL_MASKS, card_from_dict, cards_from_dicts, cards_to_dicts, get_stack_value, legal_mask
+import metrics
 
 load_dotenv()
 
 backend = os.getenv('BACKEND')
+BOT_DELAY = 0.25  # seconds a bot seat waits before playing, as the threaded bots do
+LEVELS = ('greedy', 'search')  # 'greedy' plays computer.batch's greedy move, 'search' runs computer.search
+BOT_THREAD = 'bot'  # the name of each threaded Bot's thread
+
+metrics.Gauge('whot_bot_threads', 'Live threaded bots',
+              lambda: sum(thread.name == BOT_THREAD for thread in threading.enumerate()))
+
+
+class BotSeat:
+    """
+    An AI player seated directly in a Session as a virtual client.
+
+    Unlike Bot, it needs no thread, event loop or loopback websocket: the
+    session hands it each full state dict as it is broadcast, it reads its
+    hand from the session's GameState, and it submits its move to the
+    session's actor. It has the Connection interface, with the 'object'
+    protocol.
+
+    A 'greedy' seat plays the greedy move after the delay, decided together
+    with the other seats playing in the same loop iteration by
+    computer.batch.greedy_batcher. A 'search' seat runs computer.search on
+    the process pool for up to ``budget`` seconds (half the turn limit at
+    most) and plays once both the search and the delay are done.
+    """
+    
+    protocol = 'object'
+    websocket = None
+    max_queue = 0
+    trace = None  # set by a traced session; the seat has no sends to trace
+    
+    def __init__(self, session, id: str, name: str, delay: float = BOT_DELAY,
+                 level: str = 'greedy', budget: float = SEARCH_BUDGET):
+        self.session = session
+        self.id = id
+        self.name = name
+        self.delay = delay
+        self.level = level if level in LEVELS else 'greedy'
+        self.budget = budget
+        self.queue: deque = deque()  # always empty; states are handled as they arrive
+        self.sent = 0
+        self.moves = 0
+        self.closed = False
+        self.think: deque = deque(maxlen=1024)  # seconds spent choosing each move
+        self.playouts = 0
+        self.search_seconds = 0.0
+        self._pending = None  # the scheduled play, an asyncio.Handle or a search Task
+    
+    @staticmethod
+    async def create_bot(session, level: str = None) -> Optional['BotSeat']:
+        """
+        Seats a new bot in the session, as Bot.create_bot does over a websocket.
+
+        Returns None if every seat is taken or held for a player coming back.
+        """
+        if len(session.clients) + len(session.held) >= session.numPlayers:
+            return None
+        level = level or session.aiLevel
+        while True:  # a free seat exists, so only an id or name clash rerolls
+            id = str(int(random.random()*10000))
+            if id not in session.held and session.has_seat_for(id, f'bot_{id}'):
+                break
+        bot = BotSeat(session, id, f'bot_{id}', level=level)
+        if not await session.add_connection(bot):
+            return None
+        return bot
+    
+    def send(self, text: str, state: bool = False) -> bool:
+        """Status and error frames are for people; a seat only acts on states."""
+        return not self.closed
+    
+    def receive(self, message: dict) -> bool:
+        """Takes a broadcast state and, on its turn, schedules a move."""
+        if self.closed:
+            return False
+        self.sent += 1
+        if message.get('winner') or message.get('turn') != self.id:
+            return True
+        if self._pending:
+            self._pending.cancel()
+        if self.level == 'search':
+            self._pending = asyncio.ensure_future(self.search(self.session.turns_played))
+        else:
+            loop = asyncio.get_running_loop()
+            self._pending = loop.call_later(self.delay, self.play, self.session.turns_played)
+        return True
+    
+    def on_turn(self, seq: int) -> bool:
+        """Whether the state the move was asked for is still the session's."""
+        session, state = self.session, self.session.state
+        return not self.closed and state is not None and session.turns_played == seq \
+            and state.ids[state.turn] == self.id
+    
+    def play(self, seq: int):
+        self._pending = None
+        if not self.on_turn(seq):
+            return
+        state = self.session.state
+        start = time.perf_counter()
+        greedy_batcher.request(state.face_card, list(state.hands[state.turn]),
+                               lambda stack: self.decided(stack, seq, start))
+    
+    def decided(self, stack: list[int], seq: int, start: float):
+        """Plays the stack the greedy batch picked, if the turn is still ours."""
+        self.think.append(time.perf_counter() - start)
+        if self.on_turn(seq):
+            self.submit(stack, seq)
+    
+    async def search(self, seq: int):
+        """Searches for a move off the event loop and plays it after at least the delay."""
+        session, state = self.session, self.session.state
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        budget = min(self.budget, session.timeLimit / 2) if session.timeLimit else self.budget
+        # Only the own hand and the hand sizes go in; the search samples the hidden cards
+        result = await search_move(state.face_card, state.hands[state.turn], state.market, state.turn,
+                                   [len(hand) for hand in state.hands], session.game.engine.rules, budget)
+        self.think.append(result['seconds'])
+        self.playouts += result['playouts']
+        self.search_seconds += result['seconds']
+        await asyncio.sleep(max(0.0, start + self.delay - loop.time()))
+        self._pending = None
+        if self.on_turn(seq):
+            self.submit(result['stack'], seq)
+    
+    def submit(self, stack: list[int], seq: int):
+        self.moves += 1
+        self.session.submit({'stack': cards_to_dicts(stack), 'turn': self.id, 'seq': seq})
+    
+    def stop(self):
+        self.closed = True
+        if self._pending:
+            self._pending.cancel()
+            self._pending = None
+    
+    async def close(self):
+        self.stop()
+    
+    def stats(self) -> dict:
+        stats = {'id': self.id, 'protocol': self.protocol, 'queued': 0, 'sent': self.sent,
+                 'dropped': 0, 'lagging_for': 0.0, 'closed': self.closed, 'moves': self.moves,
+                 'level': self.level}
+        if self.level == 'search':
+            stats['playouts_per_s'] = round(self.playouts / self.search_seconds) if self.search_seconds else 0
+        return stats
+
+
 class Bot:
     
     def __init__(self, host: bool):
@@ -45,7 +197,8 @@ class Bot:
             self.loop.close()
 
     def start(self, session_id: str, host: bool, settings: str = None):
-        self.thread = threading.Thread(target=self.run_in_thread, args=(session_id, host, settings))
+        self.thread = threading.Thread(target=self.run_in_thread, args=(session_id, host, settings),
+                                       name=BOT_THREAD)
         self.thread.start()
 
     def stop(self):
@@ -96,32 +249,33 @@ class Bot:
             return
         
         if 'turn' in move and move['turn'] == id:
-            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == move['turn']][0]
-            d, new_hands, stack = get_a_move(move['face_card'], player[1]['hand'], move['market'])
-            player[1]['hand'] = new_hands
-            rest = [p for p in move['player_cards'] if p['id'] != move['turn']]
-            rest.insert(player[0], player[1])
-            if len(stack) == 0:
-                d['market'] = 1
-            return {
-                'player_cards': rest,
-                'stack': stack,
-                'face_card': move['face_card'] if len(stack) == 0 else stack[-1],
-                'turn': move['turn'],
-                **d
+            player = [p for p in move['player_cards'] if p['id'] == id][0]
+            stack = []
+            if move.get('legal_moves') != 0:
+                hand = cards_from_dicts(player['hand'])
+                _, _, stack = get_a_move(card_from_dict(move['face_card']), hand, move['market'])
+            # The server holds every hand and works out the rest from the stack
+            data = {
+                'stack': cards_to_dicts(stack),
+                'turn': id,
             }
+            if 'turns_played' in move:
+                data['seq'] = move['turns_played']  # lets the server drop it if the state moved on
+            return data
         
     
     
-def get_a_move(face_card: dict, hand_cards: list, market: int):
+def get_a_move(face_card: int, hand_cards: list[int], market: int):
     stack = []
     new_hands = hand_cards
-    for card in sorted(hand_cards, key = lambda x: x['num']):
-        valid_move = is_valid(face_card if len(stack) == 0 else stack[-1], 
-                              card, len(stack) > 0)
-        if valid_move:
+    if not legal_mask(face_card, hand_cards):
+        return get_stack_value(stack, market), new_hands, stack
+    legal = LEGAL_MASKS[False][face_card]
+    for card in sorted(hand_cards, key = CARD_NUM.__getitem__):
+        if legal >> card & 1:
             stack.append(card)
             new_hands.remove(card)
+            legal = LEGAL_MASKS[True][card]
     return get_stack_value(stack, market), new_hands, stack
         
     
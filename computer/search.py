@@ -0,0 +1,265 @@
+"""
+Determinized Monte Carlo tree search, the bot's strong difficulty level.
+
+The hidden hands are unknown to a player, so each search samples a few
+determinizations: the cards it cannot see are dealt at random into hands of
+the sizes the opponents hold, and the rest become the draw pile. Every
+determinization gets its own UCT tree, played out with game.Whot and its
+rule engine, and the move with the most visits over all trees is chosen.
+
+A search is CPU bound, so bots run it with search_move on a process pool
+rather than on the server's event loop.
+"""
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import math
+import multiprocessing
+import os
+import random
+import time
+from typing import Optional
+
+from game import (DECK, LEGAL_MASKS, STANDARD_RULES, DrawPile, GameState, HouseRules, Whot,
+                  is_legal_stack, shuffled_deck)
+
+SEARCH_BUDGET = 1.0  # seconds a search may take per move
+SEARCH_PLAYOUTS = 5000  # most playouts a search runs per move
+SEARCH_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # processes searching at once, across all sessions
+DETERMINIZATIONS = 8  # sampled deals of the hidden cards, each searched with its own tree
+MAX_PLAYOUT_MOVES = 200  # a playout still running after this many moves is scored by hand totals
+EXPLORATION = 1.4  # UCT exploration constant
+
+
+class SimPile(DrawPile):
+    """A draw pile holding the given cards, reshuffling fresh decks from rng once they run out."""
+
+    def __init__(self, cards: list[int], rng: random.Random):
+        self.pool = None
+        self.rng = rng
+        self.cards: deque[int] = deque(cards)
+
+
+def candidate_stacks(face_card: int, hand: list[int]) -> list[tuple[int, ...]]:
+    """
+    The moves worth searching: every legal opening card on its own and
+    followed by all the cards of the same number; going to market only
+    when nothing can be played.
+    """
+    legal = LEGAL_MASKS[False][face_card]
+    stacks = []
+    seen = set()
+    for i, card in enumerate(hand):
+        if not legal >> card & 1 or card in seen:
+            continue
+        seen.add(card)
+        stacks.append((card,))
+        follow = tuple(c for j, c in enumerate(hand) if j != i and LEGAL_MASKS[True][card] >> c & 1)
+        if follow:
+            stacks.append((card,) + follow)
+    return stacks or [()]
+
+
+def playout_stack(face_card: int, hand: list[int], rng: random.Random) -> list[int]:
+    """The playout policy: a random legal opening card followed by the cards of its number."""
+    legal = LEGAL_MASKS[False][face_card]
+    openers = [i for i, card in enumerate(hand) if legal >> card & 1]
+    if not openers:
+        return []
+    i = rng.choice(openers)
+    card = hand[i]
+    return [card] + [c for j, c in enumerate(hand) if j != i and LEGAL_MASKS[True][card] >> c & 1]
+
+
+def can_play(state: GameState, stack: tuple[int, ...]) -> bool:
+    """Whether stack is still playable, which a reshuffled pile can change below the root."""
+    hand = list(state.hands[state.turn])
+    for card in stack:
+        if card not in hand:
+            return False
+        hand.remove(card)
+    return is_legal_stack(state.face_card, stack)
+
+
+def rewards(state: GameState) -> list[float]:
+    """1 for the winner and 0 for the rest; an unfinished game ranks the seats by hand total."""
+    seats = len(state.hands)
+    winner = state.winner()
+    if winner:
+        return [1.0 if name == winner else 0.0 for name in state.names]
+    order = sorted(range(seats), key=state.scores.__getitem__)
+    result = [0.0] * seats
+    for rank, seat in enumerate(order):
+        result[seat] = (seats - 1 - rank) / (seats - 1)
+    return result
+
+
+class Node:
+
+    __slots__ = ('moves', 'children', 'visits', 'reward')
+
+    def __init__(self):
+        self.moves: Optional[list] = None  # untried stacks, filled in on the first visit
+        self.children: dict = {}
+        self.visits = 0
+        self.reward = 0.0  # summed over playouts, for the seat whose move led here
+
+    def select(self, rng: random.Random) -> tuple:
+        log_visits = math.log(self.visits)
+        best, best_score = None, -1.0
+        for stack, child in self.children.items():
+            score = child.reward / child.visits + EXPLORATION * math.sqrt(log_visits / child.visits)
+            if score > best_score or (score == best_score and rng.random() < 0.5):
+                best, best_score = stack, score
+        return best
+
+
+class Determinization:
+    """One sampled deal of the hidden cards and the UCT tree searched over it."""
+
+    def __init__(self, game: Whot, seat: int, face_card: int, hand: list[int], market: int,
+                 hand_counts: list[int], rng: random.Random):
+        self.game = game
+        self.rng = rng
+        self.seat = seat
+        self.face_card = face_card
+        self.market = market
+        unseen = [card for card in DECK if card != face_card]
+        for card in hand:
+            if card in unseen:
+                unseen.remove(card)
+        rng.shuffle(unseen)
+        needed = sum(hand_counts) - hand_counts[seat]
+        while len(unseen) < needed:  # reshuffles put extra decks in play
+            unseen += shuffled_deck(rng)
+        self.hands = []
+        dealt = 0
+        for other, count in enumerate(hand_counts):
+            if other == seat:
+                self.hands.append(list(hand))
+            else:
+                self.hands.append(unseen[dealt:dealt + count])
+                dealt += count
+        self.pile = unseen[dealt:]
+        self.root = Node()
+
+    def start(self):
+        """Sets the game up at the root position."""
+        names = [str(seat) for seat in range(len(self.hands))]
+        state = GameState(names, list(names), [list(hand) for hand in self.hands])
+        state.turn = self.seat
+        state.face_card = self.face_card
+        state.market = self.market
+        self.game.state = state
+        self.game.deck = SimPile(self.pile, self.rng)
+        return state
+
+    def iterate(self):
+        """Selects, expands, plays out and backs up once."""
+        game, rng = self.game, self.rng
+        state = self.start()
+        node, path = self.root, []
+        moves = 0
+        while not state.winner():
+            if node.moves is None:
+                node.moves = candidate_stacks(state.face_card, state.hands[state.turn])
+                rng.shuffle(node.moves)
+            if node.moves:
+                stack = node.moves.pop()
+            else:
+                stack = node.select(rng)
+            if stack is None or not can_play(state, stack):
+                break
+            mover = state.turn
+            game.play(list(stack))
+            moves += 1
+            child = node.children.get(stack)
+            if child is None:
+                child = node.children[stack] = Node()
+                path.append((child, mover))
+                break
+            node = child
+            path.append((node, mover))
+        while not state.winner() and moves < MAX_PLAYOUT_MOVES:
+            game.play(playout_stack(state.face_card, state.hands[state.turn], rng))
+            moves += 1
+        result = rewards(state)
+        self.root.visits += 1
+        for node, mover in path:
+            node.visits += 1
+            node.reward += result[mover]
+
+
+def search(face_card: int, hand: list[int], market: int, seat: int, hand_counts: list[int],
+           rules: HouseRules = STANDARD_RULES, budget: float = SEARCH_BUDGET,
+           playouts: int = SEARCH_PLAYOUTS, seed: Optional[int] = None) -> dict:
+    """
+    Picks a move for the player in ``seat`` by determinized MCTS.
+
+    Parameters
+    ----------
+    face_card : int
+        The card on the table.
+    hand : list[int]
+        The searching player's hand.
+    market : int
+        Cards owed, as in GameState.market.
+    seat : int
+        The searching player's seat; play runs in seat order from there.
+    hand_counts : list[int]
+        How many cards each seat holds, the searching player's included.
+    rules : HouseRules
+        The session's house rules.
+    budget : float
+        Seconds the search may take.
+    playouts : int
+        Most playouts to run.
+    seed : int, optional
+        Seeds the sampling, for repeatable searches.
+
+    Returns
+    -------
+    dict
+        'stack', the cards to play as ints; 'playouts', how many were run;
+        and 'seconds', how long the search took.
+    """
+    start = time.perf_counter()
+    candidates = candidate_stacks(face_card, hand)
+    if len(candidates) == 1 or len(hand_counts) < 2:
+        return {'stack': list(candidates[0]), 'playouts': 0, 'seconds': time.perf_counter() - start}
+    rng = random.Random(seed)
+    game = Whot([], pool=None, rules=rules, rng=rng)
+    trees = [Determinization(game, seat, face_card, hand, market, hand_counts, rng)
+             for _ in range(DETERMINIZATIONS)]
+    deadline = start + budget
+    done = 0
+    while done < playouts and (done % 16 or time.perf_counter() < deadline):
+        trees[done % len(trees)].iterate()
+        done += 1
+    visits = dict.fromkeys(candidates, 0)
+    for tree in trees:
+        for stack, child in tree.root.children.items():
+            visits[stack] += child.visits
+    best = max(candidates, key=visits.__getitem__)
+    return {'stack': list(best), 'playouts': done, 'seconds': time.perf_counter() - start}
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def search_pool() -> ProcessPoolExecutor:
+    """The process pool searches run on, started on first use."""
+    global _pool
+    if _pool is None:
+        # spawn, since forking would copy the server's threads and locks mid-use
+        _pool = ProcessPoolExecutor(SEARCH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+async def search_move(face_card: int, hand: list[int], market: int, seat: int, hand_counts: list[int],
+                      rules: HouseRules = STANDARD_RULES, budget: float = SEARCH_BUDGET,
+                      playouts: int = SEARCH_PLAYOUTS) -> dict:
+    """Runs search on the process pool, leaving the event loop and the GIL free meanwhile."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(search_pool(), search, face_card, list(hand), market, seat,
+                                      list(hand_counts), rules, budget, playouts)
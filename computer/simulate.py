@@ -0,0 +1,317 @@
+"""
+Headless bot-vs-bot games, for tuning bots and house rules offline.
+
+Games run on game.Whot alone, without a Session, websockets or an event
+loop. Each game's RNG is seeded from the batch seed and the game's index, so
+any game can be replayed on its own. Batches of games are spread over a
+process pool, and every game adds one row to a Results table kept as one
+typed array per column, which merges by concatenation and saves compactly.
+
+Seats take the policies in turn, rotated by one seat every game, so no
+policy keeps the first move.
+
+    python -m computer.simulate --games 1000000 --players 4 --policies greedy,random
+    python -m computer.simulate --games 1000000 --policies greedy --lockstep
+    python -m computer.simulate --policies search,greedy --rules '{"pick": {"2": 3}}' --out runs.sim
+"""
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from computer.batch import MIN_BATCH, greedy_stack, greedy_stacks, hand_masks, stack_cards
+from computer.bot import get_a_move
+from computer.search import playout_stack, search
+from game import STANDARD_RULES, HouseRules, Whot
+
+MAX_GAME_MOVES = 1000  # a game with no winner after this many moves counts as a draw
+BATCH_SIZE = 500  # games per process pool task
+SIM_SEARCH_PLAYOUTS = 200  # playouts per 'search' move; searches are capped by playouts, not time
+COLUMNS = (  # (name, array typecode) of each per-game column
+    ('game', 'I'),  # the game's index, which with the seed replays it
+    ('winner', 'b'),  # the winning policy's index, -1 for a draw
+    ('winner_seat', 'b'),  # the winning seat, -1 for a draw
+    ('moves', 'H'),  # moves played, going to market included
+    ('drawn', 'H'),  # cards drawn from the pile after the deal
+)
+
+
+def greedy(game: Whot, rng: random.Random) -> list[int]:
+    state = game.state
+    return get_a_move(state.face_card, list(state.hands[state.turn]), state.market)[2]
+
+
+def random_play(game: Whot, rng: random.Random) -> list[int]:
+    state = game.state
+    return playout_stack(state.face_card, state.hands[state.turn], rng)
+
+
+def search_play(game: Whot, rng: random.Random) -> list[int]:
+    state = game.state
+    return search(state.face_card, state.hands[state.turn], state.market, state.turn,
+                  [len(hand) for hand in state.hands], game.engine.rules, budget=float('inf'),
+                  playouts=SIM_SEARCH_PLAYOUTS, seed=rng.getrandbits(32))['stack']
+
+
+# Policies are passed to workers by name; each picks the stack for the player on turn.
+POLICIES: dict[str, Callable[[Whot, random.Random], list[int]]] = {
+    'greedy': greedy,
+    'random': random_play,
+    'search': search_play,
+}
+
+
+class Results:
+    """One row per game, stored column-wise in typed arrays."""
+
+    def __init__(self, policies: list[str], players: int, seed: int):
+        self.policies = list(policies)
+        self.players = players
+        self.seed = seed
+        self.columns = {name: array(code) for name, code in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns['game'])
+
+    def append(self, *row):
+        for column, value in zip(self.columns.values(), row):
+            column.append(value)
+
+    def extend(self, other: 'Results'):
+        for name, column in self.columns.items():
+            column.extend(other.columns[name])
+
+    def save(self, path: str):
+        """Writes a one-line JSON header and then each column's raw bytes."""
+        header = {'policies': self.policies, 'players': self.players, 'seed': self.seed,
+                  'byteorder': sys.byteorder, 'rows': len(self),
+                  'columns': [[name, column.typecode] for name, column in self.columns.items()]}
+        with open(path, 'wb') as f:
+            f.write(json.dumps(header).encode() + b'\n')
+            for column in self.columns.values():
+                column.tofile(f)
+
+    @classmethod
+    def load(cls, path: str) -> 'Results':
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            results = cls(header['policies'], header['players'], header['seed'])
+            for name, code in header['columns']:
+                column = results.columns[name] = array(code)
+                column.fromfile(f, header['rows'])
+                if header['byteorder'] != sys.byteorder:
+                    column.byteswap()
+        return results
+
+    def seat_games(self) -> list[int]:
+        """How many seats each policy held over all games."""
+        k = len(self.policies)
+        by_offset = [0] * k  # games per rotation offset, game % k
+        for game in self.columns['game']:
+            by_offset[game % k] += 1
+        seats = [0] * k
+        for offset, games in enumerate(by_offset):
+            for seat in range(self.players):
+                seats[(seat + offset) % k] += games
+        return seats
+
+    def summary(self) -> dict:
+        """Win rates per seat held, game lengths and draws over all games."""
+        games = len(self)
+        if not games:
+            return {'games': 0}
+        wins = [0] * len(self.policies)
+        for winner in self.columns['winner']:
+            if winner >= 0:
+                wins[winner] += 1
+        draws = games - sum(wins)
+        moves = sorted(self.columns['moves'])
+        return {
+            'games': games,
+            'players': self.players,
+            'win_rate': {name: round(won / seats, 4) if seats else 0.0
+                         for name, won, seats in zip(self.policies, wins, self.seat_games())},
+            'fair_share': round((games - draws) / games / self.players, 4),
+            'draws': draws,
+            'moves': {'mean': round(sum(moves) / games, 2), 'p50': moves[games // 2],
+                      'p99': moves[min(games - 1, int(games * 0.99))], 'max': moves[-1]},
+            'drawn_per_game': round(sum(self.columns['drawn']) / games, 2),
+        }
+
+
+class SimGame:
+    """One seeded game in progress, with its row's running counts."""
+
+    __slots__ = ('index', 'rng', 'seats', 'policies', 'ids', 'game', 'state', 'moves', 'drawn', 'held')
+
+    def __init__(self, index: int, seed: int, policies: list[str], players: int,
+                 rules: HouseRules = STANDARD_RULES, starting_cards: int = 5):
+        self.index = index
+        self.rng = random.Random((seed << 32) + index)
+        self.seats = [(seat + index) % len(policies) for seat in range(players)]  # policy index per seat
+        self.policies = [policies[policy] for policy in self.seats]
+        self.ids = [str(seat) for seat in range(players)]
+        self.game = Whot([], pool=None, rules=rules, rng=self.rng)
+        self.state = self.game.deal(self.ids, self.ids, starting_cards)
+        self.moves = self.drawn = 0
+        self.held = players * starting_cards
+
+    @property
+    def done(self) -> bool:
+        return bool(self.state.winner()) or self.moves >= MAX_GAME_MOVES
+
+    def policy(self) -> str:
+        """The name of the policy on turn."""
+        return self.policies[self.state.turn]
+
+    def play(self, stack: list[int]):
+        self.game.play(stack)
+        self.moves += 1
+        now = sum(len(hand) for hand in self.state.hands)
+        self.drawn += now - self.held + len(stack)
+        self.held = now
+
+    def row(self) -> tuple:
+        winner = self.state.winner()
+        seat = self.ids.index(winner) if winner else -1
+        return self.index, self.seats[seat] if winner else -1, seat, self.moves, min(self.drawn, 0xFFFF)
+
+
+def play_game(index: int, seed: int, policies: list[str], players: int,
+              rules: HouseRules = STANDARD_RULES, starting_cards: int = 5) -> tuple:
+    """Plays one game to the end and returns its row."""
+    sim = SimGame(index, seed, policies, players, rules, starting_cards)
+    while not sim.done:
+        sim.play(POLICIES[sim.policy()](sim.game, sim.rng))
+    return sim.row()
+
+
+def play_batch(start: int, count: int, seed: int, policies: list[str], players: int,
+               rules: HouseRules = STANDARD_RULES, starting_cards: int = 5) -> Results:
+    results = Results(policies, players, seed)
+    for index in range(start, start + count):
+        results.append(*play_game(index, seed, policies, players, rules, starting_cards))
+    return results
+
+
+def play_lockstep(start: int, count: int, seed: int, policies: list[str], players: int,
+                  rules: HouseRules = STANDARD_RULES, starting_cards: int = 5) -> Results:
+    """
+    play_batch with the games stepped together, so that every greedy seat on
+    turn is decided by one computer.batch.greedy_stacks call per step, or one
+    by one once fewer than MIN_BATCH of them are left. The games are move for
+    move those of play_batch.
+    """
+    sims = [SimGame(index, seed, policies, players, rules, starting_cards)
+            for index in range(start, start + count)]
+    active = [sim for sim in sims if not sim.done]
+    while active:
+        greedy = []
+        for sim in active:
+            if sim.policy() == 'greedy':
+                greedy.append(sim)
+            else:
+                sim.play(POLICIES[sim.policy()](sim.game, sim.rng))
+        if len(greedy) < MIN_BATCH:
+            for sim in greedy:
+                sim.play(greedy_stack(sim.state.face_card, sim.state.hands[sim.state.turn]))
+        else:
+            faces = np.fromiter((sim.state.face_card for sim in greedy), dtype=np.int64, count=len(greedy))
+            hands = [sim.state.hands[sim.state.turn] for sim in greedy]
+            nums, legal = greedy_stacks(faces, hand_masks(hands))
+            for sim, hand, num, mask in zip(greedy, hands, nums.tolist(), legal.tolist()):
+                sim.play(stack_cards(num, mask, hand))
+        active = [sim for sim in active if not sim.done]
+    results = Results(policies, players, seed)
+    for sim in sims:
+        results.append(*sim.row())
+    return results
+
+
+def simulate(games: int, policies: list[str], players: int = 4, seed: int = 0,
+             rules: HouseRules = STANDARD_RULES, starting_cards: int = 5,
+             workers: Optional[int] = None, batch: int = BATCH_SIZE, lockstep: bool = False) -> Results:
+    """
+    Plays ``games`` games between the named policies.
+
+    Parameters
+    ----------
+    games : int
+        How many games to play.
+    policies : list[str]
+        Names from POLICIES, handed out to the seats in turn.
+    players : int
+        Seats per game.
+    seed : int
+        Seeds every game's RNG along with its index.
+    rules : HouseRules
+        The house rules to play by.
+    starting_cards : int
+        Cards dealt to each seat.
+    workers : int, optional
+        Processes to spread the games over; all cores by default, and 1
+        plays in this process.
+    batch : int
+        Games per process pool task.
+    lockstep : bool
+        Whether to step each batch's games together and decide their greedy
+        seats with NumPy, see play_lockstep.
+
+    Returns
+    -------
+    Results
+        One row per game, in game order.
+    """
+    unknown = [name for name in policies if name not in POLICIES]
+    if unknown:
+        raise ValueError(f'Unknown policies {unknown}, expected some of {list(POLICIES)}')
+    results = Results(policies, players, seed)
+    starts = range(0, games, batch)
+    counts = [min(batch, games - start) for start in starts]
+    args = (seed, list(policies), players, rules, starting_cards)
+    play = play_lockstep if lockstep else play_batch
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for start, count in zip(starts, counts):
+            results.extend(play(start, count, *args))
+        return results
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(play, start, count, *args) for start, count in zip(starts, counts)]
+        for future in futures:
+            results.extend(future.result())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--policies', default='greedy,random', help=f'comma separated, of {list(POLICIES)}')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cards', type=int, default=5, help='starting cards per seat')
+    parser.add_argument('--rules', help='house rules as JSON, as in the houseRules session setting')
+    parser.add_argument('--workers', type=int, help='processes to use, all cores by default')
+    parser.add_argument('--out', help='save the per-game columns to this file')
+    parser.add_argument('--lockstep', action='store_true', help='decide greedy seats in NumPy batches')
+    args = parser.parse_args()
+
+    rules = HouseRules.from_dict(json.loads(args.rules)) if args.rules else STANDARD_RULES
+    start = time.perf_counter()
+    results = simulate(args.games, args.policies.split(','), args.players, args.seed, rules,
+                       args.cards, args.workers, lockstep=args.lockstep)
+    elapsed = time.perf_counter() - start
+    if args.out:
+        results.save(args.out)
+    print(json.dumps({**results.summary(), 'games_per_s': round(len(results) / elapsed)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,12 @@
-from pydantic import BaseModel
+from collections import deque
+from dataclasses import dataclass, field
+from operator import itemgetter
+import queue
 import random
-import json_fix
+import threading
+from typing import Optional
 
 
-
-class Card(BaseModel):
-    shape: str
-    num: int
-    
-    def __json__(self):
-        return self.__dict__
-    
-    def __getitem__(self, val):
-        return self.__dict__.get(val, None)
-    
-    
 deck_dict = {
     'cross': [1, 2, 3, 5, 7, 10, 11, 13, 14],
     'square': [1, 2, 3, 5, 7, 10, 11, 13, 14],
@@ -23,188 +15,421 @@ deck_dict = {
     'star': [1, 2, 3, 4, 5, 7, 8]
 }
 
-class Whot:
+# Cards are plain ints indexing these tables; {shape, num} dicts only exist on the wire.
+CARD_SHAPE: tuple[str, ...] = tuple(shape for shape, nums in deck_dict.items() for _ in nums)
+CARD_NUM: tuple[int, ...] = tuple(num for nums in deck_dict.values() for num in nums)
+CARD_IDS: dict[tuple[str, int], int] = {
+    (shape, num): i for i, (shape, num) in enumerate(zip(CARD_SHAPE, CARD_NUM))
+}
+DECK: tuple[int, ...] = tuple(range(len(CARD_NUM)))
+WHOT = 20
+ACTIONS = frozenset((1, 2, 5, 8, 14, WHOT))
+
+
+def hand_score(cards: list[int]) -> int:
+    total = 0
+    for card in cards:
+        total += CARD_NUM[card]
+    return total
+
+
+def card_to_dict(card: int) -> dict:
+    return {'shape': CARD_SHAPE[card], 'num': CARD_NUM[card]}
+
+
+def card_from_dict(card) -> int:
+    return CARD_IDS[(card['shape'], card['num'])]
+
+
+def cards_to_dicts(cards: list[int]) -> list[dict]:
+    return [{'shape': CARD_SHAPE[c], 'num': CARD_NUM[c]} for c in cards]
+
+
+def cards_from_dicts(cards: list) -> list[int]:
+    return [CARD_IDS[(c['shape'], c['num'])] for c in cards]
+
+
+def shuffled_deck(rng: random.Random = random) -> list[int]:
+    cards = list(DECK)
+    rng.shuffle(cards)
+    return cards
+
+
+def seeded_deck(seed: int) -> list[int]:
+    """The deck a seed shuffles to, so a journal can record a deck as 8 bytes."""
+    return shuffled_deck(random.Random(seed))
+
+
+class DeckPool:
+    """
+    A queue of pre-shuffled decks kept topped up by a background thread, so
+    starting a game or reshuffling never builds a deck on the event loop.
     
-    def __init__(self, clients):
-        self.clients = clients
-        self.deck = self.create_starting_deck()
-        self.market: list[Card] = self.create_starting_deck()
-        self.current_turn_index: int = 0
+    Each deck is shuffled from a seed of its own, which get_seeded hands out
+    with it, so a session's journal can replay its decks.
+    """
+    
+    def __init__(self, size: int = 32):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._decks: queue.Queue = queue.Queue(maxsize=size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._fill, name='deck-pool', daemon=True)
+                self._thread.start()
+                
+    def _fill(self):
+        rng = random.Random()
+        while True:
+            seed = rng.getrandbits(64)
+            self._decks.put((seed, seeded_deck(seed)))
+            
+    def get(self) -> list[int]:
+        return self.get_seeded()[1]
+    
+    def get_seeded(self) -> tuple[int, list[int]]:
+        """A deck and the seed it was shuffled from."""
+        if self._thread is None:
+            self.start()
+        try:
+            seeded = self._decks.get_nowait()
+            self.hits += 1
+        except queue.Empty:
+            seed = random.getrandbits(64)
+            seeded = (seed, seeded_deck(seed))
+            self.misses += 1
+        return seeded
+    
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            'size': self.size,
+            'available': self._decks.qsize(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+        }
         
+
+deck_pool = DeckPool()
+
+
+class ReplayPool:
+    """Stands in for a DeckPool to deal the decks of recorded seeds again, in order."""
+    
+    def __init__(self, seeds=()):
+        self.seeds: deque[int] = deque(seeds)
         
-    def create_starting_deck(self):
-        cards: list[Card] = []
-        for shape, nums in deck_dict.items():
-            shape_cards = [Card(shape=shape, num=num) for num in nums]
-            cards += shape_cards
-        random.shuffle(cards)
-        return cards
+    def get(self) -> list[int]:
+        return self.get_seeded()[1]
     
+    def get_seeded(self) -> tuple[int, list[int]]:
+        seed = self.seeds.popleft()
+        return seed, seeded_deck(seed)
+
+
+class DrawPile:
+    """Face-down cards drawn from the front and returned to the back, both O(1)."""
     
-    def distribute_cards(self, num_players: int, num_starting_cards: int):
-        hands = [self.generate_hand(num_starting_cards) for _ in range(num_players)]
-        return hands
-            
-    def generate_hand(self, n: int, no_action: bool = False) -> list[Card]:
-        actions = [1, 2, 5, 8, 14, 20]
+    def __init__(self, pool: Optional[DeckPool] = None, rng: random.Random = random,
+                 cards: Optional[list[int]] = None):
+        self.pool = pool
+        self.rng = rng  # shuffles the decks when there is no pool
+        self.seeds: list[int] = []  # the seed of every deck taken from the pool, in order
+        self.cards: deque[int] = deque(self.new_deck() if cards is None else cards)
+        
+    def __len__(self):
+        return len(self.cards)
+    
+    def __iter__(self):
+        return iter(self.cards)
+        
+    def new_deck(self) -> list[int]:
+        if not self.pool:
+            return shuffled_deck(self.rng)
+        seed, deck = self.pool.get_seeded()
+        self.seeds.append(seed)
+        return deck
+    
+    def draw(self, n: int, no_action: bool = False) -> list[int]:
         hand = []
+        cards = self.cards
         while True:
-            if n >= len(self.deck):
-                self.deck = self.create_starting_deck()
+            if n >= len(cards):
+                cards = self.cards = deque(self.new_deck())
                 
             if len(hand) == n:
                 break
             
-            card = self.deck.pop(0)
-            if no_action and card.num in actions:
-                self.deck.append(card)
+            card = cards.popleft()
+            if no_action and CARD_NUM[card] in ACTIONS:
+                cards.append(card)
                 continue
             hand.append(card)
         return hand
+
+
+@dataclass
+class HouseRules:
+    """Which card numbers trigger each effect, and how strongly."""
+    pick: dict[int, int] = field(default_factory=lambda: {2: 2, 5: 3})  # cards drawn per card stacked
+    suspension: dict[int, int] = field(default_factory=lambda: {8: 1})  # players skipped per card
+    general_market: dict[int, int] = field(default_factory=lambda: {14: 1})  # cards each opponent draws
+    hold_on: frozenset = frozenset({1})
     
-    def get_starting_card(self) -> Card:
-        card = self.generate_hand(1, no_action=True)[0]
-        return card
+    @classmethod
+    def from_dict(cls, data: dict) -> 'HouseRules':
+        """Builds rules from JSON settings, where card numbers arrive as string keys."""
+        rules = cls()
+        for effect in ('pick', 'suspension', 'general_market'):
+            if effect in data:
+                setattr(rules, effect, {int(num): int(n) for num, n in data[effect].items()})
+        if 'hold_on' in data:
+            rules.hold_on = frozenset(int(num) for num in data['hold_on'])
+        return rules
+
+
+STANDARD_RULES = HouseRules()
+
+
+class GameState:
+    """
+    The seats of one game, stored by position with an id -> seat index.
     
-    def process_game_move(self, move):
-        if move['face_card']['num'] in [2, 5] and move['market'] > 1:
-            if move['failed_defense']:
-                turn = move['turn']
-            else:
-                next_turn = self.get_next_turn()
-                turn = next_turn
-            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
-            rest = [p for p in move['player_cards'] if p['id'] != turn]
-            defence = list(filter(lambda x: x['num'] in [move['face_card']['num'], 20] ,player[1]['hand']))
-            cannot_defend = len(defence) == 0
-            if cannot_defend or move['failed_defense']:
-                # Add cards to player since cant defend
-                cards = self.generate_hand(move['market'])
-                player[1]['hand'] += cards
-                # Now skip turn
-                next_turn = self.get_next_turn()
-                turn = next_turn
-            rest.insert(player[0], player[1])
-            return {
-                'player_cards': rest,
-                'face_card': move['face_card'],
-                'turn': turn,
-                'market': 0 if (cannot_defend or move['failed_defense']) else move['market'],
-                'winner': self.get_winner(rest),
-                'rankings': self.rank_players(rest)
-            }
-                
-        if move['face_card']['num'] == 14 and move['market'] != 1: # Gen market (if only 1, market is 0 otherwise the amount stacked)
-            turn = move['turn']
-            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
-            rest = [p for p in move['player_cards'] if p['id'] != turn]
-            for i in range(len(rest)):
-                cards = self.generate_hand(1 if move['market'] == 0 else move['market'])
-                rest[i]['hand'] += cards
-            rest.insert(player[0], player[1])
-            return {
-                'player_cards': rest,
-                'face_card': move['face_card'],
-                'turn': turn,
-                'market': 0,
-                'winner': self.get_winner(rest),
-                'rankings': self.rank_players(rest)
-            }
-            
-        if move['face_card']['num'] == 14 and move['market'] == 1: # After gen market, cant play
-            turn = move['turn']
-            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
-            rest = [p for p in move['player_cards'] if p['id'] != turn]
-            cards = self.generate_hand(move['market'])
-            player[1]['hand'] += cards
-            rest.insert(player[0], player[1])
-            next_turn = self.get_next_turn()
-            turn = next_turn
-            return {
-                'player_cards': rest,
-                'face_card': move['face_card'],
-                'turn': turn,
-                'market': 0,
-                'winner': self.get_winner(rest),
-                'rankings': self.rank_players(rest)
-            }
-            
-        if move['face_card']['num'] == 8 and move['market'] == 0: # Skip next player(s) simple
-            for _ in range(move['turns_to_skip']):
-                next_turn = self.get_next_turn()
-            turn = next_turn
-            return {
-                'player_cards': move['player_cards'],
-                'face_card': move['face_card'],
-                'turn': turn,
-                'market': 0,
-                'winner': self.get_winner(move['player_cards']),
-                'rankings': self.rank_players(move['player_cards'])
-            }
-            
-        if move['face_card']['num'] == 8 and move['market'] == 1: # next player after the skipped, cant play
-            turn = move['turn']
-            cards = self.generate_hand(move['market'])
-            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
-            rest = [p for p in move['player_cards'] if p['id'] != turn]
-            player[1]['hand'] += cards
-            rest.insert(player[0], player[1])
-            next_turn = self.get_next_turn()
-            turn = next_turn
-            return {
-                'player_cards': rest,
-                'face_card': move['face_card'],
-                'turn': turn,
-                'market': 0,
-                'winner': self.get_winner(rest),
-                'rankings': self.rank_players(rest)
-            }
-            
-        if move['face_card']['num'] == 1 and move['market'] == 0:
-            return {
-                'player_cards': move['player_cards'],
-                'face_card': move['face_card'],
-                'turn': move['turn'],
-                'market': 0,
-                'winner': self.get_winner(move['player_cards']),
-                'rankings': self.rank_players(move['player_cards'])
-            }
+    Hand scores, the winner and the rankings are kept up to date as cards move
+    through give/take, so no per-move work has to walk every hand.
+    """
+    
+    __slots__ = ('ids', 'names', 'hands', 'seat_of', 'turn', 'face_card', 'market',
+                 'scores', 'winner_name', '_rankings', 'log')
+    
+    def __init__(self, ids: list, names: list, hands: list[list[int]]):
+        self.ids = ids
+        self.names = names
+        self.hands = hands
+        self.seat_of = {player_id: seat for seat, player_id in enumerate(ids)}
+        self.turn = 0
+        self.face_card = 0
+        self.market = 0
+        self.log: Optional[list] = None  # (seat, added, cards) per hand change while set to a list
+        self.rescore()
+        
+    @classmethod
+    def from_players(cls, player_cards: list) -> 'GameState':
+        return cls([p['id'] for p in player_cards],
+                   [p['name'] for p in player_cards],
+                   [p['hand'] for p in player_cards])
+    
+    def rescore(self):
+        """Recomputes scores and the winner after hands were replaced wholesale."""
+        self.scores = [hand_score(hand) for hand in self.hands]
+        self.winner_name = self._first_empty()
+        self._rankings = None
+        
+    def _first_empty(self) -> str:
+        return next((name for name, hand in zip(self.names, self.hands) if not hand), '')
+    
+    def next_seat(self, seat: int) -> int:
+        return (seat + 1) % len(self.ids)
+    
+    def give(self, seat: int, cards: list[int]):
+        hand = self.hands[seat]
+        was_empty = not hand
+        hand.extend(cards)
+        if self.log is not None:
+            self.log.append((seat, True, cards))
+        self.scores[seat] += hand_score(cards)
+        if was_empty and cards:
+            self.winner_name = self._first_empty()
+        self._rankings = None
+        
+    def take(self, seat: int, cards: list[int]):
+        hand = self.hands[seat]
+        for card in cards:
+            hand.remove(card)
+            self.scores[seat] -= CARD_NUM[card]
+        if self.log is not None:
+            self.log.append((seat, False, cards))
+        if not hand:
+            self.winner_name = self._first_empty()
+        self._rankings = None
+    
+    def remove(self, player_id) -> bool:
+        """Drops a departed player's seat; the turn stays with whoever held it or moves on."""
+        seat = self.seat_of.get(player_id)
+        if seat is None:
+            return False
+        del self.ids[seat]
+        del self.names[seat]
+        del self.hands[seat]
+        del self.scores[seat]
+        self.winner_name = self._first_empty()
+        self.seat_of = {player_id: seat for seat, player_id in enumerate(self.ids)}
+        if seat < self.turn:
+            self.turn -= 1
+        if self.turn >= len(self.ids):
+            self.turn = 0
+        self._rankings = None
+        return True
+    
+    def winner(self) -> str:
+        if len(self.ids) == 1:
+            return self.names[0]
+        return self.winner_name
+    
+    def rankings(self) -> list:
+        """[score, name] pairs, lowest first; rebuilt only after a hand changes."""
+        if self._rankings is None:
+            self._rankings = sorted(([score, name] for score, name in zip(self.scores, self.names)),
+                                    key=itemgetter(0))
+        return self._rankings
+
+
+# Card effects and market states index the rule engine's dispatch table.
+PLAIN, PICK, GENERAL_MARKET, SUSPENSION, HOLD_ON = range(5)
+NO_MARKET, GO_MARKET, STACKED_MARKET = range(3)
+
+
+class RuleEngine:
+    """
+    Resolves a move with a handler looked up by (face card effect, market state).
+    
+    market is 0 when nothing is owed, 1 when the mover went to market and more
+    than 1 when pick cards have been stacked. Any pair without its own handler
+    makes the mover draw market cards and passes the turn on.
+    """
+    
+    def __init__(self, rules: HouseRules = STANDARD_RULES):
+        self.rules = rules
+        effect_of_num = {num: HOLD_ON for num in rules.hold_on}
+        effect_of_num.update({num: SUSPENSION for num in rules.suspension})
+        effect_of_num.update({num: GENERAL_MARKET for num in rules.general_market})
+        effect_of_num.update({num: PICK for num in rules.pick})
+        self.effect = tuple(effect_of_num.get(CARD_NUM[card], PLAIN) for card in DECK)
+        
+        handlers = {
+            (PICK, STACKED_MARKET): self.pick,
+            (GENERAL_MARKET, NO_MARKET): self.general_market,
+            (GENERAL_MARKET, STACKED_MARKET): self.general_market,
+            (SUSPENSION, NO_MARKET): self.suspend,
+            (HOLD_ON, NO_MARKET): self.hold_on,
+        }
+        self.table = tuple(
+            tuple(handlers.get((effect, market), self.draw) for market in range(3))
+            for effect in range(5)
+        )
+        
+    def apply(self, state: GameState, move: dict, deck: DrawPile):
+        market = move['market']
+        self.table[self.effect[move['face_card']]][2 if market > 1 else market](state, move, deck)
+        
+    def draw(self, state: GameState, move: dict, deck: DrawPile):
+        state.give(state.turn, deck.draw(move['market']))
+        state.turn = state.next_seat(state.turn)
+        state.market = 0
         
-        if move['face_card']['num'] == 1 and move['market'] == 1:
-            turn = move['turn']
-            cards = self.generate_hand(move['market'])
-            player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
-            rest = [p for p in move['player_cards'] if p['id'] != turn]
-            player[1]['hand'] += cards
-            rest.insert(player[0], player[1])
-            next_turn = self.get_next_turn()
-            turn = next_turn
-            return {
-                'player_cards': rest,
-                'face_card': move['face_card'],
-                'turn': turn,
-                'market': 0,
-                'winner': self.get_winner(rest),
-                'rankings': self.rank_players(rest)
-            }
+    def pick(self, state: GameState, move: dict, deck: DrawPile):
+        # The mover failed to defend, otherwise the next player must defend or draw
+        seat = state.turn if move['failed_defense'] else state.next_seat(state.turn)
+        defence = (CARD_NUM[move['face_card']], WHOT)
+        can_defend = any(CARD_NUM[card] in defence for card in state.hands[seat])
+        if can_defend and not move['failed_defense']:
+            state.turn = seat
+            state.market = move['market']
+            return
+        state.give(seat, deck.draw(move['market']))
+        state.turn = state.next_seat(seat)
+        state.market = 0
         
-             
-        turn = move['turn']
-        cards = self.generate_hand(move['market'])
-        player = [(i, p) for (i, p) in enumerate(move['player_cards']) if p['id'] == turn][0]
-        rest = [p for p in move['player_cards'] if p['id'] != turn]
-        player[1]['hand'] += cards
-        rest.insert(player[0], player[1])
-        next_turn = self.get_next_turn()
-        turn = next_turn
+    def general_market(self, state: GameState, move: dict, deck: DrawPile):
+        n = move['market'] or self.rules.general_market[CARD_NUM[move['face_card']]]
+        for seat in range(len(state.ids)):
+            if seat != state.turn:
+                state.give(seat, deck.draw(n))
+        state.market = 0
+        
+    def suspend(self, state: GameState, move: dict, deck: DrawPile):
+        for _ in range(move['turns_to_skip']):
+            state.turn = state.next_seat(state.turn)
+        state.market = 0
+        
+    def hold_on(self, state: GameState, move: dict, deck: DrawPile):
+        state.market = 0
+
+
+class Whot:
+    
+    def __init__(self, clients, pool: Optional[DeckPool] = deck_pool, rules: HouseRules = STANDARD_RULES,
+                 rng: random.Random = random, deck: Optional[DrawPile] = None):
+        self.clients = clients
+        self.rng = rng
+        self.deck = deck if deck is not None else DrawPile(pool, rng)
+        self.engine = RuleEngine(rules)
+        self.state: Optional[GameState] = None
+        
+        
+    def create_starting_deck(self) -> list[int]:
+        return shuffled_deck(self.rng)
+    
+    
+    def distribute_cards(self, num_players: int, num_starting_cards: int):
+        hands = [self.generate_hand(num_starting_cards) for _ in range(num_players)]
+        return hands
             
+    def generate_hand(self, n: int, no_action: bool = False) -> list[int]:
+        return self.deck.draw(n, no_action)
+    
+    def get_starting_card(self) -> int:
+        card = self.generate_hand(1, no_action=True)[0]
+        return card
+    
+    def deal(self, ids: list, names: list, num_starting_cards: int) -> GameState:
+        """Starts the server-held state: one hand per seat and a face card."""
+        state = self.state = GameState(list(ids), list(names),
+                                       self.distribute_cards(len(ids), num_starting_cards))
+        state.face_card = self.get_starting_card()
+        return state
+    
+    def play(self, stack: list[int]) -> dict:
+        """
+        Plays stack from the hand of the player on turn and resolves it.
+        
+        An empty stack means going to market, or failing to defend when a
+        pick is pending. Returns the stack value the move was resolved with.
+        """
+        state = self.state
+        state.take(state.turn, stack)
+        value = get_stack_value(stack, state.market, self.engine.rules)
+        if not stack and not value['failed_defense']:
+            value['market'] = 1
+        if stack:
+            state.face_card = stack[-1]
+        self.engine.apply(state, {'face_card': state.face_card, **value}, self.deck)
+        return value
+    
+    def process_game_move(self, move):
+        players = move['player_cards']
+        state = self.state
+        if state is None or [p['id'] for p in players] != state.ids:
+            state = self.state = GameState.from_players(players)
+        else:
+            state.hands = [p['hand'] for p in players]
+            state.rescore()
+        state.turn = state.seat_of[move['turn']]
+        state.face_card = move['face_card']
+        self.engine.apply(state, move, self.deck)
         return {
-            'player_cards': rest,
+            'player_cards': players,
             'face_card': move['face_card'],
-            'turn': turn,
-            'market': 0,
-            'winner': self.get_winner(rest),
-            'rankings': self.rank_players(rest)
+            'turn': state.ids[state.turn],
+            'market': state.market,
+            'winner': state.winner(),
+            'rankings': state.rankings()
         }
             
     
@@ -221,65 +446,108 @@ class Whot:
         for player in players:
             total = 0
             for card in player['hand']:
-                total += dict(card)['num']
+                total += CARD_NUM[card]
             data.append([total, player['name']])
         return sorted(data, key = lambda x: x[0])
     
-    def get_next_turn(self):
-        self.current_turn_index = (self.current_turn_index + 1) % len(self.clients)
-        return self.clients[self.current_turn_index][1]
     
     
-    
-def is_valid(face_card: dict, to_play: dict, has_played: bool) -> bool:
-    # Special case: Whot card (represented by shape 20) can be played on any card
-    if to_play['shape'] == 20:
+def _rule_is_valid(face_card: int, to_play: int, has_played: bool) -> bool:
+    to_play_num = CARD_NUM[to_play]
+    face_num = CARD_NUM[face_card]
+
+    # Special case: Whot card (20) can be played on any card
+    if to_play_num == WHOT:
         return True
 
     if has_played:
-        if to_play['num'] == face_card['num']:
+        if to_play_num == face_num:
             return True
         return False
 
     # Match by shape
-    if to_play['shape'] == face_card['shape']:
+    if CARD_SHAPE[to_play] == CARD_SHAPE[face_card]:
         return True
 
     # Match by number
-    if to_play['num'] == face_card['num']:
+    if to_play_num == face_num:
         return True
 
     # Special cards logic
-    if face_card['num'] == 1:  # Pick One
-        return to_play['num'] == 1
-    elif face_card['num'] == 2:  # Pick Two
-        return to_play['num'] == 2
-    elif face_card['num'] == 5:  # Pick Three
-        return to_play['num'] == 5
-    elif face_card['num'] == 8:  # Suspension
-        return to_play['num'] == 8
-    elif face_card['num'] == 14:  # General Market
-        return to_play['num'] == 14
+    if face_num == 1:  # Pick One
+        return to_play_num == 1
+    elif face_num == 2:  # Pick Two
+        return to_play_num == 2
+    elif face_num == 5:  # Pick Three
+        return to_play_num == 5
+    elif face_num == 8:  # Suspension
+        return to_play_num == 8
+    elif face_num == 14:  # General Market
+        return to_play_num == 14
 
     # If none of the above conditions are met, the card is not valid
     return False
 
 
-def get_stack_value(stack: list, market: int) -> dict:
+# LEGAL_MASKS[has_played][face_card] has bit c set when card c may be played on face_card.
+LEGAL_MASKS: tuple[tuple[int, ...], tuple[int, ...]] = tuple(
+    tuple(
+        sum(1 << card for card in DECK if _rule_is_valid(face, card, has_played))
+        for face in DECK
+    )
+    for has_played in (False, True)
+)
+
+
+def is_valid(face_card: int, to_play: int, has_played: bool) -> bool:
+    return LEGAL_MASKS[has_played][face_card] >> to_play & 1 == 1
+
+
+def hand_mask(hand: list[int]) -> int:
+    mask = 0
+    for card in hand:
+        mask |= 1 << card
+    return mask
+
+
+def legal_mask(face_card: int, hand: list[int], has_played: bool = False) -> int:
+    """Bitmask of the card ids in hand that may be played on face_card."""
+    return hand_mask(hand) & LEGAL_MASKS[has_played][face_card]
+
+
+def legal_positions(face_card: int, hand: list[int]) -> int:
+    """Bitmask of the positions in hand that may open a stack on face_card."""
+    legal = LEGAL_MASKS[False][face_card]
+    mask = 0
+    for i, card in enumerate(hand):
+        if legal >> card & 1:
+            mask |= 1 << i
+    return mask
+
+
+def is_legal_stack(face_card: int, stack: list[int]) -> bool:
+    top, has_played = face_card, False
+    for card in stack:
+        if not LEGAL_MASKS[has_played][top] >> card & 1:
+            return False
+        top, has_played = card, True
+    return True
+
+
+def get_stack_value(stack: list[int], market: int, rules: HouseRules = STANDARD_RULES) -> dict:
     value = 0
     turns_to_skip = 1
     failed_defense = False
     card = stack[0] if len(stack) > 0 else None
     
-    if card:
-        if card['num'] == 2:
-            value = 2 * len(stack)
-        elif card['num'] == 5:
-            value = 3 * len(stack)
-        elif card['num'] == 14:
-            value = 0 if len(stack) == 1 else (1 * len(stack))
-        elif card['num'] == 8:
-            turns_to_skip = 1 * len(stack)
+    if card is not None:
+        num = CARD_NUM[card]
+        if num in rules.pick:
+            value = rules.pick[num] * len(stack)
+        elif num in rules.general_market:
+            value = 0 if len(stack) == 1 else (rules.general_market[num] * len(stack))
+        elif num in rules.suspension:
+            turns_to_skip = rules.suspension[num] * len(stack)
 
     if len(stack) == 0 and market > 0:
         failed_defense = True
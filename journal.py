@@ -0,0 +1,270 @@
+"""
+An append-only journal of every session's inputs, for rebuilding the sessions after a restart.
+
+A session journals what it cannot work out again: its settings, the seats
+that join and leave, the deal, the seed of every deck its draw pile takes
+(see DeckPool.get_seeded) and each move it applies. Replaying those through
+the engine rebuilds its game exactly.
+
+Records are binary: a CRC32, the record kind, the session id and the payload
+length, followed by the payload. A move is its sequence number and one byte
+per card, so most records are around 20 bytes; the rare ones (settings,
+seats, the deal) carry JSON. ``append`` only queues a record: a writer
+thread encodes what is queued every JOURNAL_FSYNC seconds, writes it as one
+batch and fsyncs it, so no move waits for the disk and at most the last
+JOURNAL_FSYNC seconds of moves are lost in a crash.
+
+Every SNAPSHOT_RECORDS records the journal takes a snapshot of every live
+session and starts a new segment, after which the older files are deleted:
+
+    snapshot-<n>.bin  the sessions as they were when segment n began
+    journal-<n>.log   the records appended since
+
+Recovery reads the newest snapshot and replays its segment, stopping at the
+first torn or corrupt record. Journaling is off unless JOURNAL_DIR is set.
+"""
+from collections import deque
+import json
+import os
+import struct
+import threading
+import time
+from typing import Callable, Iterator, Optional
+import zlib
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+JOURNAL_DIR = os.getenv('JOURNAL_DIR', '')  # where each shard keeps its journal; journaling is off if empty
+JOURNAL_FSYNC = float(os.getenv('JOURNAL_FSYNC', 0.05))  # seconds between the writer's batched write and fsync
+SNAPSHOT_RECORDS = int(os.getenv('SNAPSHOT_RECORDS', 100000))  # records between snapshots
+
+# Record kinds
+SETTINGS = 1  # a new session's settings
+JOIN = 2  # [client id, name, 'player' or a bot's level] of a seated client
+LEAVE = 3  # the id of a client that gave up its seat
+START = 4  # [ids, names] of the seats dealt in
+DECK_SEED = 5  # the seed of a deck the session's draw pile took
+MOVE = 6  # (sequence number, cards) of an applied move
+REMOVE = 7  # the id of a player whose seat left the game
+END = 8  # the session is over and need not be recovered
+SNAPSHOT = 9  # a whole session, see Session.journal_snapshot
+
+CRC = struct.Struct('<I')
+HEADER = struct.Struct('<BII')  # kind, session id, payload length
+SEED = struct.Struct('<Q')
+SEQ = struct.Struct('<I')
+
+
+def encode_payload(kind: int, value) -> bytes:
+    if kind == MOVE:
+        seq, cards = value
+        return SEQ.pack(seq) + bytes(cards)
+    if kind == DECK_SEED:
+        return SEED.pack(value)
+    if kind == END:
+        return b''
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def decode_payload(kind: int, payload: bytes):
+    if kind == MOVE:
+        return SEQ.unpack_from(payload)[0], list(payload[SEQ.size:])
+    if kind == DECK_SEED:
+        return SEED.unpack(payload)[0]
+    if kind == END:
+        return None
+    return json.loads(payload)
+
+
+def encode_record(kind: int, session_id: int, value) -> bytes:
+    payload = encode_payload(kind, value)
+    body = HEADER.pack(kind, session_id, len(payload)) + payload
+    return CRC.pack(zlib.crc32(body)) + body
+
+
+def read_records(path: str) -> Iterator[tuple]:
+    """
+    Yields the (kind, session id, value) records of a journal file.
+
+    Stops at the first record that is cut short or fails its CRC, as the
+    tail of a file the process died writing is.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset, end = 0, len(data)
+    start = CRC.size + HEADER.size
+    while offset + start <= end:
+        kind, session_id, length = HEADER.unpack_from(data, offset + CRC.size)
+        stop = offset + start + length
+        if stop > end or zlib.crc32(data[offset + CRC.size:stop]) != CRC.unpack_from(data, offset)[0]:
+            return
+        yield kind, session_id, decode_payload(kind, data[offset + start:stop])
+        offset = stop
+
+
+class Journal:
+    """
+    One process's journal: a writer thread and the segment it appends to.
+
+    Attributes
+    ----------
+    directory : str
+        Where the snapshots and segments are kept.
+    segment : int
+        The segment records are appended to.
+    sessions : callable
+        Returns the snapshot of every live session, as a list of
+        (session id, snapshot) pairs; set by SessionsManager.
+    """
+
+    def __init__(self, directory: str, interval: float = JOURNAL_FSYNC,
+                 snapshot_records: int = SNAPSHOT_RECORDS):
+        self.directory = directory
+        self.interval = interval
+        self.snapshot_records = snapshot_records
+        self.segment = 0
+        self.sessions: Callable[[], list] = list
+        self.pending: deque = deque()  # (kind, session id, value) appended and not yet written
+        self.appended = 0
+        self.written = 0
+        self.bytes = 0
+        self.batches = 0
+        self.since_snapshot = 0
+        self._snapshot_due = False
+        self._loop = None
+        self._file = None
+        self._lock = threading.Lock()  # held by whoever is writing a batch
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, kind: str, segment: int) -> str:
+        return os.path.join(self.directory, f'{kind}-{segment:08d}.' + ('bin' if kind == 'snapshot' else 'log'))
+
+    def segments(self) -> list:
+        """The segments with a snapshot on disk, oldest first."""
+        return sorted(int(name[9:17]) for name in os.listdir(self.directory)
+                      if name.startswith('snapshot-') and name.endswith('.bin'))
+
+    def replay(self) -> Iterator[tuple]:
+        """
+        Yields the records to rebuild the sessions from: the newest snapshot's
+        SNAPSHOT records, then every record appended since.
+        """
+        segments = self.segments()
+        if not segments:
+            return
+        self.segment = segments[-1]
+        yield from read_records(self.path('snapshot', self.segment))
+        if os.path.exists(self.path('journal', self.segment)):
+            yield from read_records(self.path('journal', self.segment))
+
+    def start(self, loop=None):
+        """
+        Snapshots the sessions into a new segment and starts the writer.
+
+        Call it once the recovered sessions are back, so that the new
+        process starts from a clean segment and the old files can go.
+        """
+        self._loop = loop
+        with self._lock:
+            self._rotate(self.segment + 1, self.sessions())
+        self._thread = threading.Thread(target=self._run, name='journal', daemon=True)
+        self._thread.start()
+
+    def append(self, kind: int, session_id: int, value=None):
+        """Queues a record; it is encoded, written and fsynced with the next batch."""
+        self.pending.append((kind, session_id, value))
+        self.appended += 1
+        self.since_snapshot += 1
+        if self.since_snapshot >= self.snapshot_records and not self._snapshot_due and self._loop is not None:
+            # after the current move, so every session is snapshotted between two of its records
+            self._snapshot_due = True
+            self._loop.call_soon(self.snapshot)
+
+    def snapshot(self):
+        """Queues a snapshot of every session; the writer starts the next segment with it."""
+        self._snapshot_due = False
+        self.since_snapshot = 0
+        self.pending.append((SNAPSHOT, None, self.sessions()))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Writes and fsyncs everything queued so far."""
+        with self._lock:
+            pending = self.pending
+            batch = []
+            while pending:
+                kind, session_id, value = pending.popleft()
+                if kind == SNAPSHOT:  # everything queued before it goes to the old segment
+                    self._write(batch)
+                    batch = []
+                    self._rotate(self.segment + 1, value)
+                else:
+                    batch.append(encode_record(kind, session_id, value))
+            self._write(batch)
+
+    def _write(self, batch: list):
+        if not batch or self._file is None:
+            return
+        start = time.perf_counter()
+        data = b''.join(batch)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        batch_seconds.observe(time.perf_counter() - start)
+        self.written += len(batch)
+        self.bytes += len(data)
+        self.batches += 1
+
+    def _rotate(self, segment: int, sessions: list):
+        """Writes the snapshot of a new segment, switches to it and deletes the older files."""
+        path = self.path('snapshot', segment)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(b''.join(encode_record(SNAPSHOT, session_id, snapshot) for session_id, snapshot in sessions))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path('journal', segment), 'ab', buffering=0)
+        self.segment = segment
+        for old in self.segments():
+            if old < segment:
+                os.remove(self.path('snapshot', old))
+                if os.path.exists(self.path('journal', old)):
+                    os.remove(self.path('journal', old))
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)  # makes the rename and the new segment durable
+        finally:
+            os.close(fd)
+        snapshots.inc()
+
+    def close(self):
+        """Stops the writer after a last flush."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        return {'directory': os.path.abspath(self.directory), 'segment': self.segment,
+                'pending': len(self.pending), 'appended': self.appended, 'written': self.written,
+                'bytes': self.bytes, 'batches': self.batches, 'since_snapshot': self.since_snapshot}
+
+
+batch_seconds = metrics.Histogram('whot_journal_batch_seconds', 'Time the journal writer takes to write and '
+                                  'fsync a batch of records')
+snapshots = metrics.Counter('whot_journal_snapshots', 'Journal snapshots taken, each starting a new segment')
@@ -1,13 +1,32 @@
 import asyncio
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Body
-from fastapi.responses import HTMLResponse
-from computer.bot import Bot
-from utils import SessionsManager, Session
+from contextlib import asynccontextmanager
+import os
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Body
+from fastapi.responses import HTMLResponse, PlainTextResponse
+from computer.bot import BotSeat
+from game import deck_pool
+from journal import JOURNAL_DIR, Journal
+import metrics
+from monitor import ADMISSION_WAIT, MonitorMiddleware, admission, loop_monitor
+from sharding import shards
+from tracing import tracer
+from utils import LobbyQuery, SessionsManager, Session
 from fastapi.middleware.cors import CORSMiddleware
 import json
-import random
+from typing import Optional
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    journal = None
+    if JOURNAL_DIR:
+        journal = Journal(os.path.join(JOURNAL_DIR, f'shard-{shards.shard}'))
+        await session_manager.recover(journal, BotSeat)
+    yield
+    if journal is not None:
+        journal.close()
+
+
+app = FastAPI(lifespan=lifespan)
 origins = [
     "http://localhost",
     "http://localhost:3000",
@@ -21,81 +40,149 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MonitorMiddleware)
 
 
 
 session_manager = SessionsManager()
+deck_pool.start()
 
 
 
 @app.post('/create/')
 async def create(settings: str = Body(...)):
     settings = json.loads(settings)
-    return int(random.random()*10000)
+    reason = await admission.admit(session_manager.load, settings.get('numAI', 0))
+    if reason:
+        raise HTTPException(503, reason, headers={'Retry-After': str(int(ADMISSION_WAIT))})
+    return shards.new_session_id()
+
+@app.get('/sessions/{session_id}/connections')
+async def connections(session_id: int):
+    session = session_manager[session_id]
+    if session is None:
+        return []
+    return session.connection_stats()
+
+@app.get('/sessions/{session_id}/stats')
+async def stats(session_id: int):
+    session = session_manager[session_id]
+    if session is None:
+        return {}
+    return {'moves': session.move_stats(), 'broadcast': session.broadcast_stats()}
+
+@app.get('/timers')
+async def timers():
+    return session_manager.timers.stats()
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return metrics.render()
+
+@app.get('/monitor')
+async def loop_stats():
+    return {**loop_monitor.stats(), 'waiting': admission.waiting}
+
+@app.get('/admin/trace')
+async def trace_settings():
+    return tracer.stats()
+
+@app.put('/admin/trace')
+async def set_tracing(session_ids: list[int] = Body([]), sample: float = Body(0.0),
+                      path: Optional[str] = Body(None)):
+    """Traces the given sessions, running ones included, and a sample of new ones; nothing stops tracing."""
+    tracer.configure(session_ids, sample, path)
+    for session in list(session_manager.ids.values()):
+        session.set_trace(tracer.trace_for(session.id))
+    return tracer.stats()
+
+@app.get('/admin/journal')
+async def journal_stats():
+    journal = session_manager.journal
+    return journal.stats() if journal is not None else {}
+
 
 @app.websocket('/ws/games/')
-async def get_games(websocket: WebSocket):
+async def get_games(websocket: WebSocket, offset: int = 0, limit: int = 50, min_free_seats: int = 0,
+                    num_players: Optional[int] = None, status: Optional[str] = None):
+    await websocket.accept()
+    await session_manager.serve_lobby(websocket, LobbyQuery(offset, limit, min_free_seats, num_players,
+                                                            status))
+
+
+@app.websocket('/shard/lobby')
+async def lobby_feed(websocket: WebSocket):
+    """Every change to this worker's lobby, for the router that merges the shards' lobbies."""
     await websocket.accept()
+    feed = session_manager.follow_lobby(websocket)
     try:
         while True:
-            games = []
-            for id in session_manager.ids:
-                session = session_manager[id]
-                if session.isPrivate or session.status == "finished" or len(session.clients) == 0:
-                    continue
-                game = {
-                    'id': id,
-                    'private': session.isPrivate,
-                    'host': session.hostName,
-                    'status': session.status,
-                    'max_players': session.numPlayers,
-                    'num_players': len(session.clients),
-                }
-                games.append(game)
-            
-            await websocket.send_json({
-                'games': games
-            })
-            
-            await asyncio.sleep(1)  # Increased sleep time to reduce load
+            await websocket.receive_text()
     except WebSocketDisconnect:
-        print('Client disconnected')
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        
-    
-        
+        pass
+    finally:
+        session_manager.unfollow_lobby(feed)
+
+
+async def until_started(websocket: WebSocket, session: Session) -> bool:
+    """Waits for the session's game to start; False if the websocket disconnects first.
+
+    Seat counts and the countdown are pushed by the session itself; anything
+    the client sends in the meantime is ignored.
+    """
+    started = asyncio.ensure_future(session.started.wait())
+    try:
+        while not started.done():
+            received = asyncio.ensure_future(websocket.receive_text())
+            await asyncio.wait({started, received}, return_when=asyncio.FIRST_COMPLETED)
+            if received.done():
+                received.result()
+            else:
+                received.cancel()
+        return True
+    except WebSocketDisconnect:
+        return False
+    finally:
+        started.cancel()
 
 
 @app.websocket("/ws/create/{host_id}")
-async def websocket_endpoint(websocket: WebSocket, host_id: str, id: int, settings: str):
+async def websocket_endpoint(websocket: WebSocket, host_id: str, id: int, settings: str,
+                             protocol: str = 'full'):
     settings = json.loads(settings)
-    print(settings)
     await websocket.accept()
-    session = Session(id=id, **settings, clients=[])
-    await session_manager.add_session(session)
-    added = await session_manager.add_client(websocket, id, host_id, settings['hostName'])
+    reason = await admission.admit(session_manager.load, settings['numAI'], wait=ADMISSION_WAIT)
+    if reason:
+        await websocket.send_json({"status": "busy", "reason": reason})
+        await websocket.close(code=1013)
+        return
+    session = session_manager[id]
+    recovered = session is not None and host_id in session.held  # the host is back after a restart
+    if session is not None and not recovered:
+        await websocket.send_json({"status": "exists"})
+        await websocket.close(code=1008)
+        return
+    if not recovered:
+        session = Session(id=id, **settings, clients=[])
+        await session_manager.add_session(session)
+    added = await session_manager.add_client(websocket, id, host_id, settings['hostName'], protocol)
     
     if not added:
         await websocket.close()
         return 'Already in game'
     
-    bots: list[Bot] = []
-    for _ in range(settings['numAI']):
-        bot = Bot.create_bot(session.id, False)
-        bots.append(bot)
-        
-    try:
-        while True:
-            if session_manager.is_session_full(session.id):
-                session = session_manager[id]
-                await session.start_game()
-                print('Starting game')
+    bots: list[BotSeat] = []
+    if recovered:
+        bots = [client for client in session.clients if client.protocol == 'object']
+    else:
+        for _ in range(settings['numAI']):
+            bot = await BotSeat.create_bot(session)
+            if bot is None:
                 break
-            await websocket.send_json({"status": "waiting"})
-            await asyncio.sleep(0.1)  # Small sleep to prevent blocking
-    except WebSocketDisconnect:
-        print('disconnected')
+            bots.append(bot)
+        
+    if not await until_started(websocket, session):
+        await session_manager.remove_client(session.id, host_id)
         session_manager.delete_session(session.id)
         for bot in bots:
             bot.stop()
@@ -106,33 +193,36 @@ async def websocket_endpoint(websocket: WebSocket, host_id: str, id: int, settin
     while not session_manager.is_done(session.id):
         try:
             text = await websocket.receive_text()
-            await session_manager.handle_message(text, id)
+            await session_manager.handle_message(text, id, websocket)
         except WebSocketDisconnect:
-            print('disconnected')
             disconnected = True
             break
         
     if disconnected:
         await session_manager.remove_client(session.id, host_id)
-        session = session_manager.ids[session.id]
-        if len(session.clients) == 0:
+        session = session_manager[session.id]
+        if session is not None and all(client.websocket is None for client in session.clients):  # only bots are left
             session_manager.delete_session(session.id)
     else:
         session_manager.delete_session(session.id)
         
-     # Stop all bots when the game is over
+    # A game that goes on without its host loses the host's bots too, as the threaded bots' sockets closed
+    session = session_manager[session.id]
     for bot in bots:
-        bot.stop()
+        if session is not None and bot in session.clients:
+            await session_manager.remove_client(session.id, bot.id)
+        else:
+            bot.stop()
     
     
     
 @app.websocket("/ws/join/{session_id}")
-async def join_game(websocket: WebSocket, client_id: str, session_id: int, display_name: str):
+async def join_game(websocket: WebSocket, client_id: str, session_id: int, display_name: str,
+                    protocol: str = 'full'):
     await websocket.accept()
     
-    added = await session_manager.add_client(websocket, session_id, client_id, display_name)
+    added = await session_manager.add_client(websocket, session_id, client_id, display_name, protocol)
     if not added:
-        print('Not added', session_id, client_id, display_name)
         status = session_manager.get_session_status(session_id)
         if status == 'in-progress':
             await websocket.send_json({"status": "full"})
@@ -146,8 +236,7 @@ async def join_game(websocket: WebSocket, client_id: str, session_id: int, displ
     while not session_manager.is_done(session_id):
         try:
             text = await websocket.receive_text()
-            await session_manager.handle_message(text, session_id)
+            await session_manager.handle_message(text, session_id, websocket)
         except WebSocketDisconnect:
-            print('disconnected')
             break
     await session_manager.remove_client(session_id, client_id)
\ No newline at end of file
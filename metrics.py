@@ -0,0 +1,133 @@
+"""
+Counters, gauges and histograms for the /metrics endpoint, in the Prometheus text format.
+
+Hot paths only bump numbers: a counter adds to an int, a histogram adds to
+one bucket found by bisecting its bounds, and cumulative bucket counts are
+only worked out when the metrics are rendered. Gauges take nothing from the
+hot paths at all, as they read the server's own structures when rendered.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, Tuple
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0)  # seconds
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """A named family of series, one per combination of label values."""
+
+    kind = ''
+    enabled = True  # set False on Metric to make every update a no-op, e.g. to measure the overhead
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.series: Dict[Tuple, object] = {}
+        registry.append(self)
+
+    def header(self) -> list:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        if not labels:  # shows up as 0 before the first increment
+            self.series[()] = 0
+
+    def inc(self, *labels, amount: float = 1):
+        if Metric.enabled:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self) -> list:
+        return self.header() + [f'{self.name}_total{_labels(self.label_names, labels)} {value}'
+                                for labels, value in self.series.items()]
+
+
+class Gauge(Metric):
+    """
+    A value read when rendering. ``read`` returns a number, or a dict from
+    label values (a tuple, or a plain value for a single label) to numbers.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, read: Callable, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.read = read
+
+    def render(self) -> list:
+        value = self.read()
+        values = value if isinstance(value, dict) else {(): value}
+        return self.header() + [
+            f'{self.name}{_labels(self.label_names, labels if isinstance(labels, tuple) else (labels,))} {v}'
+            for labels, v in values.items()
+        ]
+
+
+class Histogram(Metric):
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        if not Metric.enabled:
+            return
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list:
+        lines = self.header()
+        for labels, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}')
+        return lines
+
+
+registry: list = []
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in registry:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+# The server's hot-path metrics; gauges are registered by whatever owns the state they read.
+session_move_seconds = Histogram(
+    'whot_session_move_seconds', 'Session.process_game_move time from receiving a move to its '
+    'result being ready, MOVE_PACING and the broadcast excluded')
+engine_move_seconds = Histogram('whot_engine_move_seconds', 'Time the rule engine takes to play a move')
+broadcast_seconds = Histogram('whot_broadcast_seconds', 'Time to build, encode and queue a broadcast on every client',
+                              labels=('kind',))
+moves = Counter('whot_moves', "Moves handled, by result: 'applied' or the reason it was rejected",
+                labels=('result',))
+turn_timeouts = Counter('whot_turn_timeouts', 'Turns that ran out of time and went to market')
+disconnects = Counter('whot_disconnects', 'Clients that left a session')
+send_failures = Counter('whot_send_failures', 'Clients disconnected by the server, by reason',
+                        labels=('reason',))
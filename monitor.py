@@ -0,0 +1,250 @@
+"""
+Event loop lag monitoring and the admission policy for new sessions.
+
+Every session, bot seat and endpoint shares one event loop, so an overloaded
+server slows every game down at once. LoopMonitor measures how late the loop
+wakes a task that sleeps LAG_INTERVAL at a time, and a watchdog thread
+catches the loop while it is blocked: it reads the name of the task that is
+running and the innermost line of this project on the loop thread's stack.
+Session actors are named after their session and request tasks after their
+route, so each slow stretch is put down to an endpoint or a session.
+
+AdmissionPolicy turns the lag and the server's size into a yes or no for new
+sessions, so an overloaded server refuses new games instead of slowing down
+the ones already running.
+"""
+import asyncio
+from collections import deque
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+from starlette.routing import Match
+
+import metrics
+
+load_dotenv()
+
+LAG_INTERVAL = 0.05  # seconds between the lag probe's wake-ups
+LAG_WINDOW = 40  # lag samples kept, i.e. the last LAG_WINDOW * LAG_INTERVAL seconds
+SLOW_CALLBACK = 0.1  # seconds the loop may be blocked before the watchdog records what blocked it
+SLOW_LOG = 256  # slow stretches kept for /monitor
+MAX_LOOP_LAG = float(os.getenv('MAX_LOOP_LAG', 0.1))  # p90 lag in seconds above which new sessions wait
+MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', 5000))  # live sessions above which new sessions wait
+MAX_BOT_SEATS = int(os.getenv('MAX_BOT_SEATS', 5000))  # in-process bot seats above which new AI seats wait
+ADMISSION_WAIT = 5.0  # seconds a websocket session request may wait for the server to recover
+MAX_WAITING = 100  # session requests that may wait at once; further ones are refused right away
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def blocked_at(frame) -> str:
+    """The innermost line of the stack that belongs to this project, as file:line function."""
+    innermost = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if innermost is None:
+            innermost = frame
+        if filename.startswith(ROOT) and filename != __file__:
+            break
+        frame = frame.f_back
+    frame = frame or innermost
+    if frame is None:
+        return ''
+    return f'{os.path.relpath(frame.f_code.co_filename, ROOT)}:{frame.f_lineno} {frame.f_code.co_name}'
+
+
+class LoopMonitor:
+    """
+    Samples event loop lag and records what kept the loop blocked.
+
+    Attributes
+    ----------
+    samples : deque
+        The latest LAG_WINDOW lag samples, in seconds.
+    slow : deque
+        The latest SLOW_LOG slow stretches, each a dict with the task
+        ('source'), the line it was blocked at ('where'), how late the
+        probe woke ('seconds') and when ('at', time.time()).
+    """
+
+    def __init__(self, interval: float = LAG_INTERVAL, slow_after: float = SLOW_CALLBACK):
+        self.interval = interval
+        self.slow_after = slow_after
+        self.samples: deque = deque(maxlen=LAG_WINDOW)
+        self.slow: deque = deque(maxlen=SLOW_LOG)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.beat = 0.0  # perf_counter of the probe's last wake-up
+        self.blocked: Optional[tuple] = None  # (source, where) the watchdog saw since the last beat
+        self._thread_id = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        """Starts probing the running loop; does nothing if already started."""
+        if self._task is not None and not self._task.done():
+            return
+        self.loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self.beat = time.perf_counter()
+        self._task = self.loop.create_task(self._probe(), name='loop monitor')
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._watchdog = threading.Thread(target=self._watch, name='loop watchdog', daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _probe(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.beat = now = time.perf_counter()
+            lag = max(0.0, now - start - self.interval)
+            self.samples.append(lag)
+            blocked, self.blocked = self.blocked, None
+            if blocked is not None:
+                source, where = blocked
+                self.slow.append({'source': source, 'where': where, 'seconds': round(lag, 4),
+                                  'at': time.time()})
+                slow_callbacks.inc()
+
+    def _watch(self):
+        while self._task is not None:
+            time.sleep(self.slow_after / 2)
+            if self.blocked is not None or time.perf_counter() - self.beat < self.interval + self.slow_after:
+                continue
+            task = asyncio.current_task(self.loop)
+            frame = sys._current_frames().get(self._thread_id)
+            self.blocked = (task.get_name() if task is not None else 'callback', blocked_at(frame))
+
+    def lag(self) -> float:
+        """The 90th percentile lag of the window, in seconds, or the current stall if longer."""
+        samples = sorted(self.samples)
+        lag = samples[int(0.9 * (len(samples) - 1))] if samples else 0.0
+        if self._task is not None:
+            lag = max(lag, time.perf_counter() - self.beat - self.interval)
+        return lag
+
+    def stats(self, top: int = 10) -> dict:
+        """Lag percentiles in milliseconds and the sources of the most recent slow stretches."""
+        samples = sorted(self.samples)
+        sources = {}
+        for event in self.slow:
+            entry = sources.setdefault(event['source'], {'count': 0, 'seconds': 0.0, 'where': {}})
+            entry['count'] += 1
+            entry['seconds'] = round(entry['seconds'] + event['seconds'], 4)
+            entry['where'][event['where']] = entry['where'].get(event['where'], 0) + 1
+        ranked = sorted(sources.items(), key=lambda item: item[1]['seconds'], reverse=True)[:top]
+        return {
+            'lag_ms': {'p50': round(samples[len(samples) // 2] * 1000, 3) if samples else 0.0,
+                       'p90': round(self.lag() * 1000, 3),
+                       'max': round(samples[-1] * 1000, 3) if samples else 0.0},
+            'slow': len(self.slow),
+            'sources': dict(ranked),
+            'recent': list(self.slow)[-top:],
+        }
+
+
+class AdmissionPolicy:
+    """
+    Decides whether the server takes a new session, from loop lag and its size.
+
+    A request that is over a limit may wait up to ``wait`` seconds for the
+    server to recover, with at most MAX_WAITING requests waiting at once.
+    """
+
+    def __init__(self, monitor: LoopMonitor, max_lag: float = MAX_LOOP_LAG,
+                 max_sessions: int = MAX_SESSIONS, max_bot_seats: int = MAX_BOT_SEATS):
+        self.monitor = monitor
+        self.max_lag = max_lag
+        self.max_sessions = max_sessions
+        self.max_bot_seats = max_bot_seats
+        self.waiting = 0
+
+    def check(self, sessions: int, bot_seats: int = 0, new_bots: int = 0) -> str:
+        """
+        Why a new session cannot be taken right now.
+
+        Parameters
+        ----------
+        sessions : int
+            Live sessions.
+        bot_seats : int
+            In-process bot seats in those sessions.
+        new_bots : int
+            AI seats the new session asks for.
+
+        Returns
+        -------
+        str
+            The reason, or an empty string if the session is admitted.
+        """
+        if sessions >= self.max_sessions:
+            return 'too many sessions'
+        if new_bots and bot_seats + new_bots > self.max_bot_seats:
+            return 'too many bots'
+        if self.monitor.lag() > self.max_lag:
+            return 'server overloaded'
+        return ''
+
+    async def admit(self, load, new_bots: int = 0, wait: float = 0.0) -> str:
+        """
+        check() against ``load()``'s (sessions, bot_seats), rechecked until
+        it passes or ``wait`` seconds are up.
+
+        Returns
+        -------
+        str
+            Why the session was refused, or an empty string if it was admitted.
+        """
+        reason = self.check(*load(), new_bots)
+        if reason and wait > 0 and self.waiting < MAX_WAITING:
+            self.waiting += 1
+            try:
+                deadline = time.perf_counter() + wait
+                while reason and time.perf_counter() < deadline:
+                    await asyncio.sleep(self.monitor.interval)
+                    reason = self.check(*load(), new_bots)
+            finally:
+                self.waiting -= 1
+        admissions.inc(reason or 'admitted')
+        return reason
+
+
+class MonitorMiddleware:
+    """ASGI middleware that starts loop_monitor and names each request's task after its route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] in ('http', 'websocket'):
+            loop_monitor.start()
+            task = asyncio.current_task()
+            if task is not None:
+                task.set_name(route_of(scope))
+        await self.app(scope, receive, send)
+
+
+def route_of(scope) -> str:
+    """The path template of the route a request goes to, e.g. /ws/join/{session_id}."""
+    for route in getattr(scope.get('app'), 'routes', ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return scope['path']
+
+
+slow_callbacks = metrics.Counter('whot_slow_callbacks', f'Event loop stalls longer than {SLOW_CALLBACK}s')
+admissions = metrics.Counter('whot_admissions', "New session requests, by result: 'admitted' or the reason "
+                             'they were refused', labels=('result',))
+loop_monitor = LoopMonitor()
+admission = AdmissionPolicy(loop_monitor)
+metrics.Gauge('whot_loop_lag_seconds', 'p90 event loop lag over the last few seconds', loop_monitor.lag)
+metrics.Gauge('whot_waiting_sessions', 'Session requests waiting for admission', lambda: admission.waiting)
@@ -0,0 +1,324 @@
+"""
+Runs the server as several worker processes behind a router, one shard of the sessions each.
+
+Each worker is main.app on its own Unix socket (see sharding.py). The router
+is the only process on the public port: it forwards each game websocket to
+the worker that owns its session and pipes the frames both ways, forwards
+/sessions/{id} requests the same way, offers /create/ to the workers in turn
+until one admits the session, and serves the lobby itself from the entries
+every worker streams to it over /shard/lobby. Nothing but the Unix sockets
+connects the processes, so the whole setup runs locally as it does in the
+container.
+
+    python -m router --workers 4 --port 8000
+    python -m router --workers 4 --routers 2 --port 80
+
+/shards lists the workers and /shards/{n}/... reaches any route of worker n,
+e.g. /shards/2/metrics.
+"""
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import sys
+from typing import Optional
+
+import h11
+import websockets
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+
+from sharding import shards
+from utils import LobbyQuery, SessionsManager
+
+RECONNECT_DELAY = 1.0  # seconds between attempts to follow a worker's lobby again
+FORWARD_HEADERS = (b'content-type', b'retry-after')  # response headers passed back from the workers
+STOP_TIMEOUT = 10.0  # seconds a worker gets to shut down after SIGTERM before it is killed
+
+session_manager = SessionsManager()  # holds no sessions here, only the merged lobby and its watchers
+following: dict = {}  # shard -> whether its lobby feed is connected
+next_shard = itertools.count()
+
+
+def drop_shard(shard: int):
+    for id in [id for id in session_manager.lobby if shards.owner(id) == shard]:
+        del session_manager.lobby[id]
+
+
+def apply_lobby(shard: int, update: dict):
+    """Merges a worker's lobby changes into the router's lobby and schedules a push to the watchers."""
+    if update.get('snapshot'):
+        drop_shard(shard)
+    lobby = session_manager.lobby
+    for id, entry in update['changes']:
+        if entry is None:
+            lobby.pop(id, None)
+        else:
+            lobby[id] = entry
+    session_manager.schedule_lobby()
+
+
+async def follow_lobby(shard: int):
+    """Keeps the router's copy of a worker's lobby current, reconnecting whenever the worker goes away."""
+    while True:
+        try:
+            async with websockets.unix_connect(shards.socket(shard), 'ws://localhost/shard/lobby',
+                                               max_size=None) as feed:
+                following[shard] = True
+                async for text in feed:
+                    apply_lobby(shard, json.loads(text))
+        except (OSError, websockets.exceptions.WebSocketException):
+            pass
+        following[shard] = False
+        drop_shard(shard)
+        session_manager.schedule_lobby()
+        await asyncio.sleep(RECONNECT_DELAY)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [asyncio.ensure_future(follow_lobby(shard)) for shard in range(shards.shards)]
+    yield
+    for task in tasks:
+        task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+async def forward(shard: int, request: Request, path: str) -> Response:
+    """
+    Sends an HTTP request on to a worker over its Unix socket and returns the worker's response.
+
+    Args:
+        shard (int): The worker to ask.
+        request (Request): The client's request; its method, query, body and content type are kept.
+        path (str): The path to request from the worker.
+
+    Returns:
+        Response: The worker's status, body and FORWARD_HEADERS, or a 502 if it cannot be reached.
+    """
+    body = await request.body()
+    target = path + (f'?{request.url.query}' if request.url.query else '')
+    headers = [('host', 'localhost'), ('connection', 'close'), ('content-length', str(len(body)))]
+    if 'content-type' in request.headers:
+        headers.append(('content-type', request.headers['content-type']))
+    connection = h11.Connection(h11.CLIENT)
+    try:
+        reader, writer = await asyncio.open_unix_connection(shards.socket(shard))
+    except OSError:
+        return Response(f'shard {shard} is unavailable', status_code=502)
+    try:
+        writer.write(connection.send(h11.Request(method=request.method, target=target, headers=headers))
+                     + (connection.send(h11.Data(data=body)) if body else b'')
+                     + connection.send(h11.EndOfMessage()))
+        response, chunks = None, []
+        while True:
+            event = connection.next_event()
+            if event is h11.NEED_DATA:
+                connection.receive_data(await reader.read(65536))
+            elif isinstance(event, h11.Response):
+                response = event
+            elif isinstance(event, h11.Data):
+                chunks.append(event.data)
+            elif isinstance(event, (h11.EndOfMessage, h11.ConnectionClosed)):
+                break
+    except (OSError, h11.ProtocolError):
+        return Response(f'shard {shard} is unavailable', status_code=502)
+    finally:
+        writer.close()
+    if response is None:
+        return Response(f'shard {shard} is unavailable', status_code=502)
+    return Response(b''.join(chunks), status_code=response.status_code,
+                    headers={name.decode(): value.decode() for name, value in response.headers
+                             if name in FORWARD_HEADERS})
+
+
+async def proxy(websocket: WebSocket, shard: int):
+    """
+    Connects a client's websocket to the same path on a worker and pipes frames both ways.
+
+    The client is only accepted once the worker is, and whichever side
+    closes first closes the other, with the worker's close code.
+    """
+    url = websocket.url
+    try:
+        upstream = await websockets.unix_connect(
+            shards.socket(shard), f'ws://localhost{url.path}' + (f'?{url.query}' if url.query else ''),
+            max_size=None, max_queue=None)
+    except (OSError, websockets.exceptions.WebSocketException):
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+
+    async def to_client():
+        try:
+            async for message in upstream:
+                if isinstance(message, str):
+                    await websocket.send_text(message)
+                else:
+                    await websocket.send_bytes(message)
+        except (websockets.exceptions.ConnectionClosed, WebSocketDisconnect, RuntimeError):
+            pass
+
+    async def to_worker():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    return
+                await upstream.send(message['text'] if message.get('text') is not None else message['bytes'])
+        except (websockets.exceptions.ConnectionClosed, WebSocketDisconnect, RuntimeError):
+            pass
+
+    pipes = {asyncio.ensure_future(to_client()), asyncio.ensure_future(to_worker())}
+    try:
+        await asyncio.wait(pipes, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for pipe in pipes:
+            pipe.cancel()
+        await upstream.close()
+        code = upstream.close_code if upstream.close_code not in (None, 1005, 1006) else 1000
+        try:
+            await websocket.close(code=code)
+        except (RuntimeError, WebSocketDisconnect):  # the client closed first
+            pass
+
+
+@app.post('/create/')
+async def create(request: Request):
+    """Offers the new session to each worker in turn, starting with the next one, until one admits it."""
+    first = next(next_shard)
+    for n in range(shards.shards):
+        response = await forward((first + n) % shards.shards, request, '/create/')
+        if response.status_code < 500:
+            return response
+    return response
+
+
+@app.get('/sessions/{session_id}/{rest:path}')
+async def session_route(session_id: int, rest: str, request: Request):
+    return await forward(shards.owner(session_id), request, request.url.path)
+
+
+@app.get('/shards')
+async def shard_list():
+    counts = {shard: 0 for shard in range(shards.shards)}
+    for id in session_manager.lobby:
+        counts[shards.owner(id)] += 1
+    return [{'shard': shard, 'socket': shards.socket(shard), 'following': following.get(shard, False),
+             'listed': counts[shard]} for shard in range(shards.shards)]
+
+
+@app.api_route('/shards/{shard}/{rest:path}', methods=['GET', 'POST', 'PUT', 'DELETE'])
+async def shard_route(shard: int, rest: str, request: Request):
+    if not 0 <= shard < shards.shards:
+        raise HTTPException(404, f'no shard {shard}')
+    return await forward(shard, request, f'/{rest}')
+
+
+@app.websocket('/ws/games/')
+async def get_games(websocket: WebSocket, offset: int = 0, limit: int = 50, min_free_seats: int = 0,
+                    num_players: Optional[int] = None, status: Optional[str] = None):
+    await websocket.accept()
+    await session_manager.serve_lobby(websocket, LobbyQuery(offset, limit, min_free_seats, num_players,
+                                                            status))
+
+
+@app.websocket('/ws/create/{host_id}')
+async def create_session(websocket: WebSocket, host_id: str, id: int):
+    await proxy(websocket, shards.owner(id))
+
+
+@app.websocket('/ws/join/{session_id}')
+async def join_game(websocket: WebSocket, session_id: int):
+    await proxy(websocket, shards.owner(session_id))
+
+
+def run_worker(shard: int, count: int, socket_dir: str, log_level: str):
+    """A worker process: main.app as shard ``shard`` of ``count``, on the shard's Unix socket."""
+    import uvicorn
+    shards.configure(count, shard, socket_dir)
+    from main import app as worker_app
+    path = shards.socket(shard)
+    if os.path.exists(path):
+        os.unlink(path)
+    uvicorn.run(worker_app, uds=path, log_level=log_level)
+
+
+def start_workers(count: int, socket_dir: str, log_level: str = 'warning') -> list:
+    """Starts the worker processes; they are not daemons, as each may start a search pool of its own."""
+    os.makedirs(socket_dir, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_worker, args=(shard, count, socket_dir, log_level), name=f'shard-{shard}')
+               for shard in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def stop_workers(workers: list):
+    """Terminates the workers, kills any still running after STOP_TIMEOUT and removes their sockets."""
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+    for worker in workers:
+        worker.join(STOP_TIMEOUT)
+        if worker.is_alive():
+            worker.kill()
+            worker.join()
+    for shard in range(len(workers)):
+        path = shards.socket(shard)
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def exit_on_sigterm():
+    """
+    Makes SIGTERM raise SystemExit, so that a ``finally`` around uvicorn.run stops the workers.
+
+    uvicorn puts back the handler it found once it has shut down and raises
+    the signal again, which by default ends the process on the spot.
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes, one shard each')
+    parser.add_argument('--routers', type=int, default=1, help='router processes sharing the port')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--socket-dir', default=shards.socket_dir, help="where the workers' Unix sockets go")
+    parser.add_argument('--log-level', default='warning')
+    args = parser.parse_args()
+
+    # routers started by uvicorn import this module afresh and read their shard map from the environment
+    os.environ.update(SHARDS=str(args.workers), SHARD='0', SHARD_SOCKET_DIR=args.socket_dir)
+    shards.configure(args.workers, 0, args.socket_dir)
+    workers = start_workers(args.workers, args.socket_dir, args.log_level)
+    exit_on_sigterm()
+    try:
+        if args.routers > 1:
+            uvicorn.run('router:app', host=args.host, port=args.port, workers=args.routers,
+                        log_level=args.log_level)
+        else:
+            uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
+    finally:
+        stop_workers(workers)
+
+
+if __name__ == '__main__':
+    main()
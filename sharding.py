@@ -0,0 +1,61 @@
+"""
+Which worker process owns which session, for running the server on several cores.
+
+Sessions live in the memory of the worker that created them, so every
+request about a session has to reach that worker. Ownership is the session
+id modulo the number of shards: a worker only hands out ids it owns from
+/create/, and the router (router.py) sends /ws/create, /ws/join and
+/sessions/{id} traffic for an id to its owner over the owner's Unix socket.
+
+A worker started on its own, e.g. by ``fastapi run main.py``, is shard 0 of
+1 and owns every id.
+"""
+import os
+import random
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_SESSION_ID = 10000  # session ids are below this, as /create/ has always handed them out
+
+
+class ShardMap:
+    """
+    The shards of a server and which one this process is.
+
+    Attributes:
+        shards (int): How many worker processes the server runs.
+        shard (int): This process's shard, or 0 for the router.
+        socket_dir (str): Where the workers' Unix sockets are.
+    """
+
+    def __init__(self, shards: int = 1, shard: int = 0, socket_dir: str = ''):
+        self.configure(shards, shard, socket_dir)
+
+    def configure(self, shards: int, shard: int = 0, socket_dir: str = ''):
+        """Changes the map in place, for a process that learns its shard after importing this module."""
+        if not 0 <= shard < shards:
+            raise ValueError(f'shard {shard} out of range for {shards} shards')
+        self.shards = shards
+        self.shard = shard
+        self.socket_dir = socket_dir or os.path.join(tempfile.gettempdir(), 'whot')
+
+    def owner(self, session_id: int) -> int:
+        """The shard that owns a session id."""
+        return session_id % self.shards
+
+    def owns(self, session_id: int) -> bool:
+        return self.owner(session_id) == self.shard
+
+    def socket(self, shard: int) -> str:
+        """The Unix socket a shard's worker listens on."""
+        return os.path.join(self.socket_dir, f'shard-{shard}.sock')
+
+    def new_session_id(self) -> int:
+        """A random session id below MAX_SESSION_ID that this shard owns."""
+        return random.randrange(MAX_SESSION_ID // self.shards) * self.shards + self.shard
+
+
+shards = ShardMap(int(os.getenv('SHARDS', 1)), int(os.getenv('SHARD', 0)), os.getenv('SHARD_SOCKET_DIR', ''))
@@ -0,0 +1,163 @@
+"""
+Opt-in span tracing of single sessions, written in the Chrome trace event format.
+
+A traced session's moves are broken into spans (the wait in the actor's
+queue, parsing and validation, the rules engine, rankings, pacing, building
+and serializing the broadcast, and each client's send) and
+appended to TRACE_FILE as trace events, which Perfetto, chrome://tracing and
+speedscope open directly. Each session shows up as a process and each of
+its clients' sends as a thread of it.
+
+Tracing is off unless TRACE_SESSIONS or TRACE_SAMPLE is set, or PUT
+/admin/trace turns it on. An untraced session only tests its ``trace``
+attribute for None, so tracing costs next to nothing when off.
+"""
+import json
+import os
+import random
+import time
+from typing import Iterable, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACE_FILE = os.getenv('TRACE_FILE', f'whot-trace-{os.getpid()}.json')  # where trace events are appended
+TRACE_SESSIONS = os.getenv('TRACE_SESSIONS', '')  # comma-separated session ids to trace
+TRACE_SAMPLE = float(os.getenv('TRACE_SAMPLE', 0.0))  # fraction of new sessions to trace
+EPOCH = time.perf_counter()  # trace timestamps count from here
+
+# Spans are formatted by hand, which is faster than json.dumps; only metadata and span args are encoded.
+
+
+class SessionTrace:
+    """The spans of one session, written as the process ``session_id`` of the trace."""
+
+    def __init__(self, tracer: 'Tracer', session_id: int):
+        self.tracer = tracer
+        self.session_id = session_id
+        self.threads: dict = {}  # client id -> tid of its sends; the session's actor is tid 0
+        self.spans = 0
+        tracer.write({'ph': 'M', 'name': 'process_name', 'pid': session_id, 'tid': 0,
+                      'args': {'name': f'session {session_id}'}})
+        tracer.write({'ph': 'M', 'name': 'thread_name', 'pid': session_id, 'tid': 0,
+                      'args': {'name': 'actor'}})
+
+    def tid(self, client_id) -> int:
+        tid = self.threads.get(client_id)
+        if tid is None:
+            tid = self.threads[client_id] = len(self.threads) + 1
+            self.tracer.write({'ph': 'M', 'name': 'thread_name', 'pid': self.session_id, 'tid': tid,
+                               'args': {'name': f'send {client_id}'}})
+        return tid
+
+    def span(self, name: str, start: float, end: float, client_id=None, args: Optional[dict] = None):
+        """
+        Records a complete span.
+
+        Parameters
+        ----------
+        name : str
+            What the time went to, e.g. 'rules'.
+        start, end : float
+            time.perf_counter() readings.
+        client_id : optional
+            The client the span belongs to; the session's actor if None.
+        args : dict, optional
+            Anything else to show with the span.
+        """
+        tid = 0 if client_id is None else self.tid(client_id)
+        text = (f'{{"ph":"X","name":"{name}","pid":{self.session_id},"tid":{tid},'
+                f'"ts":{(start - EPOCH) * 1e6:.3f},"dur":{(end - start) * 1e6:.3f}')
+        if args:
+            text += ',"args":' + json.dumps(args, separators=(',', ':'), ensure_ascii=False)
+        self.tracer.write_text(text + '}')
+        self.spans += 1
+
+
+class Tracer:
+    """
+    Decides which sessions are traced and appends their events to one file.
+
+    The file is a JSON array of trace events that is only closed by close();
+    trace viewers accept it without the closing bracket, so a live file
+    opens too. A file left by an earlier run or an earlier close() is moved
+    aside, with its modification time added to the name.
+    """
+
+    def __init__(self, path: str = TRACE_FILE, session_ids: Iterable[int] = (), sample: float = 0.0):
+        self.path = path
+        self.session_ids = set(session_ids)
+        self.sample = sample
+        self.traces: dict = {}  # session id -> SessionTrace, for every session traced so far
+        self._file = None
+        self._last: Optional[str] = None  # the latest event, written with its comma once another follows
+        self._rng = random.Random()  # not the global one, which seeded games and benchmarks use
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.session_ids) or self.sample > 0
+
+    def configure(self, session_ids: Iterable[int] = (), sample: float = 0.0, path: Optional[str] = None):
+        """Sets which sessions to trace from now on; nothing and 0 turn tracing off and close the file."""
+        self.session_ids = set(session_ids)
+        self.sample = min(max(sample, 0.0), 1.0)
+        if path is not None and path != self.path:
+            self.close()
+            self.path = path
+        if not self.enabled:
+            self.close()
+
+    def trace_for(self, session_id: int, starting: bool = False) -> Optional[SessionTrace]:
+        """
+        The session's trace if it should be traced, else None.
+
+        Sampling only picks sessions that are ``starting``, so a session is
+        either traced from its first move or not at all.
+        """
+        if session_id in self.traces and self.enabled:
+            return self.traces[session_id]
+        if session_id in self.session_ids or (starting and self.sample and self._rng.random() < self.sample):
+            trace = self.traces[session_id] = SessionTrace(self, session_id)
+            return trace
+        return None
+
+    def write(self, event: dict):
+        self.write_text(json.dumps(event, separators=(',', ':'), ensure_ascii=False))
+
+    def write_text(self, text: str):
+        """Appends an event already encoded as JSON."""
+        if self._file is None:
+            self.start_file()
+        elif self._last is not None:
+            self._file.write(self._last + ',\n')
+        self._last = text
+
+    def start_file(self):
+        """Starts the JSON array, moving aside an earlier trace at the same path."""
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            root, ext = os.path.splitext(self.path)
+            os.replace(self.path, f'{root}-{int(os.path.getmtime(self.path))}{ext}')
+        self._file = open(self.path, 'w', buffering=1 << 16)
+        self._file.write('[\n')
+        self._last = None
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """Ends the JSON array; the next event starts a new file."""
+        if self._file is not None:
+            self._file.write((self._last or '') + '\n]\n')
+            self._file.close()
+            self._file = None
+            self._last = None
+            self.traces.clear()
+
+    def stats(self) -> dict:
+        return {'file': os.path.abspath(self.path), 'session_ids': sorted(self.session_ids),
+                'sample': self.sample, 'traced': {id: trace.spans for id, trace in self.traces.items()}}
+
+
+tracer = Tracer(session_ids=(int(id) for id in TRACE_SESSIONS.split(',') if id.strip()), sample=TRACE_SAMPLE)
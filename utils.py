@@ -1,15 +1,269 @@
 import asyncio
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, field
+import math
 import threading
-from typing import Dict, List
-from fastapi.websockets import WebSocket
+import time
+from typing import Callable, Dict, List, Optional
+from fastapi.websockets import WebSocket, WebSocketDisconnect
 import json
 
-from game import Whot
+from game import (DECK, STANDARD_RULES, DrawPile, GameState, HouseRules, ReplayPool, Whot, card_to_dict,
+                  cards_from_dicts, cards_to_dicts, deck_pool, is_legal_stack, legal_positions)
+from journal import DECK_SEED, END, JOIN, LEAVE, MOVE, REMOVE, SETTINGS, SNAPSHOT, START, Journal
+import metrics
+from tracing import SessionTrace, tracer
 
+SEND_TIMEOUT = 5.0  # seconds a single client send may take before it counts as failed
+MAX_QUEUE = 32  # outbound frames a client may have waiting before state frames are coalesced
+MAX_LAGGING_SECONDS = 10.0  # how long a client may stay over MAX_QUEUE before it is dropped
+MOVE_PACING = 0.25  # seconds between receiving a move and delivering its result, for animations
+TIMER_TICK = 0.05  # seconds per timer wheel slot; deadlines fire up to one tick late
+TIMER_SLOTS = 1024  # wheel slots, one revolution is TIMER_SLOTS * TIMER_TICK seconds
+START_COUNTDOWN = 3.0  # seconds between a session filling up and the deal
+MAX_LOBBY_PAGE = 100  # most sessions one lobby page may list
+REJOIN_GRACE = 60.0  # seconds a recovered session keeps its players' seats for them to rejoin
+PROTOCOLS = ('full', 'delta', 'view')  # 'full' re-sends the whole state every move, 'delta' only
+                                       # what changed, 'view' a shared public part plus the own hand
+
+
+def percentiles(samples) -> dict:
+    """p50, p99 and max of durations in seconds, reported in milliseconds."""
+    samples = sorted(samples)
+    if not samples:
+        return {'count': 0}
+    def percentile(q: float) -> float:
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+    return {'count': len(samples), 'p50': percentile(0.5), 'p99': percentile(0.99),
+            'max': percentile(1.0)}
+
+
+def encode(message) -> str:
+    """Compact JSON text for a websocket frame of plain dicts, lists, strings and numbers."""
+    return json.dumps(message, separators=(',', ':'), ensure_ascii=False)
+
+
+CARD_TEXT = tuple(encode(card_to_dict(card)) for card in DECK)  # each card id's JSON, for splicing
+
+
+class Connection:
+    """
+    A client's websocket with a bounded outbound queue drained by its own writer task.
+
+    Once the queue is full, queued full-state frames are dropped in favour of
+    the newest one. A client that stays over the limit for longer than
+    MAX_LAGGING_SECONDS, or whose send takes longer than SEND_TIMEOUT, is
+    disconnected instead of holding up the rest of the session.
+    """
+
+    def __init__(self, websocket: WebSocket, id, name: str, latency: Optional[deque] = None,
+                 max_queue: int = MAX_QUEUE, protocol: str = 'full'):
+        self.websocket = websocket
+        self.id = id
+        self.name = name
+        self.protocol = protocol if protocol in PROTOCOLS else 'full'
+        self.latency = latency
+        self.max_queue = max_queue
+        self.queue: deque = deque()  # (text, is_state, queued_at); text None closes
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self.lagging_since: Optional[float] = None
+        self.trace: Optional[SessionTrace] = None  # set while the client's session is traced
+        self._ready = asyncio.Event()
+        self._writer = asyncio.ensure_future(self._write())
+
+    def send(self, text: str, state: bool = False) -> bool:
+        """Queues a frame without waiting; False if the client is gone or was just dropped."""
+        if self.closed:
+            return False
+        queue = self.queue
+        if state and len(queue) >= self.max_queue:
+            kept = deque(frame for frame in queue if not frame[1])
+            self.dropped += len(queue) - len(kept)
+            self.queue = queue = kept
+        queue.append((text, state, time.perf_counter()))
+        self._ready.set()
+
+        if len(queue) <= self.max_queue:
+            self.lagging_since = None
+        elif self.lagging_since is None:
+            self.lagging_since = time.monotonic()
+        elif time.monotonic() - self.lagging_since > MAX_LAGGING_SECONDS:
+            self.abort('send queue over limit')
+            return False
+        return True
+
+    async def _write(self):
+        try:
+            while True:
+                while not self.queue:
+                    if self.closed:  # stop() raced a finishing send, whose wait_for ate the cancel
+                        return
+                    self._ready.clear()
+                    await self._ready.wait()
+                text, _, queued_at = self.queue.popleft()
+                if text is None:
+                    return
+                trace = self.trace
+                started = time.perf_counter() if trace is not None else 0.0
+                await asyncio.wait_for(self.websocket.send_text(text), SEND_TIMEOUT)
+                self.sent += 1
+                if trace is not None:
+                    trace.span('send', started, time.perf_counter(), self.id, {'bytes': len(text)})
+                if self.latency is not None:
+                    self.latency.append(time.perf_counter() - queued_at)
+        except asyncio.TimeoutError:
+            self.abort('send timed out')
+        except RuntimeError:  # socket already closed
+            self.closed = True
+        except Exception as e:
+            print("Send to", self.id, "failed:", repr(e))
+            self.abort('send failed')
+
+    def abort(self, reason: str):
+        """Drops queued frames and disconnects the client without waiting for it."""
+        if self.closed and self._writer.done():
+            return
+        print("Disconnecting", self.id, reason)
+        metrics.send_failures.inc(reason)
+        self.stop()
+        asyncio.ensure_future(self._close_socket(1013))
+
+    def stop(self):
+        """Stops the writer, e.g. after the client has already disconnected."""
+        self.closed = True
+        self.dropped += len(self.queue)
+        self.queue.clear()
+        self._ready.set()
+        if not self._writer.done() and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    async def close(self):
+        """Flushes what is queued (up to SEND_TIMEOUT) and closes the websocket."""
+        if not self.closed:
+            self.closed = True
+            self.queue.append((None, False, 0.0))
+            self._ready.set()
+            await asyncio.wait({self._writer}, timeout=SEND_TIMEOUT)
+            self.stop()
+        await self._close_socket(1000)
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except (RuntimeError, WebSocketDisconnect):  # the client closed first
+            pass
+
+    def stats(self) -> dict:
+        return {
+            'id': self.id,
+            'protocol': self.protocol,
+            'queued': len(self.queue),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'lagging_for': round(time.monotonic() - self.lagging_since, 3) if self.lagging_since else 0.0,
+            'closed': self.closed,
+        }
+
+
+class Timer:
+    """A deadline on a TimerWheel; cancel() before it fires to drop it."""
+
+    __slots__ = ('wheel', 'deadline', 'tick', 'callback', 'args', 'cancelled')
+
+    def __init__(self, wheel: 'TimerWheel', deadline: float, tick: int, callback: Callable, args: tuple):
+        self.wheel = wheel
+        self.deadline = deadline
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self.wheel.active -= 1
+
+
+class TimerWheel:
+    """
+    A hashed timing wheel shared by every session for turn deadlines.
+
+    Each timer sits in the slot of the tick it expires on, so scheduling and
+    cancelling are O(1), and a single driver task advances the wheel a tick at
+    a time instead of one sleeping task per deadline. Deadlines more than one
+    revolution away stay in their slot until their own tick comes round.
+    Cancelled timers are dropped when their slot is next visited. The driver
+    waits on an event instead of ticking while no timer is pending.
+    """
+
+    def __init__(self, tick: float = TIMER_TICK, slots: int = TIMER_SLOTS):
+        self.tick = tick
+        self.slots: List[List[Timer]] = [[] for _ in range(slots)]
+        self.current = 0  # the last tick processed, counted from origin
+        self.origin: Optional[float] = None
+        self.active = 0
+        self.fired = 0
+        self.lag: deque = deque(maxlen=4096)  # seconds between deadline and callback
+        self._wake: Optional[asyncio.Event] = None
+        self._driver: Optional[asyncio.Task] = None
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """Calls ``callback(*args)`` on the running loop ``delay`` seconds from now."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._driver is None or self._driver.done():
+            self.origin = now
+            self.current = 0
+            self._wake = asyncio.Event()
+            self._driver = asyncio.ensure_future(self._run())
+        deadline = now + delay
+        now_tick = int((now - self.origin) / self.tick)
+        tick = max(math.ceil((deadline - self.origin) / self.tick), now_tick + 1)
+        timer = Timer(self, deadline, tick, callback, args)
+        self.slots[tick % len(self.slots)].append(timer)
+        self.active += 1
+        self._wake.set()
+        return timer
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.active:
+                self._wake.clear()
+                await self._wake.wait()
+                self.current = max(self.current, int((loop.time() - self.origin) / self.tick))
+                continue
+            await asyncio.sleep(self.origin + (self.current + 1) * self.tick - loop.time())
+            now_tick = int((loop.time() - self.origin) / self.tick)
+            while self.current < now_tick:
+                self.current += 1
+                self._expire(self.current, loop)
+
+    def _expire(self, tick: int, loop):
+        index = tick % len(self.slots)
+        pending = []
+        for timer in self.slots[index]:
+            if timer.cancelled:
+                continue
+            if timer.tick > tick:
+                pending.append(timer)
+                continue
+            timer.cancelled = True
+            self.active -= 1
+            self.fired += 1
+            self.lag.append(loop.time() - timer.deadline)
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print("Timer callback failed:", repr(e))
+        self.slots[index] = pending
+
+    def stats(self) -> dict:
+        return {'active': self.active, 'fired': self.fired, 'lag': percentiles(self.lag)}
 
 
-    
 @dataclass
 class Session:
     id: int
@@ -19,13 +273,47 @@ class Session:
     numAI: int
     timeLimit: int
     isPrivate: bool
-    clients: List[tuple[WebSocket, int, str]]
-    status: str = "waiting"  # "waiting", "starting",  "playing", "finished"
+    clients: List[Connection]
+    status: str = "waiting"  # "waiting", "starting", "in-progress", "game_over"
     current_turn_index: int = 0
     turns_played: int = 0
+    houseRules: Optional[dict] = None
+    aiLevel: str = 'greedy'  # the AI players' difficulty, 'greedy' or 'search'
+    game: Optional[Whot] = field(default=None, init=False, repr=False)
+    state: Optional[GameState] = field(default=None, init=False, repr=False)
+    sent_rankings: Optional[list] = field(default=None, init=False, repr=False)
+    broadcast_latency: deque = field(default_factory=lambda: deque(maxlen=1024), init=False, repr=False)
+    listener: Optional[Callable] = field(default=None, init=False, repr=False)  # called on lobby-visible changes
+    full: asyncio.Event = field(default_factory=asyncio.Event, init=False, repr=False)
+    started: asyncio.Event = field(default_factory=asyncio.Event, init=False, repr=False)
+    finished: asyncio.Event = field(default_factory=asyncio.Event, init=False, repr=False)
+    _seats: asyncio.Event = field(default_factory=asyncio.Event, init=False, repr=False)
+    _countdown: Optional[asyncio.TimerHandle] = field(default=None, init=False, repr=False)
+    moves: deque = field(default_factory=deque, init=False, repr=False)  # (kind, payload, sender, received_at)
+    move_latency: deque = field(default_factory=lambda: deque(maxlen=1024), init=False, repr=False)
+    stale_moves: int = field(default=0, init=False, repr=False)
+    _moves_ready: Optional[asyncio.Event] = field(default=None, init=False, repr=False)
+    _actor: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+    timers: Optional[TimerWheel] = field(default=None, init=False, repr=False)  # set by SessionsManager
+    timeouts: int = field(default=0, init=False, repr=False)
+    _turn_timer: Optional[Timer] = field(default=None, init=False, repr=False)
+    _turn_token: int = field(default=0, init=False, repr=False)
+    trace: Optional[SessionTrace] = field(default=None, init=False, repr=False)  # set while traced
+    journal: Optional[Journal] = field(default=None, init=False, repr=False)  # set by SessionsManager
+    held: Dict = field(default_factory=dict, init=False, repr=False)  # id -> [name, kind] of recovered seats
+    _decks_journaled: int = field(default=0, init=False, repr=False)
     
+    @property
+    def player_cards(self) -> list:
+        """Every seat's hand in the {id, name, hand} wire format."""
+        state = self.state
+        return [
+            {'id': player_id, 'name': name, 'hand': cards_to_dicts(hand)}
+            for player_id, name, hand in zip(state.ids, state.names, state.hands)
+        ]
 
-    async def add_client(self, client: WebSocket, client_id: int, name: str) -> bool:
+    async def add_client(self, client: WebSocket, client_id: int, name: str,
+                         protocol: str = 'full') -> bool:
         """
         Adds a client to the session.
 
@@ -35,136 +323,781 @@ class Session:
             The websocket object to be added.
         client_id : int
             The ID of the client.
+        protocol : str
+            'full' for a complete state every move, 'delta' for snapshot plus deltas,
+            'view' for the public state plus only this client's own hand.
 
         Returns
         -------
         bool
             True if the client was successfully added, False otherwise.
         """
-        if len(self.clients) == self.numPlayers:
+        if not self.has_seat_for(client_id, name):
             return False
-        
-        for client_ in self.clients:
-            if client_[1]== client_id or client_[2]== name:
-                return False
-        self.clients.append((client, client_id, name))
-        print("Added name: ",name, "to session:", self.id)
+        return await self.add_connection(Connection(client, client_id, name, self.broadcast_latency,
+                                                    protocol=protocol))
+    
+    def has_seat_for(self, client_id, name: str) -> bool:
+        """Whether the client holds a recovered seat, or a seat is free and neither the id nor the name is taken."""
+        if client_id in self.held:
+            return True
+        if len(self.clients) + len(self.held) >= self.numPlayers:
+            return False
+        return all(client.id != client_id and client.name != name for client in self.clients) \
+            and all(held_name != name for held_name, _ in self.held.values())
+    
+    async def add_connection(self, connection) -> bool:
+        """
+        Seats an already built client, e.g. a Connection or an in-process BotSeat.
+
+        Parameters
+        ----------
+        connection : Connection or BotSeat
+            Anything with the Connection interface; an 'object' protocol client
+            is handed each full state dict by ``receive`` instead of a frame.
+
+        Returns
+        -------
+        bool
+            True if the client was seated, False otherwise.
+        """
+        if not self.has_seat_for(connection.id, connection.name):
+            connection.stop()
+            return False
+        rejoined = self.held.pop(connection.id, None) is not None
+        self.clients.append(connection)
+        print("Added name: ", connection.name, "to session:", self.id)
+        if rejoined:
+            if self.state is not None:
+                self.resync(connection)
+        elif self.journal is not None:
+            self.journal.append(JOIN, self.id, [connection.id, connection.name, seat_kind(connection)])
+        await self.seats_changed()
         return True
     
     async def remove_client(self, client_id):
-        self.clients = list(filter(lambda x: x[1] != client_id, self.clients))
-        data = {}
-        if self.numPlayers > len(self.clients):
-            player_cards = self.player_cards
-            player_ids = [p['id'] for p in player_cards]
-            client_ids = [c[1] for c in self.clients]
-            left_match_ids = list(set(player_ids) - set(client_ids))
-            new_cards = list(filter(lambda x: x['id'] not in left_match_ids, player_cards))
-            if len(self.clients) == 1:
-                data['winner'] = new_cards[0]['name']
-                data['rankings'] = [[0, new_cards[0]['name']]]
-                await self.broadcast_message(data)
-                return
-            data['player_cards'] = new_cards
-            await self.broadcast_message(data)
+        for client in self.clients:
+            if client.id == client_id:
+                client.stop()
+                metrics.disconnects.inc()
+        self.clients = list(filter(lambda x: x.id != client_id, self.clients))
+        if self.journal is not None:
+            self.journal.append(LEAVE, self.id, client_id)
+        await self.seats_changed()
+        if self._actor is not None and not self._actor.done():
+            self.submit(client_id, kind='leave')
+        else:
+            await self.remove_player(client_id)
+    
+    async def remove_player(self, client_id):
+        """Takes a departed client's seat out of the game and tells the others."""
+        if self.state is None or not self.state.remove(client_id):
             return
+        if self.journal is not None:
+            self.journal.append(REMOVE, self.id, client_id)
+        if len(self.state.ids) <= 1:
+            self.cancel_turn_timer()
+            if self.state.ids:
+                name = self.state.names[0]
+                await self.broadcast_message({'winner': name, 'rankings': [[0, name]]})
+            return
+        await self.broadcast_state(self.state_message(self.rankings_update()))
+        self.arm_turn_timer()
         
           
-    async def broadcast_message(self, message):
-        for client in self.clients:
+    async def seats_changed(self):
+        """
+        Fires the seat events after a client joined or left.
+
+        Before the game starts, waiting clients are told the new seat count, a
+        full session gets its start countdown scheduled, and a seat freed
+        during the countdown cancels it.
+        """
+        seats, self._seats = self._seats, asyncio.Event()
+        seats.set()
+        if len(self.clients) == self.numPlayers:
+            self.full.set()
+        else:
+            self.full.clear()
+        if self.status == 'starting' and not self.full.is_set() and self._countdown:
+            self._countdown.cancel()
+            self._countdown = None
+            self.status = 'waiting'
+        self.changed()
+        if self.status == 'waiting':
+            await self.broadcast_message({'status': 'waiting', 'num_players': len(self.clients),
+                                          'max_players': self.numPlayers})
+            if self.full.is_set():
+                await self.start_countdown()
+    
+    async def seat_change(self) -> int:
+        """
+        Waits for the next client to join or leave.
+
+        Returns
+        -------
+        int
+            The number of clients after the change.
+        """
+        await self._seats.wait()
+        return len(self.clients)
+    
+    async def start_countdown(self, delay: float = START_COUNTDOWN):
+        """Announces the start and schedules start_game ``delay`` seconds from now."""
+        self.status = 'starting'
+        self.changed()
+        await self.broadcast_message({'status': 'starting'})
+        loop = asyncio.get_running_loop()
+        self._countdown = loop.call_later(delay, lambda: asyncio.ensure_future(self.start_game()))
+    
+    async def broadcast_message(self, message, state: bool = False) -> list:
+        """
+        Serializes message once and queues the frame on every client's connection.
+
+        Parameters
+        ----------
+        message : dict
+            The JSON-serializable message to send.
+        state : bool
+            Whether message is a full game state that a newer one supersedes.
+
+        Returns
+        -------
+        list
+            The ids of clients that could not take the frame.
+        """
+        start = time.perf_counter()
+        text = encode(message)
+        failed = [client.id for client in list(self.clients) if not client.send(text, state)]
+        metrics.broadcast_seconds.observe(time.perf_counter() - start, 'message')
+        return failed
+    
+    async def broadcast_state(self, full, delta=None, public=None, light=None) -> list:
+        """
+        Queues a game state update on every client in the protocol it asked for.
+
+        Each variant may be given as a dict or as a function building it, and
+        is built and serialized at most once, only if some client needs it.
+        Delta clients get a snapshot instead when there is no delta or when their
+        queue is full, since coalescing would drop deltas they cannot do without.
+        View clients get the encoded public part spliced into a frame with their
+        own private part, so only that small part is serialized per viewer.
+        In-process clients get the light dict, or else the full one, never serialized.
+
+        Parameters
+        ----------
+        full : dict or callable
+            The update in the full-state format.
+        delta : dict or callable, optional
+            The same update as a delta against the previous one.
+        public : dict or callable, optional
+            The update's public part; defaults to the current public view.
+        light : dict or callable, optional
+            What in-process clients need of the update, at least turn and winner.
+
+        Returns
+        -------
+        list
+            The ids of clients that could not take the frame.
+        """
+        start = time.perf_counter()
+        builders = {'full': full, 'delta': delta, 'snapshot': self.snapshot,
+                    'public': public if public is not None else lambda: self.public_view(self.state.rankings()),
+                    'object': light if light is not None else full}
+        messages = {}
+        def message(kind: str) -> dict:
+            if kind not in messages:
+                value = builders[kind]
+                messages[kind] = value() if callable(value) else value
+            return messages[kind]
+        frames = {}
+        def frame(kind: str) -> str:
+            if kind not in frames:
+                frames[kind] = encode(message(kind))
+            return frames[kind]
+        
+        failed = []
+        for client in list(self.clients):
+            kind = client.protocol
+            if kind == 'object':
+                if not client.receive(message('object')):
+                    failed.append(client.id)
+                continue
+            if kind == 'view':
+                text = self.view_frame(frame('public'), client.id)
+            else:
+                if kind == 'delta' and (delta is None or len(client.queue) >= client.max_queue):
+                    kind = 'snapshot'
+                text = frame(kind)
+            if not client.send(text, True):
+                failed.append(client.id)
+        end = time.perf_counter()
+        metrics.broadcast_seconds.observe(end - start, 'state')
+        if self.trace is not None:
+            self.trace.span('serialize', start, end, args={'variants': len(frames)})
+        return failed
+    
+    def changed(self):
+        """Tells the listener, if any, that the status or seat count changed."""
+        if self.listener is not None:
+            self.listener(self)
+    
+    def lobby_entry(self) -> Optional[dict]:
+        """The session as the lobby lists it, or None if it should not be listed."""
+        seated = len(self.clients) + len(self.held)
+        if self.isPrivate or self.status in ('finished', 'game_over') or seated == 0:
+            return None
+        return {
+            'id': self.id,
+            'private': self.isPrivate,
+            'host': self.hostName,
+            'status': self.status,
+            'max_players': self.numPlayers,
+            'num_players': seated,
+        }
+    
+    def broadcast_stats(self) -> dict:
+        """Queue-to-socket latency percentiles, in milliseconds, of recent frames."""
+        return percentiles(self.broadcast_latency)
+    
+    def move_stats(self) -> dict:
+        """Receive-to-applied latency percentiles, in milliseconds, of recent moves; pacing excluded."""
+        return {**percentiles(self.move_latency), 'queued': len(self.moves), 'stale': self.stale_moves,
+                'timeouts': self.timeouts}
+    
+    def connection_stats(self) -> list:
+        """Queue depth and drop counts for each connected client."""
+        return [client.stats() for client in self.clients]
+                    
+    def submit(self, payload, sender: WebSocket = None, kind: str = 'move'):
+        """
+        Queues a message for the session's actor and returns without waiting.
+
+        Parameters
+        ----------
+        payload : str, dict or id
+            The raw move or sync text (or an in-process bot's move dict), the
+            departed client's id for 'leave', or the turn token for 'timeout'.
+        sender : WebSocket, optional
+            The websocket the move came from.
+        kind : str
+            'move' for anything a client sent, 'leave' for a departure, 'timeout'
+            for an expired turn.
+        """
+        if self._actor is None or self._actor.done():
+            return
+        self.moves.append((kind, payload, sender, time.perf_counter()))
+        self._moves_ready.set()
+    
+    def start_actor(self):
+        """Starts the task that applies this session's moves and departures one at a time."""
+        if self._actor is None or self._actor.done():
+            self._moves_ready = asyncio.Event()
+            self._actor = asyncio.ensure_future(self._run())
+            self._actor.set_name(f'session {self.id}')  # what the loop monitor blames its stalls on
+    
+    def stop_actor(self):
+        """Drops queued messages and stops the actor once it finishes the one in hand."""
+        self.cancel_turn_timer()
+        if self._actor is not None and not self._actor.done():
+            self.moves.clear()
+            self.moves.append(('stop', None, None, 0.0))
+            self._moves_ready.set()
+    
+    async def _run(self):
+        while not self.finished.is_set():
+            while not self.moves:
+                self._moves_ready.clear()
+                await self._moves_ready.wait()
+            kind, payload, sender, received_at = self.moves.popleft()
             try:
-                await client[0].send_json(message)
-            except RuntimeError:
-                ...
+                if kind == 'stop':
+                    return
+                if kind == 'leave':
+                    await self.remove_player(payload)
+                elif kind == 'timeout':
+                    await self.turn_timed_out(payload)
+                else:
+                    await self.process_game_move(payload, sender, received_at)
             except Exception as e:
-                print(e)
+                print("Session", self.id, "dropped a", kind, "it could not process:", repr(e))
+    
+    def arm_turn_timer(self):
+        """Gives the player on turn timeLimit seconds, replacing any earlier deadline."""
+        self.cancel_turn_timer()
+        if self.timers is None or not self.timeLimit or self.state is None or self.finished.is_set():
+            return
+        self._turn_token += 1
+        self._turn_timer = self.timers.schedule(self.timeLimit, self.submit, self._turn_token,
+                                                None, 'timeout')
+    
+    def cancel_turn_timer(self):
+        if self._turn_timer is not None:
+            self._turn_timer.cancel()
+            self._turn_timer = None
+    
+    async def turn_timed_out(self, token: int):
+        """Sends the player whose turn expired to market, unless the turn has since moved on."""
+        if token != self._turn_token or self.state is None or self.finished.is_set():
+            return
+        self.timeouts += 1
+        metrics.turn_timeouts.inc()
+        turn = self.state.ids[self.state.turn]
+        await self.process_game_move(encode({'stack': [], 'turn': turn, 'seq': self.turns_played}))
+    
+    def validate_move(self, data: dict, sender_id=None) -> str:
+        """
+        Checks a decoded move against the server's game state.
+
+        Returns
+        -------
+        str
+            Why the move was rejected, or an empty string if it is legal.
+        """
+        if data.get('seq', self.turns_played) != self.turns_played:
+            return 'stale'
+        state = self.state
+        turn = state.ids[state.turn]
+        if data.get('turn', turn) != turn or (sender_id is not None and sender_id != turn):
+            return 'not your turn'
+        if not is_legal_stack(state.face_card, data['stack']):
+            return 'illegal stack'
+        remaining = list(state.hands[state.turn])
+        for card in data['stack']:
+            if card not in remaining:
+                return 'card not in hand'
+            remaining.remove(card)
+        return ''
                     
-    async def process_game_move(self, move):
-        if not move or len(move) == 0:
+    async def process_game_move(self, move, sender: WebSocket = None,
+                                received_at: Optional[float] = None):
+        """
+        Applies a move or answers a sync request, then delivers the new state.
+
+        The result goes out MOVE_PACING seconds after ``received_at`` so clients
+        can animate the move; only the session's actor waits for it.
+        """
+        begun = time.perf_counter()
+        if received_at is None:
+            received_at = begun
+        if not move or len(move) == 0 or self.state is None:
+            return
+        data = json.loads(move) if isinstance(move, str) else dict(move)
+        connection = next((c for c in self.clients if c.websocket is sender), None) if sender else None
+        if data.get('type') == 'sync':
+            if connection:
+                self.resync(connection)
             return
-        data = json.loads(move)
         last_stack = data['stack']
-        data = self.game.process_game_move(data)
+        sender_id = connection.id if connection else None
+        try:
+            data['stack'] = cards_from_dicts(last_stack)
+            reason = self.validate_move(data, sender_id)
+        except KeyError:
+            reason = 'unknown card'
+        if reason:
+            metrics.moves.inc(reason)
+            if self.trace is not None:
+                self.trace.span('rejected', begun, time.perf_counter(), args={'reason': reason})
+            if reason == 'stale':
+                self.stale_moves += 1
+            if connection:
+                connection.send(encode({'status': 'invalid_move', 'reason': reason}))
+            return
+        state = self.state
+        face_card = state.face_card
+        player = state.ids[state.turn]
+        state.log = []
+        parsed = time.perf_counter()
+        try:
+            self.game.play(data['stack'])
+        finally:
+            log, state.log = state.log, None
+        played = time.perf_counter()
+        metrics.engine_move_seconds.observe(played - parsed)
+        metrics.moves.inc('applied')
         
         self.turns_played += 1
-        data['turns_played'] = self.turns_played
-        data['last_stack'] = last_stack
-        
-        if self.numPlayers > len(self.clients):
-            player_cards = self.player_cards
-            player_ids = [p['id'] for p in player_cards]
-            client_ids = [c[1] for c in self.clients]
-            left_match_ids = list(set(player_ids) - set(client_ids))
-            new_cards = list(filter(lambda x: x['id'] not in left_match_ids, player_cards))
-            if len(self.clients) == 1:
-                data['winner'] = player_cards[0]['name']
-                data['rankings'] = [[0, player_cards[0]['name']]]
-                await self.broadcast_message(data)
-                return
-            data['player_cards'] = new_cards
-            
-        self.player_cards = data['player_cards']
+        if self.journal is not None:
+            self.journal_decks()
+            self.journal.append(MOVE, self.id, (self.turns_played - 1, data['stack']))
+        rankings = self.rankings_update()
+        ranked = time.perf_counter()
+        self.move_latency.append(ranked - received_at)
+        metrics.session_move_seconds.observe(ranked - received_at)
         
-        await asyncio.sleep(0.25)
+        await asyncio.sleep(max(0.0, received_at + MOVE_PACING - ranked))
+        trace = self.trace
+        if trace is not None:
+            trace.span('move', received_at, time.perf_counter(),
+                       args={'turn': player, 'seq': self.turns_played - 1, 'cards': len(last_stack)})
+            trace.span('queued', received_at, begun)
+            trace.span('parse', begun, parsed)
+            trace.span('rules', parsed, played)
+            trace.span('ranking', played, ranked)
+            trace.span('pacing', ranked, time.perf_counter())
         
-        if self.is_game_over(data):
+        over = self.is_game_over()
+        if over:
             self.status = "game_over"
-            await self.broadcast_message({'status': 'game_over', **data})
-            clients = self.clients
-            for client in clients:
-                try:
-                    await client[0].close()
-                    self.clients.remove(client)
-                except RuntimeError:
-                    continue
-            print("Game Over", data['winner'], "wins")
-            
-        await self.broadcast_message(data)
+            if self.journal is not None:
+                self.journal.append(END, self.id)
+            rankings = self.state.rankings()
+        ended = {'status': 'game_over'} if over else {}
+        # Each variant is built by broadcast_state only if a client takes it
+        full = lambda: {**ended, **self.state_message(rankings), 'turns_played': self.turns_played,
+                        'last_stack': last_stack}
+        delta = lambda: {**ended, **self.delta_message(log, face_card, rankings, last_stack)}
+        public = lambda: {**ended, **self.public_view(rankings, last_stack)}
+        light = lambda: {**ended, 'turn': self.state.ids[self.state.turn], 'winner': self.state.winner(),
+                         'seq': self.turns_played}
+        await self.broadcast_state(full, delta, public, light)
+        if over:
+            self.cancel_turn_timer()
+            clients, self.clients = self.clients, []
+            self.changed()
+            self.finished.set()
+            await asyncio.gather(*(client.close() for client in clients))
+            if self.trace is not None:
+                tracer.flush()
+        else:
+            self.arm_turn_timer()
+        
+    def resync(self, connection):
+        """Sends a client the whole current state, in its protocol, e.g. after a sync request."""
+        if connection.protocol == 'view':
+            connection.send(self.view_frame(encode(self.public_view(self.state.rankings())), connection.id), True)
+        else:
+            connection.send(encode(self.snapshot()), True)
+        
+    def set_trace(self, trace: Optional[SessionTrace]):
+        """Starts or, with None, stops tracing this session's moves and its clients' sends."""
+        self.trace = trace
+        for client in self.clients:
+            client.trace = trace
         
-    def is_game_over(self, data):
-        return data['winner'] != ''
+    def is_game_over(self) -> bool:
+        return self.state.winner() != ''
+    
+    def legal_moves(self) -> int:
+        """Bitmask of the hand positions the player on turn may open with."""
+        return legal_positions(self.state.face_card, self.state.hands[self.state.turn])
+    
+    def rankings_update(self) -> Optional[list]:
+        """The rankings if they changed since the last ones sent, else None."""
+        rankings = self.state.rankings()
+        if rankings == self.sent_rankings:
+            return None
+        self.sent_rankings = rankings
+        return rankings
+    
+    def state_message(self, rankings: Optional[list] = None) -> dict:
+        """The full game state, the fallback format; rankings are included when given."""
+        state = self.state
+        data = {
+            'player_cards': self.player_cards,
+            'face_card': card_to_dict(state.face_card),
+            'turn': state.ids[state.turn],
+            'market': state.market,
+            'winner': state.winner(),
+            'legal_moves': self.legal_moves(),
+        }
+        if rankings is not None:
+            data['rankings'] = rankings
+        return data
+    
+    def public_view(self, rankings: Optional[list], last_stack: Optional[list] = None) -> dict:
+        """What every viewer may see: hand sizes but no cards; rankings and last_stack when given."""
+        state = self.state
+        data = {
+            'seq': self.turns_played,
+            'face_card': card_to_dict(state.face_card),
+            'turn': state.ids[state.turn],
+            'market': state.market,
+            'hand_counts': {player_id: len(hand) for player_id, hand in zip(state.ids, state.hands)},
+            'winner': state.winner(),
+            'timePerTurn': self.timeLimit,
+        }
+        if rankings is not None:
+            data['rankings'] = rankings
+        if last_stack is not None:
+            data['last_stack'] = last_stack
+        if self.status == 'game_over':
+            data['status'] = 'game_over'
+        return data
+    
+    def view_frame(self, public_text: str, client_id) -> str:
+        """
+        Splices an already encoded public view and one client's private view into a frame.
+
+        The private part is assembled from CARD_TEXT rather than encoded, and
+        reads the same as ``encode(self.private_view(client_id))``.
+        """
+        state = self.state
+        seat = state.seat_of.get(client_id)
+        if seat is None:
+            private = 'null'
+        else:
+            hand = ','.join([CARD_TEXT[card] for card in state.hands[seat]])
+            private = '{"id":%s,"hand":[%s]%s}' % (
+                encode(client_id), hand,
+                ',"legal_moves":%d' % self.legal_moves() if seat == state.turn else '')
+        return '{"type":"view","public":%s,"private":%s}' % (public_text, private)
+    
+    def private_view(self, client_id) -> Optional[dict]:
+        """A seated player's own hand, plus legal_moves on their turn; None for spectators."""
+        state = self.state
+        seat = state.seat_of.get(client_id)
+        if seat is None:
+            return None
+        data = {'id': client_id, 'hand': cards_to_dicts(state.hands[seat])}
+        if seat == state.turn:
+            data['legal_moves'] = self.legal_moves()
+        return data
+    
+    def snapshot(self) -> dict:
+        """Everything a delta client needs to (re)build its view, sent on start and on sync."""
+        state = self.state
+        return {
+            'type': 'snapshot',
+            'seq': self.turns_played,
+            'player_cards': self.player_cards,
+            'face_card': card_to_dict(state.face_card),
+            'turn': state.ids[state.turn],
+            'market': state.market,
+            'winner': state.winner(),
+            'rankings': state.rankings(),
+            'legal_moves': self.legal_moves(),
+            'timePerTurn': self.timeLimit,
+            **({'status': 'game_over'} if self.status == 'game_over' else {}),
+        }
+    
+    def delta_message(self, log: list, face_card: int, rankings: Optional[list],
+                      last_stack: list) -> dict:
+        """
+        The changes one move made, to be applied on top of update ``seq - 1``.
+
+        Parameters
+        ----------
+        log : list
+            The (seat, added, cards) hand changes GameState recorded during the move.
+        face_card : int
+            The face card before the move.
+        rankings : list or None
+            The new rankings, or None if they did not change.
+        last_stack : list
+            The stack as the mover sent it.
+
+        Returns
+        -------
+        dict
+            ``hands`` maps player ids to the cards to ``remove`` (first matching
+            card each) and then ``add`` to the end of that hand.
+        """
+        state = self.state
+        hands = {}
+        ids = state.ids
+        for seat, added, cards in log:
+            if seat < len(ids) and cards:
+                change = hands.setdefault(ids[seat], {})
+                change.setdefault('add' if added else 'remove', []).extend(cards_to_dicts(cards))
+        data = {
+            'type': 'delta',
+            'seq': self.turns_played,
+            'turn': ids[state.turn],
+            'market': state.market,
+            'legal_moves': self.legal_moves(),
+            'last_stack': last_stack,
+            'hands': hands,
+        }
+        if state.face_card != face_card:
+            data['face_card'] = card_to_dict(state.face_card)
+        winner = state.winner()
+        if winner:
+            data['winner'] = winner
+        if rankings is not None:
+            data['rankings'] = rankings
+        return data
                 
     async def start_game(self):
-        self.status = "starting"
-        await self.broadcast_message({'status': 'starting'})
-        await asyncio.sleep(3)
-        
-        self.game = Whot(clients=self.clients)
+        """Deals and starts the game right away; a full session schedules it via start_countdown."""
+        if self._countdown:
+            self._countdown.cancel()
+            self._countdown = None
+        if self.started.is_set():
+            return
+        self.set_trace(tracer.trace_for(self.id, starting=True))
+        dealing = time.perf_counter()
+        self.game = Whot(clients=self.clients, rules=self.house_rules())
         
-        cards = self.game.distribute_cards(self.numPlayers, self.numStartingCards)
-        player_cards = [
-            {
-                'id': self.clients[i][1],
-                'name': self.clients[i][-1],
-                'hand': cards[i],
-            }
-            for i in range(len(self.clients))
-        ]
-        face_card = self.game.get_starting_card()
+        self.state = self.game.deal([c.id for c in self.clients], [c.name for c in self.clients],
+                                    self.numStartingCards)
+        if self.journal is not None:
+            self.journal_decks()
+            self.journal.append(START, self.id, [list(self.state.ids), list(self.state.names)])
+        if self.trace is not None:
+            self.trace.span('deal', dealing, time.perf_counter(), args={'players': len(self.clients)})
         data = {
-            'player_cards': player_cards,
-            'face_card': face_card,
-            'turn': self.clients[0][1],
+            'player_cards': self.player_cards,
+            'face_card': card_to_dict(self.state.face_card),
+            'turn': self.state.ids[self.state.turn],
             'market': 0,
-            'timePerTurn': self.timeLimit
+            'timePerTurn': self.timeLimit,
+            'legal_moves': self.legal_moves(),
         }
-        self.player_cards = player_cards
         
-        await self.broadcast_message(data)
+        await self.broadcast_state(data)
         self.status = 'in-progress'
+        self.changed()
+        self.started.set()
+        self.start_actor()
+        self.arm_turn_timer()
         await self.broadcast_message({'status': 'in-progress'})
+        
+    def house_rules(self) -> HouseRules:
+        return HouseRules.from_dict(self.houseRules) if self.houseRules else STANDARD_RULES
+    
+    def settings(self) -> dict:
+        """The settings the session was created with, as Session takes them."""
+        return {'hostName': self.hostName, 'numStartingCards': self.numStartingCards,
+                'numPlayers': self.numPlayers, 'numAI': self.numAI, 'timeLimit': self.timeLimit,
+                'isPrivate': self.isPrivate, 'houseRules': self.houseRules, 'aiLevel': self.aiLevel}
+    
+    def journal_decks(self):
+        """Journals the seeds of the decks the draw pile took since the last call."""
+        seeds = self.game.deck.seeds
+        if len(seeds) > self._decks_journaled:
+            for seed in seeds[self._decks_journaled:]:
+                self.journal.append(DECK_SEED, self.id, seed)
+            self._decks_journaled = len(seeds)
+    
+    def journal_snapshot(self) -> dict:
+        """
+        Everything needed to rebuild the session, for a journal snapshot.
+
+        Everything is copied, as the journal's writer encodes it later.
+        """
+        seats = [[client.id, client.name, seat_kind(client)] for client in self.clients]
+        seats += [[client_id, name, kind] for client_id, (name, kind) in self.held.items()]
+        snapshot = {'settings': self.settings(), 'seats': seats, 'turns_played': self.turns_played, 'game': None}
+        state = self.state
+        if state is not None:
+            snapshot['game'] = {'ids': list(state.ids), 'names': list(state.names),
+                                'hands': [list(hand) for hand in state.hands], 'turn': state.turn,
+                                'face_card': state.face_card, 'market': state.market,
+                                'deck': list(self.game.deck.cards)}
+        return snapshot
+    
+    def restore(self, snapshot: dict, pool: ReplayPool):
+        """Takes up a journal snapshot; later decks come from ``pool``, as when replaying a deal."""
+        self.held = {client_id: [name, kind] for client_id, name, kind in snapshot['seats']}
+        self.turns_played = snapshot['turns_played']
+        game = snapshot['game']
+        if game is None:
+            return
+        self.game = Whot(clients=self.clients, rules=self.house_rules(), deck=DrawPile(pool, cards=game['deck']))
+        state = self.state = self.game.state = GameState(game['ids'], game['names'], game['hands'])
+        state.turn = game['turn']
+        state.face_card = game['face_card']
+        state.market = game['market']
+    
+    def replay_start(self, ids: list, names: list, pool: ReplayPool):
+        """Deals again from the journaled decks in ``pool``."""
+        self.game = Whot(clients=self.clients, pool=pool, rules=self.house_rules())
+        self.state = self.game.deal(ids, names, self.numStartingCards)
+    
+    def replay_move(self, seq: int, stack: list):
+        self.game.play(stack)
+        self.turns_played = seq + 1
+    
+    async def resume(self):
+        """Picks a recovered game up where it was: the actor, the turn timer and the bots on turn."""
+        self.game.deck.pool = deck_pool
+        self._decks_journaled = len(self.game.deck.seeds)
+        self.sent_rankings = self.state.rankings()
+        self.status = 'in-progress'
+        self.changed()
+        self.started.set()
+        self.start_actor()
+        self.arm_turn_timer()
+        await self.broadcast_state(self.state_message(self.sent_rankings))
+
+
+def seat_kind(client) -> str:
+    """How a seat is journaled: 'player' for a websocket, else the bot's level."""
+    return client.level if client.protocol == 'object' else 'player'
    
 
+@dataclass(frozen=True)
+class LobbyQuery:
+    """
+    One page of the lobby, filtered; watchers with equal queries share an encoded page.
+
+    Attributes:
+        offset (int): How many matching sessions to skip.
+        limit (int): Most sessions on the page, at most MAX_LOBBY_PAGE.
+        min_free_seats (int): Only sessions with at least this many open seats.
+        num_players (Optional[int]): Only sessions for exactly this many players.
+        status (Optional[str]): Only sessions in this status, e.g. "waiting".
+    """
+    offset: int = 0
+    limit: int = 50
+    min_free_seats: int = 0
+    num_players: Optional[int] = None
+    status: Optional[str] = None
+
+    def __post_init__(self):
+        """Coerces the fields a client sent; ValueError or TypeError if one cannot be."""
+        if self.status is not None and not isinstance(self.status, str):
+            raise TypeError(f'status must be a string, not {type(self.status).__name__}')
+        object.__setattr__(self, 'offset', max(0, int(self.offset)))
+        object.__setattr__(self, 'limit', min(max(1, int(self.limit)), MAX_LOBBY_PAGE))
+        object.__setattr__(self, 'min_free_seats', int(self.min_free_seats))
+        if self.num_players is not None:
+            object.__setattr__(self, 'num_players', int(self.num_players))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LobbyQuery':
+        return cls(**{key: data[key] for key in cls.__dataclass_fields__ if key in data})
+
+    def matches(self, entry: dict) -> bool:
+        return (entry['max_players'] - entry['num_players'] >= self.min_free_seats
+                and (self.num_players is None or entry['max_players'] == self.num_players)
+                and (self.status is None or entry['status'] == self.status))
+
+    def page(self, entries) -> dict:
+        games = [entry for entry in entries if self.matches(entry)]
+        return {
+            'games': games[self.offset:self.offset + self.limit],
+            'total': len(games),
+            'offset': self.offset,
+            'limit': self.limit,
+        }
+
+
 class SessionsManager:
     """
     A class that manages sessions and their clients.
 
     Attributes:
         ids (Dict[int, Session]): A dictionary mapping session IDs to sessions.
+        lobby (Dict[int, dict]): The listed public sessions' lobby entries, by session ID.
+        watchers (Dict[Connection, LobbyQuery]): Lobby connections and the page each one shows.
+        feeds (List[Connection]): Routers following every change to the lobby, see router.py.
+        timers (TimerWheel): The turn deadlines of every session.
+        journal (Journal): Where the sessions' inputs are journaled, if anywhere; see recover.
         instance (SessionsManager): The singleton instance of the SessionsManager class.
     """
 
     ids: Dict[int, Session] = dict()
+    lobby: Dict[int, dict] = dict()
+    watchers: Dict[Connection, LobbyQuery] = dict()
+    pages: Dict[LobbyQuery, str] = dict()  # the last page text published per query
+    feeds: List[Connection] = list()
+    lobby_changes: Dict[int, Optional[dict]] = dict()  # entries changed since the last publish, None if gone
+    timers = TimerWheel()  # turn deadlines of every session
+    journal: Optional[Journal] = None
+    lobby_pending = False
     instance = None
 
     def __init__(self):
@@ -198,11 +1131,21 @@ class SessionsManager:
         loop.run_until_complete(self.handle_session(id))
         loop.close()
             
-    async def handle_message(self, message: str, id: int):
-        session = self.ids[id]
-        await session.process_game_move(message)
+    async def handle_message(self, message: str, id: int, sender: WebSocket = None):
+        """
+        Hands a client's message to its session's actor without waiting for it.
+
+        Args:
+            message (str): The raw move or sync request.
+            id (int): The ID of the session.
+            sender (WebSocket): The websocket the message came from.
+        """
+        session = self.ids.get(id, None)
+        if session:
+            session.submit(message, sender)
         
-    async def add_client(self, client: WebSocket, session_id: int, client_id: int, name: str) -> bool:
+    async def add_client(self, client: WebSocket, session_id: int, client_id: int, name: str,
+                         protocol: str = 'full') -> bool:
         """
         Adds a client to a session.
 
@@ -210,11 +1153,12 @@ class SessionsManager:
             client (WebSocket): The client to add.
             session_id (int): The ID of the session to add the client to.
             client_id (int): The ID of the client to add.
+            protocol (str): 'full', 'delta' or 'view' game state updates.
 
         Returns:
             bool: True if the client was successfully added, False if the session is full.
         """
-        return await self.ids[session_id].add_client(client, client_id, name)
+        return await self.ids[session_id].add_client(client, client_id, name, protocol)
     
     async def remove_client(self, session_id: int, client_id: int) -> bool:
         """
@@ -242,6 +1186,154 @@ class SessionsManager:
         """
         if session.id not in self.ids:
             self.ids[session.id] = session
+            session.listener = self.session_changed
+            session.timers = self.timers
+            if self.journal is not None:
+                session.journal = self.journal
+                self.journal.append(SETTINGS, session.id, session.settings())
+                for client in session.clients:
+                    self.journal.append(JOIN, session.id, [client.id, client.name, seat_kind(client)])
+            self.session_changed(session)
+    
+    def session_changed(self, session: Session):
+        """
+        Updates a session's lobby entry and, if it changed, schedules a lobby push.
+
+        Args:
+            session (Session): The session whose status or seat count changed.
+        """
+        entry = session.lobby_entry() if self.ids.get(session.id) is session else None
+        if entry == self.lobby.get(session.id):
+            return
+        if entry is None:
+            del self.lobby[session.id]
+        else:
+            self.lobby[session.id] = entry
+        self.lobby_changes[session.id] = entry
+        self.schedule_lobby()
+    
+    def schedule_lobby(self):
+        """Publishes the lobby once the current batch of changes is done."""
+        if SessionsManager.lobby_pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.publish_lobby()
+        SessionsManager.lobby_pending = True
+        loop.call_soon(self.publish_lobby)
+    
+    def publish_lobby(self):
+        """
+        Encodes each watched page once and pushes it to the watchers whose page
+        changed, and the changed entries to the feeds.
+        """
+        SessionsManager.lobby_pending = False
+        if self.lobby_changes:
+            if self.feeds:
+                text = encode({'changes': list(self.lobby_changes.items())})
+                for feed in list(self.feeds):
+                    feed.send(text)
+            self.lobby_changes.clear()
+        entries = self.lobby.values()
+        pages = {}
+        for watcher, query in list(self.watchers.items()):
+            if query not in pages:
+                try:
+                    pages[query] = encode(query.page(entries))
+                except Exception:  # one watcher's page must not stop the others'
+                    continue
+            if pages[query] != self.pages.get(query):
+                watcher.send(pages[query], True)
+        SessionsManager.pages = pages
+    
+    def watch_lobby(self, websocket: WebSocket, query: LobbyQuery) -> Connection:
+        """
+        Starts pushing a lobby page to a websocket, beginning with the current one.
+
+        Args:
+            websocket (WebSocket): The accepted lobby websocket.
+            query (LobbyQuery): The page and filters to show.
+
+        Returns:
+            Connection: The watcher, for set_lobby_query and unwatch_lobby.
+        """
+        watcher = Connection(websocket, 'lobby', 'lobby', max_queue=4)
+        self.set_lobby_query(watcher, query)
+        return watcher
+    
+    def set_lobby_query(self, watcher: Connection, query: LobbyQuery):
+        """Switches a watcher to another page or filter and sends that page right away."""
+        text = self.pages.get(query)
+        if text is None:
+            text = self.pages[query] = encode(query.page(self.lobby.values()))
+        self.watchers[watcher] = query
+        watcher.send(text, True)
+    
+    def unwatch_lobby(self, watcher: Connection):
+        self.watchers.pop(watcher, None)
+        watcher.stop()
+
+    async def serve_lobby(self, websocket: WebSocket, query: LobbyQuery):
+        """
+        Pushes lobby pages to an accepted websocket until it disconnects.
+
+        The client switches page or filters by sending a query as JSON, e.g.
+        {"offset": 50} or {"min_free_seats": 1, "num_players": 4}.
+
+        Args:
+            websocket (WebSocket): The accepted lobby websocket.
+            query (LobbyQuery): The page to show first.
+        """
+        watcher = self.watch_lobby(websocket, query)
+        try:
+            while True:
+                text = await websocket.receive_text()
+                try:
+                    self.set_lobby_query(watcher, LobbyQuery.from_dict(json.loads(text)))
+                except (ValueError, TypeError):
+                    continue
+        except WebSocketDisconnect:
+            print('Client disconnected')
+        except Exception as e:
+            print(f"An error occurred: {e}")
+        finally:
+            self.unwatch_lobby(watcher)
+
+    def follow_lobby(self, websocket: WebSocket) -> Connection:
+        """
+        Starts sending a websocket every lobby change, beginning with the whole lobby.
+
+        Each message is {"changes": [[session_id, entry], ...]}, with a None
+        entry for a session that left the lobby; the first one also has
+        "snapshot": true and lists every entry.
+
+        Args:
+            websocket (WebSocket): The accepted websocket of a router.
+
+        Returns:
+            Connection: The feed, for unfollow_lobby.
+        """
+        feed = Connection(websocket, 'feed', 'feed', max_queue=1024)
+        feed.send(encode({'snapshot': True, 'changes': list(self.lobby.items())}))
+        self.feeds.append(feed)
+        return feed
+
+    def unfollow_lobby(self, feed: Connection):
+        if feed in self.feeds:
+            self.feeds.remove(feed)
+        feed.stop()
+
+    def load(self) -> tuple:
+        """
+        The server's size, for the admission policy.
+
+        Returns:
+            tuple: The number of live sessions and of in-process bot seats in them.
+        """
+        sessions = list(self.ids.values())
+        return len(sessions), sum(client.protocol == 'object' for session in sessions
+                                  for client in session.clients)
 
     def is_done(self, id: int) -> bool:
         """
@@ -251,10 +1343,10 @@ class SessionsManager:
             id (int): The ID of the session to check.
 
         Returns:
-            bool: True if the session is done, False otherwise.
+            bool: True if the session is done or was already deleted, False otherwise.
         """
-        session = self.ids[id]
-        return len(session.clients) <= 1
+        session = self.ids.get(id, None)
+        return session is None or len(session.clients) + len(session.held) <= 1
 
     def is_session_full(self, id: int) -> bool:
         """
@@ -273,10 +1365,152 @@ class SessionsManager:
     
     def delete_session(self, id: int):
         
-        del self.ids[id]
+        session = self.ids.pop(id, None)
+        if session is None:  # a recovered session's host handler and reap_when_over both delete it
+            return
+        session.stop_actor()
+        if session.journal is not None and not session.finished.is_set():
+            session.journal.append(END, id)
+        self.session_changed(session)
         print("Deleted session:", id)
         
     def get_session_status(self, id: int) -> str:
         session = self.ids.get(id, None)
         return session.status
+
+    async def recover(self, journal: Journal, seat_bot: Callable) -> int:
+        """
+        Rebuilds the sessions a journal has, then journals every session to it.
+
+        Each session is replayed from the journal's last snapshot. Bot seats
+        get a new in-process bot; players' seats are held for them for
+        REJOIN_GRACE seconds, and they take them back by joining with the
+        same client id.
+
+        Args:
+            journal (Journal): The journal of an earlier run of this process's shard.
+            seat_bot (Callable): Builds a recovered bot seat, called as
+                seat_bot(session, id, name, level=level), e.g. BotSeat.
+
+        Returns:
+            int: The number of sessions recovered.
+        """
+        sessions: Dict[int, Session] = {}
+        pools: Dict[int, ReplayPool] = {}
+        for kind, id, value in journal.replay():
+            try:
+                if kind in (SETTINGS, SNAPSHOT):
+                    settings = value['settings'] if kind == SNAPSHOT else value
+                    session = sessions[id] = Session(id=id, **settings, clients=[])
+                    pool = pools[id] = ReplayPool()
+                    if kind == SNAPSHOT:
+                        session.restore(value, pool)
+                    continue
+                session = sessions.get(id)
+                if session is None:
+                    continue
+                if kind == JOIN:
+                    session.held[value[0]] = value[1:]
+                elif kind == LEAVE:
+                    session.held.pop(value, None)
+                elif kind == DECK_SEED:
+                    pools[id].seeds.append(value)
+                elif kind == START:
+                    session.replay_start(*value, pools[id])
+                elif kind == MOVE:
+                    session.replay_move(*value)
+                elif kind == REMOVE:
+                    session.state.remove(value)
+                elif kind == END:
+                    del sessions[id]
+            except Exception as e:
+                print("Session", id, "could not be recovered:", repr(e))
+                sessions.pop(id, None)
+        recovered = 0
+        for id, session in sessions.items():
+            if id in self.ids or (session.state is not None and session.state.winner()):
+                continue
+            for client_id, (name, kind) in list(session.held.items()):
+                if kind != 'player':
+                    del session.held[client_id]
+                    session.clients.append(seat_bot(session, client_id, name, level=kind))
+            await self.add_session(session)
+            if session.state is not None:
+                await session.resume()
+            if session.held:
+                self.timers.schedule(REJOIN_GRACE, self.release_seats, id)
+            asyncio.ensure_future(self.reap_when_over(session))
+            recovered += 1
+        journal.sessions = self.journal_snapshots
+        journal.start(asyncio.get_running_loop())
+        SessionsManager.journal = journal
+        for session in self.ids.values():
+            session.journal = journal
+        print("Recovered", recovered, "sessions from", journal.directory)
+        return recovered
+
+    def journal_snapshots(self) -> list:
+        """(id, snapshot) of every session that is not over, for the journal."""
+        return [(id, session.journal_snapshot()) for id, session in list(self.ids.items())
+                if not session.finished.is_set()]
+
+    async def reap_when_over(self, session: Session):
+        """
+        Deletes a recovered session once its game is over.
+
+        A session normally goes when its host's handler sees the game end, but
+        a recovered one has no handler until the host rejoins, if ever.
+        """
+        await session.finished.wait()
+        if self.ids.get(session.id) is session:
+            self.delete_session(session.id)
+
+    def release_seats(self, id: int):
+        """
+        Gives up the seats recovered players did not take back in time, and
+        deletes the session if none of its players came back.
+
+        Args:
+            id (int): The ID of the recovered session.
+        """
+        session = self.ids.get(id, None)
+        if session is None or not session.held:
+            return
+        if all(client.websocket is None for client in session.clients):  # only bots are left
+            for client in session.clients:
+                client.stop()
+            self.delete_session(id)
+            return
+        held, session.held = session.held, {}
+        for client_id in held:
+            asyncio.ensure_future(session.remove_client(client_id))
         
+
+
+def _sessions_by_status() -> dict:
+    counts = dict.fromkeys(('waiting', 'starting', 'in-progress', 'game_over'), 0)
+    for session in list(SessionsManager.ids.values()):
+        counts[session.status] = counts.get(session.status, 0) + 1
+    return counts
+
+
+def _clients_by_kind() -> dict:
+    counts = {'websocket': 0, 'bot': 0}
+    for session in list(SessionsManager.ids.values()):
+        for client in session.clients:
+            counts['bot' if client.protocol == 'object' else 'websocket'] += 1
+    return counts
+
+
+metrics.Gauge('whot_sessions', 'Sessions by status', _sessions_by_status, labels=('status',))
+metrics.Gauge('whot_clients', 'Seated clients: websockets, and in-process bot seats', _clients_by_kind,
+              labels=('kind',))
+metrics.Gauge('whot_lobby_watchers', 'Websockets watching the lobby', lambda: len(SessionsManager.watchers))
+metrics.Gauge('whot_deck_pool_size', 'Shuffled decks the deck pool keeps ready', lambda: deck_pool.size)
+metrics.Gauge('whot_deck_pool_available', 'Shuffled decks ready in the deck pool now',
+              lambda: deck_pool.stats()['available'])
+metrics.Gauge('whot_deck_pool_requests', "Decks asked of the deck pool, by result: 'hit', or 'miss' if one "
+              'had to be shuffled on the spot', lambda: {'hit': deck_pool.hits, 'miss': deck_pool.misses},
+              labels=('result',))
+metrics.Gauge('whot_deck_pool_hit_rate', 'Share of deck pool requests served from a ready deck',
+              lambda: deck_pool.stats()['hit_rate'])